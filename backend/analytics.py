@@ -0,0 +1,255 @@
+import os
+import threading
+import multiprocessing
+from datetime import date, datetime
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from flask import request, jsonify
+from auth import require_admin
+from retention import tenant_archive_dir, read_archive, archive_day
+
+# Usage reports over archived and hot data.
+#
+#   GET /tenants/<id>/usage/report?from=2025-01&to=2025-12&groupBy=team,model,month
+#   GET /admin/usage/report?from=...&to=...&groupBy=tenant,month      (admin only)
+#
+# Days compacted by retention.py only exist as .npz archive files. Those are
+# scanned column-at-a-time with numpy in a separate process pool, one task per
+# tenant and month (all day files of the month concatenated, then grouped with
+# np.unique / np.bincount), so the scan never holds the GIL of an API worker.
+# Rows still in token_usage are aggregated by Postgres with the same keys and
+# the two results are merged into one report. Both sides split on the
+# tenant's usage_compacted_before, read once per report: archive files for
+# earlier days, raw rows from that day on. Archived rows awaiting deletion and
+# archives written by an unfinished or later compaction are ignored, so
+# nothing is counted twice.
+
+ANALYTICS_PROCESSES = int(os.getenv("ANALYTICS_PROCESSES", 2))
+ANALYTICS_TIMEOUT = float(os.getenv("ANALYTICS_TIMEOUT", 120))
+
+DIMENSIONS = ('tenant', 'team', 'model', 'month')
+SCAN_COLUMNS = ('team_id', 'model', 'tokens_in', 'tokens_out', 'cost')
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    # One pool per worker process; spawned (not forked) so the children do
+    # not inherit the threads of a gunicorn worker
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor_pid != os.getpid():
+            _executor = ProcessPoolExecutor(max_workers=ANALYTICS_PROCESSES,
+                                            mp_context=multiprocessing.get_context('spawn'))
+            _executor_pid = os.getpid()
+        return _executor
+
+# --- Archive scan (runs in the pool) ---
+
+def scan_month(tenant_id, month, paths, dims):
+    # Returns {key tuple: [tokens_in, tokens_out, cost, events]} for one tenant-month
+    parts = [read_archive(path, SCAN_COLUMNS) for path in paths]
+    columns = {name: np.concatenate([part[name] for part in parts]) for name in SCAN_COLUMNS}
+    n = len(columns['team_id'])
+    if n == 0:
+        return {}
+
+    # Encode every varying dimension as integer codes and combine them into
+    # one group code per row (mixed radix)
+    codes = np.zeros(n, dtype=np.int64)
+    values = []
+    for dim in dims:
+        if dim in ('team', 'model'):
+            uniques, inverse = np.unique(columns['team_id' if dim == 'team' else 'model'], return_inverse=True)
+            codes = codes * len(uniques) + inverse
+            values.append(uniques.tolist())
+        else:
+            values.append([tenant_id if dim == 'tenant' else month])
+    groups, inverse = np.unique(codes, return_inverse=True)
+
+    # bincount weights are float64, exact only up to 2**53: sum tokens in int64
+    sums = []
+    for name in ('tokens_in', 'tokens_out'):
+        total = np.zeros(len(groups), dtype=np.int64)
+        np.add.at(total, inverse, columns[name].astype(np.int64, copy=False))
+        sums.append(total)
+    sums.append(np.bincount(inverse, weights=columns['cost'], minlength=len(groups)))
+    events = np.bincount(inverse, minlength=len(groups))
+
+    result = {}
+    for g, code in enumerate(groups.tolist()):
+        key = []
+        for options in reversed(values):
+            code, index = divmod(code, len(options))
+            key.append(options[index])
+        result[tuple(reversed(key))] = [int(sums[0][g]), int(sums[1][g]), float(sums[2][g]), int(events[g])]
+    return result
+
+def archive_tasks(cutoffs, first_month, last_month):
+    # cutoffs: {tenant_id: usage_compacted_before}
+    for tenant_id, cutoff in sorted(cutoffs.items()):
+        base = tenant_archive_dir(tenant_id)
+        if not os.path.isdir(base):
+            continue
+        for month in sorted(os.listdir(base)):
+            if first_month <= month <= last_month:
+                month_dir = os.path.join(base, month)
+                paths = [os.path.join(month_dir, name) for name in sorted(os.listdir(month_dir)) if name.endswith('.npz')]
+                paths = [path for path in paths if archive_day(path) < cutoff]
+                if paths:
+                    yield tenant_id, month, paths
+
+def scan_archives(cutoffs, first_month, last_month, dims):
+    tasks = list(archive_tasks(cutoffs, first_month, last_month))
+    if not tasks:
+        return {}, 0
+    executor = get_executor()
+    futures = [executor.submit(scan_month, tenant_id, month, paths, dims) for tenant_id, month, paths in tasks]
+    totals = {}
+    for future in futures:
+        merge(totals, future.result(timeout=ANALYTICS_TIMEOUT))
+    return totals, sum(len(paths) for _, _, paths in tasks)
+
+# --- Hot rows ---
+
+def scan_hot(conn, tenant_id, cutoffs, first_month, last_month, dims):
+    # cutoffs: the compaction_cutoffs() the archive scan used, not the live
+    # watermark, which a compaction may advance in between
+    start = datetime.strptime(first_month, '%Y-%m')
+    end = datetime.strptime(last_month, '%Y-%m')
+    end = end.replace(year=end.year + 1, month=1) if end.month == 12 else end.replace(month=end.month + 1)
+
+    expressions = {
+        'tenant': 't.tenant_id',
+        'team': 'u.team_id',
+        'model': "COALESCE(u.model, '')",
+        'month': "to_char(u.timestamp, 'YYYY-MM')",
+    }
+    keys = [expressions[dim] for dim in dims]
+    select = ', '.join(keys + ['COALESCE(SUM(u.tokens_in), 0)', 'COALESCE(SUM(u.tokens_out), 0)', 'COALESCE(SUM(u.cost), 0)', 'COUNT(*)'])
+    where = "u.timestamp >= %s AND u.timestamp < %s AND (c.cutoff IS NULL OR u.timestamp >= c.cutoff)"
+    tenants = sorted(cutoffs)
+    params = [tenants, [cutoffs[t] for t in tenants], start, end]
+    if tenant_id:
+        where += " AND t.tenant_id = %s"
+        params.append(tenant_id)
+    group_by = f"GROUP BY {', '.join(str(i + 1) for i in range(len(keys)))}" if keys else ''
+
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT {select}
+        FROM token_usage u
+        JOIN teams t ON t.id = u.team_id
+        LEFT JOIN unnest(%s::text[], %s::date[]) AS c (tenant_id, cutoff) ON c.tenant_id = t.tenant_id
+        WHERE {where}
+        {group_by}
+    """, tuple(params))
+    totals = {}
+    for row in cur.fetchall():
+        key, (tokens_in, tokens_out, cost, events) = tuple(row[:len(keys)]), row[len(keys):]
+        if events:
+            totals[key] = [int(tokens_in), int(tokens_out), float(cost), int(events)]
+    cur.close()
+    return totals
+
+# --- Report ---
+
+def merge(totals, part):
+    for key, (tokens_in, tokens_out, cost, events) in part.items():
+        entry = totals.setdefault(key, [0, 0, 0.0, 0])
+        entry[0] += tokens_in
+        entry[1] += tokens_out
+        entry[2] += cost
+        entry[3] += events
+    return totals
+
+def parse_report_args(dimensions):
+    today = date.today()
+    default_from = f"{today.year - 1}-{today.month:02d}"
+    first_month = request.args.get('from', default_from)
+    last_month = request.args.get('to', today.strftime('%Y-%m'))
+    dims = [d for d in request.args.get('groupBy', ','.join(dimensions)).split(',') if d]
+    for value in (first_month, last_month):
+        datetime.strptime(value, '%Y-%m')
+    unknown = [d for d in dims if d not in dimensions]
+    if unknown:
+        raise ValueError(f"Unknown groupBy dimension: {unknown[0]}")
+    # Canonical order keeps keys from both sources comparable
+    return first_month, last_month, [d for d in DIMENSIONS if d in dims]
+
+def compaction_cutoffs(conn, tenant_id):
+    # Read once and passed to both halves, so they split on the same day
+    cur = conn.cursor()
+    if tenant_id:
+        cur.execute("SELECT id, usage_compacted_before FROM tenants WHERE id = %s AND usage_compacted_before IS NOT NULL", (tenant_id,))
+    else:
+        cur.execute("SELECT id, usage_compacted_before FROM tenants WHERE usage_compacted_before IS NOT NULL")
+    cutoffs = dict(cur.fetchall())
+    cur.close()
+    return cutoffs
+
+def build_report(conn, tenant_id, first_month, last_month, dims):
+    cutoffs = compaction_cutoffs(conn, tenant_id)
+    archived, files = scan_archives(cutoffs, first_month, last_month, dims)
+    hot = scan_hot(conn, tenant_id, cutoffs, first_month, last_month, dims)
+    totals = merge(merge({}, archived), hot)
+
+    team_names = {}
+    if 'team' in dims and totals:
+        cur = conn.cursor()
+        cur.execute("SELECT id, name FROM teams WHERE id = ANY(%s)", (list({key[dims.index('team')] for key in totals}),))
+        team_names = dict(cur.fetchall())
+        cur.close()
+
+    rows = []
+    for key in sorted(totals):
+        tokens_in, tokens_out, cost, events = totals[key]
+        row = {}
+        for dim, value in zip(dims, key):
+            if dim == 'tenant':
+                row['tenantId'] = value
+            elif dim == 'team':
+                row['teamId'] = value
+                row['teamName'] = team_names.get(value)
+            elif dim == 'model':
+                row['model'] = value or None
+            else:
+                row['month'] = value
+        row.update({'tokensIn': tokens_in, 'tokensOut': tokens_out, 'cost': round(cost, 6), 'events': events})
+        rows.append(row)
+
+    return {
+        'from': first_month,
+        'to': last_month,
+        'groupBy': dims,
+        'rows': rows,
+        'sources': {'archiveFiles': files, 'archivedGroups': len(archived), 'hotGroups': len(hot)},
+    }
+
+def init_analytics(app, connect):
+    def report(tenant_id, dimensions):
+        try:
+            first_month, last_month, dims = parse_report_args(dimensions)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # The all-tenants report reads every tenant's rows (tenancy.py)
+        conn = connect(admin=tenant_id is None)
+        if not conn:
+            return jsonify({'error': 'Database error'}), 500
+        try:
+            return jsonify(build_report(conn, tenant_id, first_month, last_month, dims))
+        except TimeoutError:
+            return jsonify({'error': 'Report timed out'}), 504
+        finally:
+            conn.close()
+
+    @app.route('/tenants/<id>/usage/report', methods=['GET'])
+    def get_tenant_usage_report(id):
+        return report(id, ('team', 'model', 'month'))
+
+    @app.route('/admin/usage/report', methods=['GET'])
+    @require_admin
+    def get_usage_report():
+        return report(None, DIMENSIONS)
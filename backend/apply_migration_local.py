@@ -1,5 +1,6 @@
 
 import os
+import re
 import psycopg2
 from dotenv import load_dotenv
 
@@ -11,6 +12,32 @@ DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_PASSWORD = os.getenv("DB_PASSWORD", None)
 DB_PORT = os.getenv("DB_PORT", "5432")
 
+# CREATE INDEX CONCURRENTLY cannot run inside a transaction: these statements
+# are taken out of the script and run one at a time in autocommit after it
+CONCURRENT_INDEX = re.compile(r"^CREATE INDEX CONCURRENTLY IF NOT EXISTS (\w+)[^;]*;", re.M)
+# A concurrent build that failed leaves an invalid index that IF NOT EXISTS would keep
+INVALID_INDEX = """
+    SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+    WHERE c.relname = %s AND NOT i.indisvalid
+"""
+
+def split_concurrent(sql):
+    # -> (script without them, [(index name, statement)])
+    indexes = [(m.group(1), m.group(0)) for m in CONCURRENT_INDEX.finditer(sql)]
+    return CONCURRENT_INDEX.sub('', sql), indexes
+
+def create_concurrent_indexes(conn, indexes):
+    conn.autocommit = True
+    cur = conn.cursor()
+    for name, statement in indexes:
+        cur.execute(INVALID_INDEX, (name,))
+        if cur.fetchone():
+            print(f"Dropping invalid index {name} left by an earlier attempt")
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        print(statement)
+        cur.execute(statement)
+    cur.close()
+
 def apply_migration():
     try:
         conn = psycopg2.connect(
@@ -23,13 +50,14 @@ def apply_migration():
         cur = conn.cursor()
         
         with open('migration.sql', 'r') as f:
-            sql = f.read()
+            sql, indexes = split_concurrent(f.read())
             
         print("Executing SQL...")
         print(sql)
         
         cur.execute(sql)
         conn.commit()
+        create_concurrent_indexes(conn, indexes)
         
         print("Migration successful!")
         cur.close()
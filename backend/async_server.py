@@ -0,0 +1,438 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+import json
+import asyncpg
+from quart import Quart, request, jsonify
+from quart_cors import cors
+from datetime import datetime
+from serialization import init_json
+from ids import generate_id, generate_key
+from mappers import TENANT, TEAM, FILE, MEMBER, TEAM_USAGE, USER_USAGE
+from retention import USAGE_SOURCES
+from counters import members_added, usage_added
+
+# BENCHMARK ONLY - never deploy this app.
+#
+# asyncio variant of the core server.py routes (tenants, teams, members,
+# usage, files), backed by an asyncpg connection pool so a single process can
+# keep thousands of requests waiting on Postgres without a thread per
+# request. It exists to compare the two concurrency models with
+# bench_async.py. It does not enforce quotas, rate limits or tenant row-level
+# security, and lacks the bulk, overview, search, deletion, jobs and /metrics
+# routes; server.py under gunicorn is the only production server.
+#
+# It refuses to start unless ASYNC_BENCHMARK=1:
+#
+#     ASYNC_BENCHMARK=1 hypercorn async_server:app --bind 127.0.0.1:5002 --workers 2
+
+app = Quart(__name__)
+app = cors(app, allow_origin="*")
+init_json(app)
+
+DB_NAME = os.getenv("DB_NAME", "master_admin_db")
+DB_USER = os.getenv("DB_USER", "mobiledevarkatiss")
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PASSWORD = os.getenv("DB_PASSWORD", None)
+DB_PORT = os.getenv("DB_PORT", "5432")
+# No tenant scoping here: runs as the BYPASSRLS role (tenancy.py)
+DB_ADMIN_ROLE = os.getenv("DB_ADMIN_ROLE", "tenant_admin")
+
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 5))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 50))
+ASYNC_BENCHMARK = os.getenv("ASYNC_BENCHMARK", "0") == "1"
+
+pool = None
+
+# Both tenant id placeholders of USAGE_SOURCES bind the route's $1
+USAGE_SOURCES_ASYNC = USAGE_SOURCES.replace('%s', '$1')
+
+# --- Helpers ---
+async def init_connection(conn):
+    # Decode JSONB into Python objects like psycopg2 does
+    for type_name in ('json', 'jsonb'):
+        await conn.set_type_codec(type_name, encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+@app.before_serving
+async def create_pool():
+    global pool
+    if not ASYNC_BENCHMARK:
+        raise RuntimeError("async_server.py is a benchmark variant without quota, rate-limit or tenant isolation "
+                           "enforcement; set ASYNC_BENCHMARK=1 to run it, deploy server.py otherwise")
+    pool = await asyncpg.create_pool(
+        database=DB_NAME,
+        user=DB_USER,
+        host=DB_HOST,
+        password=DB_PASSWORD,
+        port=int(DB_PORT),
+        min_size=DB_POOL_MIN,
+        max_size=DB_POOL_MAX,
+        server_settings={'role': DB_ADMIN_ROLE},
+        init=init_connection
+    )
+
+@app.after_serving
+async def close_pool():
+    if pool:
+        await pool.close()
+
+# --- Routes ---
+
+@app.route('/', methods=['GET'])
+async def health_check_root():
+    return jsonify({'status': 'ok', 'service': 'tenant-portal-backend'})
+
+@app.route('/health', methods=['GET'])
+async def health_check():
+    try:
+        async with pool.acquire() as conn:
+            await conn.fetchval("SELECT 1")
+        return jsonify({'status': 'ok', 'db': 'connected'})
+    except Exception as e:
+        print(f"Error connecting to database: {e}")
+        return jsonify({'status': 'error', 'db': 'disconnected'}), 500
+
+@app.route('/login/admin', methods=['POST'])
+async def login_admin():
+    body = await request.get_json()
+    if body.get('username') == 'admin' and body.get('password') == 'admin123':
+        return jsonify({'success': True, 'token': 'mock_admin_token', 'user': {'id': 'admin', 'name': 'Master Admin'}})
+    return jsonify({'error': 'Invalid credentials'}), 401
+
+@app.route('/login/tenant', methods=['POST'])
+async def login_tenant():
+    body = await request.get_json()
+    tenant_id = body.get('tenantId')
+
+    async with pool.acquire() as conn:
+        tenant = await conn.fetchrow("SELECT id, name, status FROM tenants WHERE id = $1 AND deleted_at IS NULL", tenant_id)
+
+    if not tenant:
+        return jsonify({'error': 'Invalid tenant ID'}), 401
+
+    if tenant['status'] == 'disabled':
+        return jsonify({'error': 'Account is disabled'}), 403
+
+    return jsonify({'success': True, 'token': f"mock_tenant_{tenant['id']}", 'user': {'id': tenant['id'], 'name': tenant['name']}})
+
+@app.route('/login/sso', methods=['POST'])
+@app.route('/auth/login', methods=['POST'])
+async def login_sso():
+    body = await request.get_json()
+    entity_id = body.get('tenantId') # Reuse tenantId field for both
+
+    async with pool.acquire() as conn:
+        # Check if it is a Tenant
+        tenant = await conn.fetchrow(f"SELECT {TENANT.columns} FROM tenants WHERE id = $1 AND deleted_at IS NULL", entity_id)
+        found_team = None
+        if not tenant:
+            # Check if it is a Team
+            found_team = await conn.fetchrow(f"""
+                SELECT {TEAM.columns} FROM teams
+                WHERE id = $1 AND tenant_id IN (SELECT id FROM tenants WHERE deleted_at IS NULL)
+            """, entity_id)
+
+    if tenant:
+        tenant = TENANT.map_row(tenant)
+        if tenant['status'] == 'disabled':
+            return jsonify({'error': 'Account is disabled'}), 403
+        return jsonify({
+            'success': True,
+            'type': 'tenant',
+            'token': f"mock_tenant_{tenant['id']}",
+            'user': {'id': tenant['id'], 'name': tenant['name']},
+            'config': {
+                'apiProvider': tenant.get('provider', 'gemini'),
+                'apiKey': tenant.get('llm_api_key'),
+                'apiModelId': tenant.get('model', 'gemini-2.0-flash-001')
+            },
+            'styles': tenant.get('settings', {})
+        })
+
+    if found_team:
+        found_team = TEAM.map_row(found_team)
+        # Validate Team Key
+        if found_team['teamKey'] != body.get('apiKey'):
+            return jsonify({'error': 'Invalid Team Key'}), 401
+
+        return jsonify({
+            'success': True,
+            'type': 'team',
+            'token': f"mock_team_{found_team['id']}",
+            'user': {'id': found_team['id'], 'name': found_team['name']},
+            'config': {
+                'apiProvider': found_team['provider'],
+                'apiKey': found_team['apiKey'], # This is the LLM Provider API Key
+                'apiModelId': found_team.get('model')
+            },
+            'styles': found_team.get('styles', {})
+        })
+
+    return jsonify({'error': 'Invalid ID'}), 401
+
+@app.route('/tenants', methods=['GET'])
+async def get_tenants():
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(f"SELECT {TENANT.columns} FROM tenants WHERE deleted_at IS NULL")
+
+    return jsonify(TENANT.map_rows(rows))
+
+@app.route('/tenants', methods=['POST'])
+async def create_tenant():
+    body = await request.get_json()
+    name = body.get('name')
+    if not name:
+        return jsonify({'error': 'Name required'}), 400
+
+    async with pool.acquire() as conn:
+        new_tenant = await conn.fetchrow(f"""
+            INSERT INTO tenants (id, name, status, created_at, api_key, provider, model, llm_api_key, settings)
+            VALUES ($1, $2, 'active', $3, $4, $5, $6, $7, '{{}}')
+            RETURNING {TENANT.columns}
+        """, generate_id('tnt'), name, datetime.now(), generate_key('ak'),
+            body.get('provider', 'gemini'),
+            body.get('model', 'gemini-2.0-flash-001'),
+            body.get('apiKey'))
+
+    return jsonify(TENANT.map_row(new_tenant))
+
+@app.route('/tenants/<id>', methods=['PATCH'])
+async def update_tenant(id):
+    body = await request.get_json()
+
+    fields = []
+    values = []
+    columns = [('name', 'name'), ('status', 'status'), ('provider', 'provider'),
+               ('model', 'model'), ('apiKey', 'llm_api_key'), ('settings', 'settings')]
+    for key, column in columns:
+        if key in body:
+            values.append(body[key])
+            fields.append(f"{column} = ${len(values)}")
+
+    if not fields:
+        return jsonify({'error': 'No fields to update'}), 400
+
+    values.append(id)
+    async with pool.acquire() as conn:
+        tenant = await conn.fetchrow(
+            f"UPDATE tenants SET {', '.join(fields)} WHERE id = ${len(values)} RETURNING {TENANT.columns}", *values)
+
+    if not tenant:
+        return jsonify({'error': 'Not found'}), 404
+
+    return jsonify(TENANT.map_row(tenant))
+
+@app.route('/tenants/<id>/status', methods=['PATCH'])
+async def update_tenant_status(id):
+    status = (await request.get_json()).get('status')
+    if status not in ['active', 'disabled']:
+        return jsonify({'error': 'Invalid status'}), 400
+
+    async with pool.acquire() as conn:
+        tenant = await conn.fetchrow(f"UPDATE tenants SET status = $1 WHERE id = $2 RETURNING {TENANT.columns}", status, id)
+
+    if not tenant:
+        return jsonify({'error': 'Not found'}), 404
+
+    return jsonify(TENANT.map_row(tenant))
+
+@app.route('/tenants/<id>', methods=['GET'])
+async def get_tenant(id):
+    async with pool.acquire() as conn:
+        tenant = await conn.fetchrow(f"SELECT {TENANT.columns} FROM tenants WHERE id = $1 AND deleted_at IS NULL", id)
+
+    if not tenant:
+        return jsonify({'error': 'Not found'}), 404
+
+    return jsonify(TENANT.map_row(tenant))
+
+@app.route('/tenants/<id>/files', methods=['GET'])
+async def get_files(id):
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(f"SELECT {FILE.columns} FROM files WHERE tenant_id = $1 ORDER BY uploaded_at DESC", id)
+
+    return jsonify(FILE.map_rows(rows))
+
+@app.route('/tenants/<id>/branding', methods=['PATCH'])
+async def update_tenant_branding(id):
+    body = await request.get_json()
+    color = body.get('brandColor')
+    font = body.get('font')
+
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            # First get current settings
+            result = await conn.fetchrow("SELECT settings FROM tenants WHERE id = $1 FOR UPDATE", id)
+            if not result:
+                return jsonify({'error': 'Not found'}), 404
+
+            settings = result['settings'] or {}
+            if color:
+                settings['brandColor'] = color
+            if font:
+                settings['font'] = font
+
+            tenant = await conn.fetchrow(f"UPDATE tenants SET settings = $1 WHERE id = $2 RETURNING {TENANT.columns}", settings, id)
+
+    return jsonify(TENANT.map_row(tenant))
+
+@app.route('/tenants/<id>/teams', methods=['GET'])
+async def get_teams(id):
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(f"SELECT {TEAM.columns} FROM teams WHERE tenant_id = $1", id)
+
+    return jsonify(TEAM.map_rows(rows))
+
+@app.route('/tenants/<id>/teams', methods=['POST'])
+async def create_team(id):
+    body = await request.get_json()
+    if not body.get('name') or not body.get('provider'):
+        return jsonify({'error': 'Name and Provider required'}), 400
+
+    async with pool.acquire() as conn:
+        # Ensure tenant exists
+        if not await conn.fetchval("SELECT 1 FROM tenants WHERE id = $1 AND deleted_at IS NULL", id):
+            return jsonify({'error': 'Tenant Not Found'}), 404
+
+        new_team = await conn.fetchrow(f"""
+            INSERT INTO teams (id, tenant_id, name, provider, api_key, team_key, model, created_at, styles)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, '{{}}')
+            RETURNING {TEAM.columns}
+        """, generate_id('team'), id, body['name'], body['provider'], body.get('apiKey'),
+            generate_key('tkey'), body.get('model', 'default'), datetime.now())
+
+    return jsonify(TEAM.map_row(new_team))
+
+@app.route('/tenants/<id>/teams/<team_id>', methods=['PATCH'])
+async def update_team(id, team_id):
+    body = await request.get_json()
+
+    fields = []
+    values = []
+    columns = [('name', 'name'), ('provider', 'provider'), ('apiKey', 'api_key'),
+               ('model', 'model'), ('styles', 'styles')]
+    for key, column in columns:
+        if key in body:
+            values.append(body[key])
+            fields.append(f"{column} = ${len(values)}")
+
+    async with pool.acquire() as conn:
+        if not fields:
+            team = await conn.fetchrow(f"SELECT {TEAM.columns} FROM teams WHERE id = $1 AND tenant_id = $2", team_id, id)
+        else:
+            values.extend([team_id, id])
+            team = await conn.fetchrow(
+                f"UPDATE teams SET {', '.join(fields)} WHERE id = ${len(values) - 1} AND tenant_id = ${len(values)} RETURNING {TEAM.columns}",
+                *values)
+
+    if not team:
+        return jsonify({'error': 'Team not found'}), 404
+
+    return jsonify(TEAM.map_row(team))
+
+# --- Team Members ---
+
+@app.route('/tenants/<id>/teams/<team_id>/members', methods=['POST'])
+async def add_team_member(id, team_id):
+    email = (await request.get_json()).get('email')
+    if not email:
+        return jsonify({'error': 'Email required'}), 400
+
+    async with pool.acquire() as conn:
+        # Nothing is inserted when the team belongs to another tenant
+        new_member = await conn.fetchrow(members_added(f"""
+            INSERT INTO team_members (id, team_id, email, created_at)
+            SELECT $1, t.id, $3, $4 FROM teams t WHERE t.id = $2 AND t.tenant_id = $5
+            ON CONFLICT (team_id, email) DO NOTHING
+            RETURNING {MEMBER.columns}
+        """), generate_id('mem'), team_id, email, datetime.now(), id)
+        team_exists = new_member or await conn.fetchval(
+            "SELECT 1 FROM teams WHERE id = $1 AND tenant_id = $2", team_id, id)
+
+    if not team_exists:
+        return jsonify({'error': 'Team not found'}), 404
+    if not new_member:
+        return jsonify({'error': 'Member already exists'}), 409
+
+    return jsonify(MEMBER.map_row(new_member))
+
+@app.route('/tenants/<id>/teams/<team_id>/members', methods=['GET'])
+async def get_team_members(id, team_id):
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(f"""
+            SELECT {MEMBER.columns} FROM team_members
+            WHERE team_id = $1 AND team_id IN (SELECT id FROM teams WHERE tenant_id = $2)
+            ORDER BY created_at DESC
+        """, team_id, id)
+
+    return jsonify(MEMBER.map_rows(rows))
+
+# --- Token Usage ---
+
+@app.route('/api/usage', methods=['POST'])
+async def record_usage():
+    body = await request.get_json()
+    team_id = body.get('teamId')
+
+    if not team_id:
+        return jsonify({'error': 'Team ID required'}), 400
+
+    async with pool.acquire() as conn:
+        # Nothing is inserted for unknown teams or teams of a deleted tenant
+        recorded = await conn.fetchrow(usage_added("""
+            INSERT INTO token_usage (id, team_id, email, tokens_in, tokens_out, cost, model, timestamp)
+            SELECT $1, t.id, $3, $4, $5, $6, $7, $8
+            FROM teams t JOIN tenants n ON n.id = t.tenant_id
+            WHERE t.id = $2 AND n.deleted_at IS NULL
+            RETURNING team_id, tokens_in, tokens_out, cost, timestamp
+        """), generate_id('usage'), team_id, body.get('email'), body.get('tokensIn') or 0,
+            body.get('tokensOut') or 0, float(body.get('cost') or 0), body.get('model'), datetime.now())
+
+    if not recorded:
+        return jsonify({'error': 'Team not found'}), 404
+
+    return jsonify({'success': True})
+
+@app.route('/tenants/<id>/usage', methods=['GET'])
+async def get_tenant_usage(id):
+    async with pool.acquire() as conn:
+        # Get usage aggregated by team
+        team_usage = await conn.fetch(f"""
+            SELECT {TEAM_USAGE.columns}
+            FROM teams t
+            LEFT JOIN ({USAGE_SOURCES_ASYNC}) u ON t.id = u.team_id
+            WHERE t.tenant_id = $1
+            GROUP BY t.id, t.name
+        """, id)
+
+        # Get top users by cost
+        user_usage = await conn.fetch(f"""
+            SELECT {USER_USAGE.columns}
+            FROM ({USAGE_SOURCES_ASYNC}) u
+            JOIN teams t ON u.team_id = t.id
+            WHERE u.email IS NOT NULL
+            GROUP BY u.email, t.name
+            ORDER BY total_cost DESC
+            LIMIT 10
+        """, id)
+
+    return jsonify({
+        'teamUsage': TEAM_USAGE.map_rows(team_usage),
+        'userUsage': USER_USAGE.map_rows(user_usage)
+    })
+
+@app.route('/tenants/<id>/files/<file_id>', methods=['DELETE'])
+async def delete_file(id, file_id):
+    async with pool.acquire() as conn:
+        deleted = await conn.fetchval("DELETE FROM files WHERE id = $1 AND tenant_id = $2 RETURNING id", file_id, id)
+
+    if not deleted:
+        return jsonify({'error': 'File not found'}), 404
+
+    return jsonify({'success': True})
+
+if __name__ == '__main__':
+    # Local development only, see the module comment for production serving
+    port = int(os.environ.get('PORT', 5002))
+    app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,17 @@
+from functools import wraps
+from flask import request, jsonify
+
+# Token issued by /login/admin. Admin-only endpoints (diagnostics, jobs) check
+# it with @require_admin.
+ADMIN_TOKEN = 'mock_admin_token'
+
+def is_admin():
+    return request.headers.get('Authorization', '') == f"Bearer {ADMIN_TOKEN}"
+
+def require_admin(f):
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if not is_admin():
+            return jsonify({'error': 'Admin access required'}), 403
+        return f(*args, **kwargs)
+    return wrapper
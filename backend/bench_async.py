@@ -0,0 +1,131 @@
+import argparse
+import asyncio
+import json
+import time
+
+# Side-by-side benchmark of the sync app (server.py under gunicorn) and the
+# asyncio app (async_server.py under hypercorn, started with ASYNC_BENCHMARK=1).
+# Start both against the same database, then:
+#
+#     python bench_async.py --sync http://127.0.0.1:5001 --async http://127.0.0.1:5002 \
+#         --team-id team_xxx --tenant-id tnt_xxx --concurrency 50,200,1000
+#
+# Each client is one keep-alive connection issuing requests back to back, so
+# --concurrency is the number of requests in flight at any moment.
+
+def parse_base_url(url):
+    url = url.split('://', 1)[-1].rstrip('/')
+    host, _, port = url.partition(':')
+    return host, int(port or 80)
+
+def build_request(host, method, path, body=None):
+    payload = json.dumps(body).encode() if body is not None else b''
+    head = f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n"
+    if body is not None:
+        head += f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+    return (head + "\r\n").encode() + payload
+
+async def read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("connection closed")
+    status = int(status_line.split()[1])
+    length = 0
+    chunked = False
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        if name == 'content-length':
+            length = int(value.strip())
+        elif name == 'transfer-encoding' and 'chunked' in value.lower():
+            chunked = True
+    if chunked:
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(length)
+    return status
+
+async def client(host, port, raw, deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            writer.write(raw)
+            await writer.drain()
+            status = await read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors[0] += 1
+    except (ConnectionError, asyncio.IncompleteReadError):
+        errors[0] += 1
+    finally:
+        writer.close()
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+async def run_scenario(base_url, method, path, body, concurrency, duration):
+    host, port = parse_base_url(base_url)
+    raw = build_request(host, method, path, body)
+    latencies = []
+    errors = [0]
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*[client(host, port, raw, deadline, latencies, errors) for _ in range(concurrency)],
+                         return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+def scenarios(args):
+    return [
+        ('record_usage', 'POST', '/api/usage',
+         {'teamId': args.team_id, 'email': 'bench@example.com', 'tokensIn': 120, 'tokensOut': 480,
+          'cost': 0.0012, 'model': 'bench-model'}),
+        ('get_tenant_usage', 'GET', f'/tenants/{args.tenant_id}/usage', None),
+        ('get_teams', 'GET', f'/tenants/{args.tenant_id}/teams', None),
+    ]
+
+async def main(args):
+    results = []
+    for name, method, path, body in scenarios(args):
+        for concurrency in [int(c) for c in args.concurrency.split(',')]:
+            for label, base_url in (('sync', args.sync_url), ('async', args.async_url)):
+                result = await run_scenario(base_url, method, path, body, concurrency, args.duration)
+                result.update({'app': label, 'route': name, 'concurrency': concurrency})
+                results.append(result)
+                print(f"{name:18} {label:5} c={concurrency:<5} rps={result['rps']:<9} "
+                      f"p50={result['p50_ms']}ms p95={result['p95_ms']}ms p99={result['p99_ms']}ms "
+                      f"errors={result['errors']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the sync and asyncio backends under load')
+    parser.add_argument('--sync', dest='sync_url', default='http://127.0.0.1:5001')
+    parser.add_argument('--async', dest='async_url', default='http://127.0.0.1:5002')
+    parser.add_argument('--team-id', required=True)
+    parser.add_argument('--tenant-id', required=True)
+    parser.add_argument('--concurrency', default='10,100,1000')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per scenario')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,333 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+import http.client
+from datetime import date, datetime, timedelta
+from urllib.parse import urlparse
+import psycopg2
+from psycopg2.extras import execute_values
+from ids import make_id
+from counters import REFRESH_TEAM_COUNTERS
+
+# Benchmark suite for the backend API.
+#
+#   python benchmark.py seed --tenants 50 --teams 10 --members 20 --files 30 --usage 1000000
+#   python benchmark.py run --url http://127.0.0.1:5001 --concurrency 32 --duration 20
+#   python benchmark.py compare bench_results/a.json bench_results/b.json
+#
+# "seed" fills the database named by the usual DB_* variables with benchmark
+# tenants (ids prefixed tnt_bench_), replacing any left by an earlier seed.
+# Ids, keys and values all come from the --seed RNG and timestamps are
+# relative to the start of today, so the same seed inserts the same rows on
+# a given day. "run" drives each scenario below at a
+# fixed concurrency over keep-alive connections and reports throughput and
+# p50/p95/p99 latency. DB time per request comes from the server's /metrics
+# endpoint (scraped before and after each scenario). Results are written to
+# bench_results/<timestamp>-<commit>.json so runs can be compared across
+# commits.
+
+DB_NAME = os.getenv("DB_NAME", "master_admin_db")
+DB_USER = os.getenv("DB_USER", "mobiledevarkatiss")
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PASSWORD = os.getenv("DB_PASSWORD", None)
+DB_PORT = os.getenv("DB_PORT", "5432")
+# Seeds every tenant: runs as the BYPASSRLS role (tenancy.py)
+DB_ADMIN_ROLE = os.getenv("DB_ADMIN_ROLE", "tenant_admin")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BASE_DIR, 'bench_results')
+MODELS = ['gemini-2.0-flash-001', 'gpt-4o-mini', 'claude-3-5-haiku']
+
+def get_db_connection():
+    return psycopg2.connect(
+        database=DB_NAME,
+        user=DB_USER,
+        host=DB_HOST,
+        password=DB_PASSWORD,
+        port=DB_PORT,
+        options=f"-c role={DB_ADMIN_ROLE}"
+    )
+
+# --- Seeding ---
+
+def seeded_ids(rng, prefix, count, timestamp):
+    # Like ids.generate_ids, with the random part drawn from the seeded RNG
+    base = rng.getrandbits(79)
+    return [make_id(prefix, int(timestamp.timestamp() * 1000), base + i) for i in range(count)]
+
+def seeded_key(rng, prefix):
+    return make_id(prefix, rng.getrandbits(48), rng.getrandbits(80))
+
+def seed(args):
+    rng = random.Random(args.seed)
+    now = datetime.combine(date.today(), datetime.min.time())
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    # Teams, members, files and usage go with their tenants (ON DELETE CASCADE)
+    cur.execute("DELETE FROM tenants WHERE id LIKE 'tnt\\_bench\\_%'")
+    if cur.rowcount:
+        print(f"Removed {cur.rowcount} benchmark tenants from an earlier seed.")
+
+    tenant_ids = seeded_ids(rng, 'tnt_bench', args.tenants, now)
+    execute_values(cur, """
+        INSERT INTO tenants (id, name, status, created_at, api_key, provider, model, settings)
+        VALUES %s
+    """, [(tid, f"Bench Tenant {n}", 'active', now, seeded_key(rng, 'ak'), 'gemini', MODELS[0], '{}')
+          for n, tid in enumerate(tenant_ids)], page_size=1000)
+
+    teams = []
+    for tid in tenant_ids:
+        for n, team_id in enumerate(seeded_ids(rng, 'team', args.teams, now)):
+            teams.append((team_id, tid, f"Team {n}", 'gemini', None, seeded_key(rng, 'tkey'), MODELS[0], now, '{}'))
+    execute_values(cur, """
+        INSERT INTO teams (id, tenant_id, name, provider, api_key, team_key, model, created_at, styles)
+        VALUES %s
+    """, teams, page_size=1000)
+    team_ids = [t[0] for t in teams]
+
+    members = []
+    for team_id in team_ids:
+        for n, member_id in enumerate(seeded_ids(rng, 'mem', args.members, now)):
+            members.append((member_id, team_id, f"user{n}@{team_id}.example.com", now))
+    execute_values(cur, "INSERT INTO team_members (id, team_id, email, created_at) VALUES %s", members, page_size=5000)
+
+    files = []
+    for tid in tenant_ids:
+        for n, file_id in enumerate(seeded_ids(rng, 'file', args.files, now)):
+            files.append((file_id, tid, f"document-{n}.txt", rng.randint(100, 500000), 'x' * 200,
+                          now - timedelta(minutes=rng.randint(0, 60 * 24 * 90)), '#'))
+    execute_values(cur, """
+        INSERT INTO files (id, tenant_id, name, size, content, uploaded_at, url) VALUES %s
+    """, files, page_size=1000)
+
+    batch = 10000
+    for offset in range(0, args.usage, batch):
+        count = min(batch, args.usage - offset)
+        rows = []
+        for usage_id in seeded_ids(rng, 'usage', count, now):
+            team_id = rng.choice(team_ids)
+            tokens_in = rng.randint(10, 4000)
+            tokens_out = rng.randint(10, 2000)
+            rows.append((usage_id, team_id, f"user{rng.randrange(max(args.members, 1))}@{team_id}.example.com",
+                         tokens_in, tokens_out, (tokens_in + tokens_out) * 0.000002, rng.choice(MODELS),
+                         now - timedelta(seconds=rng.randint(0, 86400 * 90))))
+        execute_values(cur, """
+            INSERT INTO token_usage (id, team_id, email, tokens_in, tokens_out, cost, model, timestamp) VALUES %s
+        """, rows, page_size=batch)
+        conn.commit()
+
+    # Bulk seeding bypasses the counter-maintaining statements
+    cur.execute(REFRESH_TEAM_COUNTERS, {'team_ids': team_ids})
+    conn.commit()
+    cur.execute("ANALYZE")
+    cur.close()
+    conn.close()
+    print(f"Seeded {len(tenant_ids)} tenants, {len(team_ids)} teams, {len(members)} members, "
+          f"{len(files)} files, {args.usage} usage rows.")
+
+# --- Load generation ---
+
+def pick_targets():
+    # Benchmark against the tenant with the most usage so aggregation routes do real work
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT t.tenant_id, t.id, t.team_key
+        FROM teams t
+        JOIN tenants n ON n.id = t.tenant_id
+        WHERE n.status = 'active'
+        ORDER BY (SELECT COUNT(*) FROM token_usage u WHERE u.team_id = t.id) DESC
+        LIMIT 1
+    """)
+    row = cur.fetchone()
+    cur.close()
+    conn.close()
+    if not row:
+        raise SystemExit("No teams found, run 'benchmark.py seed' first")
+    return {'tenant_id': row[0], 'team_id': row[1], 'team_key': row[2]}
+
+def scenarios(targets):
+    # name -> (method, path, body, Flask route rule used to look up DB time)
+    tenant_id, team_id = targets['tenant_id'], targets['team_id']
+    return {
+        'login': ('POST', '/auth/login', {'tenantId': team_id, 'apiKey': targets['team_key']}, '/auth/login'),
+        'tenant_list': ('GET', '/tenants', None, '/tenants'),
+        'usage_ingestion': ('POST', '/api/usage', {
+            'teamId': team_id, 'email': 'bench@example.com', 'tokensIn': 800, 'tokensOut': 200,
+            'cost': 0.002, 'model': MODELS[0]}, '/api/usage'),
+        'usage_aggregation': ('GET', f'/tenants/{tenant_id}/usage', None, '/tenants/<id>/usage'),
+        'file_listing': ('GET', f'/tenants/{tenant_id}/files', None, '/tenants/<id>/files'),
+    }
+
+def scrape_db_time(url):
+    # Returns {route: (db query seconds, request count)} from the server's /metrics
+    parsed = urlparse(url)
+    conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=10)
+    try:
+        conn.request('GET', '/metrics')
+        text = conn.getresponse().read().decode()
+    except OSError:
+        return {}
+    finally:
+        conn.close()
+    totals = {}
+    for line in text.splitlines():
+        for suffix, slot in (('db_query_duration_seconds_sum', 0), ('db_query_duration_seconds_count', 1)):
+            if line.startswith(suffix + '{'):
+                route = line.split('route="', 1)[1].split('"', 1)[0]
+                value = float(line.rsplit(' ', 1)[1])
+                totals.setdefault(route, [0.0, 0.0])[slot] = value
+    return totals
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def drive(url, method, path, body, concurrency, duration):
+    parsed = urlparse(url)
+    payload = json.dumps(body) if body is not None else None
+    headers = {'Content-Type': 'application/json'} if body is not None else {}
+    deadline = time.perf_counter() + duration
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker():
+        local = []
+        local_errors = 0
+        conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=30)
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    local_errors += 1
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=30)
+                continue
+            local.append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def run(args):
+    targets = pick_targets()
+    selected = args.scenarios.split(',') if args.scenarios else None
+    results = {}
+
+    for name, (method, path, body, rule) in scenarios(targets).items():
+        if selected and name not in selected:
+            continue
+        # Warm up connections and caches before measuring
+        drive(args.url, method, path, body, args.concurrency, min(2.0, args.duration))
+        before = scrape_db_time(args.url)
+        result = drive(args.url, method, path, body, args.concurrency, args.duration)
+        after = scrape_db_time(args.url)
+
+        db_seconds, db_count = (a - b for a, b in zip(after.get(rule, [0.0, 0.0]), before.get(rule, [0.0, 0.0])))
+        result['db_ms_per_request'] = round(db_seconds / db_count * 1000, 3) if db_count else None
+
+        results[name] = result
+        print(f"{name:18} rps={result['throughput_rps']:<9} p50={result['p50_ms']}ms "
+              f"p95={result['p95_ms']}ms p99={result['p99_ms']}ms db={result['db_ms_per_request']}ms "
+              f"errors={result['errors']}")
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'timestamp': datetime.now().isoformat(),
+        'url': args.url,
+        'concurrency': args.concurrency,
+        'duration': args.duration,
+        'targets': {k: v for k, v in targets.items() if k != 'team_key'},
+        'results': results,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{commit}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {path}")
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(f"{'scenario':18} {'metric':16} {baseline['commit']:>12} {candidate['commit']:>12} {'change':>9}")
+    for name, result in candidate['results'].items():
+        base = baseline['results'].get(name)
+        if not base:
+            continue
+        for metric in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'db_ms_per_request'):
+            old, new = base.get(metric), result.get(metric)
+            change = f"{(new - old) / old * 100:+.1f}%" if old and new is not None else '-'
+            print(f"{name:18} {metric:16} {str(old):>12} {str(new):>12} {change:>9}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backend API benchmark suite')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('seed', help='Insert benchmark data')
+    p.add_argument('--tenants', type=int, default=20)
+    p.add_argument('--teams', type=int, default=10, help='Teams per tenant')
+    p.add_argument('--members', type=int, default=20, help='Members per team')
+    p.add_argument('--files', type=int, default=20, help='Files per tenant')
+    p.add_argument('--usage', type=int, default=200000, help='Total token_usage rows')
+    p.add_argument('--seed', type=int, default=42)
+    p.set_defaults(func=seed)
+
+    p = sub.add_parser('run', help='Drive the API and record results')
+    p.add_argument('--url', default='http://127.0.0.1:5001')
+    p.add_argument('--concurrency', type=int, default=16)
+    p.add_argument('--duration', type=float, default=15.0, help='Seconds per scenario')
+    p.add_argument('--scenarios', help='Comma separated subset of scenarios')
+    p.add_argument('--output', help='Result file (default bench_results/<timestamp>-<commit>.json)')
+    p.set_defaults(func=run)
+
+    p = sub.add_parser('compare', help='Compare two result files')
+    p.add_argument('baseline')
+    p.add_argument('candidate')
+    p.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
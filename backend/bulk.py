@@ -0,0 +1,74 @@
+import io
+import os
+import re
+import csv
+
+# Request parsing for the bulk endpoints. Each bulk route validates its whole
+# payload up front and then writes everything in a single statement.
+
+BULK_MEMBER_LIMIT = int(os.getenv("BULK_MEMBER_LIMIT", 10000))
+BULK_PROVISION_LIMIT = int(os.getenv("BULK_PROVISION_LIMIT", 1000))
+
+EMAIL_RE = re.compile(r"^[^@\s,;<>]+@[^@\s,;<>]+\.[^@\s,;<>]+$")
+# team_members.email is VARCHAR(255)
+EMAIL_MAX_LENGTH = 255
+
+def read_csv_emails(text):
+    # Accepts a header row with an "email" column, or one email per row in
+    # the first column
+    rows = [row for row in csv.reader(io.StringIO(text)) if row and any(cell.strip() for cell in row)]
+    if not rows:
+        return []
+    header = [cell.strip().lower() for cell in rows[0]]
+    if 'email' in header:
+        column = header.index('email')
+        return [row[column] if column < len(row) else '' for row in rows[1:]]
+    return [row[0] for row in rows]
+
+def emails_from_request(request):
+    # JSON {"emails": [...]} or [...], an uploaded CSV file (form field "file"),
+    # or a text/csv body. Returns None when no list of emails can be found.
+    if 'file' in request.files:
+        return read_csv_emails(request.files['file'].read().decode('utf-8-sig', errors='replace'))
+    if request.mimetype == 'text/csv':
+        return read_csv_emails(request.get_data(as_text=True))
+    body = request.get_json(silent=True)
+    if isinstance(body, dict):
+        body = body.get('emails')
+    if isinstance(body, list):
+        return body
+    return None
+
+def classify_emails(emails):
+    # -> ([unique valid emails in request order], {index: outcome} for the rest)
+    valid = []
+    outcomes = {}
+    seen = set()
+    for i, email in enumerate(emails):
+        email = email.strip() if isinstance(email, str) else ''
+        if len(email) > EMAIL_MAX_LENGTH or not EMAIL_RE.match(email):
+            outcomes[i] = 'invalid'
+        elif email in seen:
+            outcomes[i] = 'duplicate'
+        else:
+            seen.add(email)
+            valid.append(email)
+    return valid, outcomes
+
+def items_from_request(request, key):
+    # JSON {"<key>": [...]} or a bare list of objects
+    body = request.get_json(silent=True)
+    if isinstance(body, dict):
+        body = body.get(key)
+    if isinstance(body, list) and all(isinstance(item, dict) for item in body):
+        return body
+    return None
+
+def missing_fields(items, required):
+    # -> [{"index": i, "error": ...}] for items lacking a required field
+    errors = []
+    for i, item in enumerate(items):
+        missing = [field for field in required if not item.get(field)]
+        if missing:
+            errors.append({'index': i, 'error': f"{', '.join(missing)} required"})
+    return errors
@@ -0,0 +1,77 @@
+# Denormalized team counters.
+#
+# teams.member_count, lifetime_tokens, lifetime_cost and last_activity_at are
+# kept current by the statements that change the underlying rows: the INSERT
+# (or DELETE) runs as a data-modifying CTE and the teams update is part of
+# the same statement, so counter and rows commit together in one round trip.
+# Retention does not touch the counters (archived usage still counts towards
+# lifetime totals). REFRESH_TEAM_COUNTERS recomputes them from scratch
+# (teams.recount job, datagen.py; migration.sql runs a copy once, when the
+# columns are added).
+#
+# The wrapped statement must RETURN team_id (and for usage: tokens_in,
+# tokens_out, cost, timestamp); the wrapper returns the same rows.
+
+from retention import HOT_ROWS
+
+def members_added(insert):
+    return f"""
+        WITH added AS ({insert}),
+        counted AS (
+            UPDATE teams SET member_count = teams.member_count + a.n
+            FROM (SELECT team_id, COUNT(*) AS n FROM added GROUP BY team_id) a
+            WHERE teams.id = a.team_id
+        )
+        SELECT * FROM added
+    """
+
+def members_removed(delete):
+    return f"""
+        WITH removed AS ({delete}),
+        counted AS (
+            UPDATE teams SET member_count = GREATEST(teams.member_count - r.n, 0)
+            FROM (SELECT team_id, COUNT(*) AS n FROM removed GROUP BY team_id) r
+            WHERE teams.id = r.team_id
+        )
+        SELECT * FROM removed
+    """
+
+def usage_added(insert):
+    return f"""
+        WITH added AS ({insert}),
+        counted AS (
+            UPDATE teams SET
+                lifetime_tokens = teams.lifetime_tokens + a.tokens,
+                lifetime_cost = teams.lifetime_cost + a.cost,
+                last_activity_at = GREATEST(teams.last_activity_at, a.last_at)
+            FROM (
+                SELECT team_id,
+                       SUM(COALESCE(tokens_in, 0) + COALESCE(tokens_out, 0)) AS tokens,
+                       SUM(COALESCE(cost, 0)) AS cost,
+                       MAX(timestamp) AS last_at
+                FROM added GROUP BY team_id
+            ) a
+            WHERE teams.id = a.team_id
+        )
+        SELECT * FROM added
+    """
+
+# Raw rows plus rollups of compacted days, like retention.USAGE_SOURCES.
+# Bind an array of team ids, or NULL for every team.
+HOT_USAGE = f"token_usage u JOIN tenants n ON n.id = t.tenant_id WHERE u.team_id = t.id AND {HOT_ROWS}"
+REFRESH_TEAM_COUNTERS = f"""
+    UPDATE teams t SET
+        member_count = (SELECT COUNT(*) FROM team_members m WHERE m.team_id = t.id),
+        lifetime_tokens =
+            (SELECT COALESCE(SUM(COALESCE(u.tokens_in, 0) + COALESCE(u.tokens_out, 0)), 0) FROM {HOT_USAGE})
+            + (SELECT COALESCE(SUM(d.tokens_in + d.tokens_out), 0) FROM token_usage_daily d JOIN tenants n ON n.id = t.tenant_id
+               WHERE d.team_id = t.id AND d.day < n.usage_compacted_before),
+        lifetime_cost =
+            (SELECT COALESCE(SUM(u.cost), 0) FROM {HOT_USAGE})
+            + (SELECT COALESCE(SUM(d.cost), 0) FROM token_usage_daily d JOIN tenants n ON n.id = t.tenant_id
+               WHERE d.team_id = t.id AND d.day < n.usage_compacted_before),
+        last_activity_at = COALESCE(
+            (SELECT MAX(u.timestamp) FROM {HOT_USAGE}),
+            (SELECT MAX(d.day)::timestamp FROM token_usage_daily d WHERE d.team_id = t.id))
+    WHERE %(team_ids)s::varchar[] IS NULL OR t.id = ANY(%(team_ids)s)
+"""
@@ -0,0 +1,259 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+import time
+import random
+import argparse
+from itertools import accumulate
+from datetime import datetime, timedelta
+import psycopg2
+from ids import make_id
+from counters import REFRESH_TEAM_COUNTERS
+
+# Synthetic data generator for large test databases.
+#
+#   python datagen.py --tenants 2000 --teams 20000 --usage 20000000 --months 12 --seed 7
+#
+# Produces a skewed, realistic dataset and streams it into Postgres with COPY:
+#   - tenant sizes follow a Zipf law, so a handful of tenants own most teams
+#     and most usage while the long tail is tiny
+#   - members per team are log-normal; usage per member is Zipf within a team
+#     (a few heavy users, many occasional ones)
+#   - usage timestamps cover --months, weighted towards recent weeks and
+#     towards working hours
+#   - file sizes are log-normal from a few KB to tens of MB
+#
+# The same --seed and --end always produce the same rows, ids included (ids
+# embed the row timestamp, as generate_id() does). Run db_setup.py first to
+# create the schema. Generated tenant ids start with tnt_gen_.
+
+DB_NAME = os.getenv("DB_NAME", "master_admin_db")
+DB_USER = os.getenv("DB_USER", "mobiledevarkatiss")
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PASSWORD = os.getenv("DB_PASSWORD", None)
+DB_PORT = os.getenv("DB_PORT", "5432")
+# Seeds every tenant: runs as the BYPASSRLS role (tenancy.py)
+DB_ADMIN_ROLE = os.getenv("DB_ADMIN_ROLE", "tenant_admin")
+
+PROVIDERS = [('gemini', 'gemini-2.0-flash-001'), ('openai', 'gpt-4o-mini'), ('anthropic', 'claude-3-5-haiku')]
+MODEL_WEIGHTS = [0.5, 0.3, 0.2]
+# Per-token price per model, in dollars
+MODEL_PRICES = {'gemini-2.0-flash-001': 0.0000004, 'gpt-4o-mini': 0.0000006, 'claude-3-5-haiku': 0.000004}
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 4, 8, 14, 16, 16, 15, 12, 15, 16, 16, 14, 10, 6, 4, 3, 2, 1, 1]
+FILE_CONTENT_LIMIT = 2048
+
+def get_db_connection():
+    try:
+        conn = psycopg2.connect(
+            database=DB_NAME,
+            user=DB_USER,
+            host=DB_HOST,
+            password=DB_PASSWORD,
+            port=DB_PORT,
+            options=f"-c role={DB_ADMIN_ROLE}"
+        )
+        return conn
+    except Exception as e:
+        print(f"Error connecting to database: {e}")
+        return None
+
+# --- Distributions ---
+
+def zipf_weights(n, s):
+    return [1.0 / (rank ** s) for rank in range(1, n + 1)]
+
+def split_by_weight(total, weights, minimum=1):
+    # Integer allocation proportional to weights, every bucket gets at least `minimum`
+    scale = sum(weights)
+    counts = [max(minimum, int(total * w / scale)) for w in weights]
+    return counts
+
+# --- COPY streaming ---
+
+def copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, str):
+        return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+    return str(value)
+
+class RowStream:
+    # File-like object that renders rows to COPY text format on demand, so
+    # tables of any size stream with constant memory
+    def __init__(self, rows):
+        self.rows = rows
+        self.buffer = ''
+
+    def read(self, size=-1):
+        chunk_rows = []
+        length = len(self.buffer)
+        for row in self.rows:
+            line = '\t'.join(copy_value(v) for v in row) + '\n'
+            chunk_rows.append(line)
+            length += len(line)
+            if size > 0 and length >= size:
+                break
+        data = self.buffer + ''.join(chunk_rows)
+        if size > 0:
+            data, self.buffer = data[:size], data[size:]
+        else:
+            self.buffer = ''
+        return data
+
+def copy_rows(cur, table, columns, rows):
+    start = time.perf_counter()
+    counter = [0]
+
+    def counted():
+        for row in rows:
+            counter[0] += 1
+            yield row
+
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", RowStream(counted()), size=1 << 20)
+    elapsed = time.perf_counter() - start
+    rate = counter[0] / elapsed * 60 if elapsed else 0
+    print(f"  {table}: {counter[0]:,} rows in {elapsed:.1f}s ({rate:,.0f} rows/min)")
+    return counter[0]
+
+# --- Generators ---
+
+def generate(args):
+    rng = random.Random(args.seed)
+    now = datetime.strptime(args.end, '%Y-%m-%d') if args.end else datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    now_ms = int(now.timestamp() * 1000)
+    span_seconds = int(args.months * 30.4 * 86400)
+    start_time = now - timedelta(seconds=span_seconds)
+
+    def past_ms(age_seconds):
+        return now_ms - int(age_seconds * 1000)
+
+    # Tenants: Zipf-sized
+    tenant_weights = zipf_weights(args.tenants, args.skew)
+    tenants = []
+    for n in range(args.tenants):
+        age = rng.uniform(0, span_seconds)
+        provider, model = PROVIDERS[n % len(PROVIDERS)]
+        tenants.append((
+            make_id('tnt_gen', past_ms(age), rng.getrandbits(80)),
+            f"{rng.choice(['Acme', 'Globex', 'Initech', 'Umbrella', 'Stark', 'Wayne', 'Hooli', 'Vandelay'])} "
+            f"{rng.choice(['Labs', 'Corp', 'Group', 'Systems', 'Holdings', 'Partners'])} {n}",
+            'disabled' if rng.random() < 0.03 else 'active',
+            now - timedelta(seconds=age),
+            make_id('ak', now_ms, rng.getrandbits(80)),
+            '{}', provider, model,
+        ))
+
+    # Teams: allocated to tenants by weight
+    teams = []
+    team_weights = []
+    for tenant, count, weight in zip(tenants, split_by_weight(args.teams, tenant_weights), tenant_weights):
+        for n in range(count):
+            provider, model = rng.choices(PROVIDERS, weights=MODEL_WEIGHTS)[0]
+            created = tenant[3] + timedelta(seconds=rng.uniform(0, max(1, (now - tenant[3]).total_seconds())))
+            teams.append((
+                make_id('team', int(created.timestamp() * 1000), rng.getrandbits(80)),
+                tenant[0], f"Team {n}", provider, None,
+                make_id('tkey', now_ms, rng.getrandbits(80)), model, created, '{}',
+            ))
+            team_weights.append(weight / count)
+
+    # Members: log-normal team sizes
+    members_by_team = []
+    for team in teams:
+        size = max(1, min(args.max_team_size, int(rng.lognormvariate(args.member_mu, 1.0))))
+        members_by_team.append([f"user{i}.{team[0][-8:]}@{team[1][-6:]}.example.com" for i in range(size)])
+
+    def member_rows():
+        for team, emails in zip(teams, members_by_team):
+            for email in emails:
+                created = team[7] + timedelta(seconds=rng.uniform(0, max(1, (now - team[7]).total_seconds())))
+                yield (make_id('mem', int(created.timestamp() * 1000), rng.getrandbits(80)), team[0], email, created)
+
+    def file_rows():
+        file_counts = split_by_weight(args.files, tenant_weights, minimum=0)
+        for tenant, count in zip(tenants, file_counts):
+            for n in range(count):
+                size = int(min(64 * 1024 * 1024, rng.lognormvariate(11, 2)))
+                uploaded = tenant[3] + timedelta(seconds=rng.uniform(0, max(1, (now - tenant[3]).total_seconds())))
+                ext = rng.choice(['pdf', 'txt', 'md', 'csv', 'docx', 'json'])
+                yield (make_id('file', int(uploaded.timestamp() * 1000), rng.getrandbits(80)), tenant[0],
+                       f"document-{n}.{ext}", size, 'x' * min(size, FILE_CONTENT_LIMIT), uploaded, '#')
+
+    def usage_rows():
+        team_cum = list(accumulate(team_weights))
+        member_cum = [list(accumulate(zipf_weights(len(emails), args.user_skew))) for emails in members_by_team]
+        hours = list(range(24))
+        hour_cum = list(accumulate(HOUR_WEIGHTS))
+        models = [m for _, m in PROVIDERS]
+        batch = 50000
+        for offset in range(0, args.usage, batch):
+            count = min(batch, args.usage - offset)
+            team_idx = rng.choices(range(len(teams)), cum_weights=team_cum, k=count)
+            day_ages = [int(span_seconds * (rng.random() ** args.recency) // 86400) for _ in range(count)]
+            hour_of_day = rng.choices(hours, cum_weights=hour_cum, k=count)
+            model_choice = rng.choices(models, weights=MODEL_WEIGHTS, k=count)
+            for i in range(count):
+                t = team_idx[i]
+                emails = members_by_team[t]
+                email = rng.choices(emails, cum_weights=member_cum[t])[0] if rng.random() > 0.02 else None
+                day = now - timedelta(days=day_ages[i])
+                ts = day.replace(hour=hour_of_day[i], minute=rng.randrange(60), second=rng.randrange(60))
+                if ts > now or ts < start_time:
+                    ts = now - timedelta(seconds=rng.randrange(3600))
+                tokens_in = int(rng.lognormvariate(6.5, 1.2))
+                tokens_out = int(rng.lognormvariate(5.5, 1.0))
+                model = model_choice[i]
+                cost = round((tokens_in + tokens_out) * MODEL_PRICES[model], 8)
+                yield (make_id('usage', int(ts.timestamp() * 1000), rng.getrandbits(80)),
+                       teams[t][0], email, tokens_in, tokens_out, cost, model, ts)
+
+    return tenants, teams, member_rows, file_rows, usage_rows
+
+def load(args):
+    conn = get_db_connection()
+    if not conn:
+        return
+    cur = conn.cursor()
+
+    if args.truncate:
+        print("Removing previously generated tenants...")
+        cur.execute("DELETE FROM tenants WHERE id LIKE 'tnt_gen_%'")
+
+    tenants, teams, member_rows, file_rows, usage_rows = generate(args)
+    print(f"Loading dataset (seed {args.seed})...")
+    copy_rows(cur, 'tenants', ('id', 'name', 'status', 'created_at', 'api_key', 'settings', 'provider', 'model'), iter(tenants))
+    copy_rows(cur, 'teams', ('id', 'tenant_id', 'name', 'provider', 'api_key', 'team_key', 'model', 'created_at', 'styles'), iter(teams))
+    copy_rows(cur, 'team_members', ('id', 'team_id', 'email', 'created_at'), member_rows())
+    copy_rows(cur, 'files', ('id', 'tenant_id', 'name', 'size', 'content', 'uploaded_at', 'url'), file_rows())
+    copy_rows(cur, 'token_usage', ('id', 'team_id', 'email', 'tokens_in', 'tokens_out', 'cost', 'model', 'timestamp'), usage_rows())
+    conn.commit()
+
+    # COPY bypasses the counter-maintaining statements
+    print("Computing team counters...")
+    cur.execute(REFRESH_TEAM_COUNTERS, {'team_ids': [team[0] for team in teams]})
+    conn.commit()
+
+    print("Analyzing tables...")
+    cur.execute("ANALYZE tenants, teams, team_members, files, token_usage")
+    conn.commit()
+    cur.close()
+    conn.close()
+    print("Data generation complete.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate a large, skewed test dataset')
+    parser.add_argument('--tenants', type=int, default=500)
+    parser.add_argument('--teams', type=int, default=5000, help='Total teams across all tenants')
+    parser.add_argument('--files', type=int, default=20000, help='Total files across all tenants')
+    parser.add_argument('--usage', type=int, default=2000000, help='Total token_usage rows')
+    parser.add_argument('--months', type=float, default=6, help='History covered by usage timestamps')
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent for tenant size')
+    parser.add_argument('--user-skew', type=float, default=1.2, help='Zipf exponent for usage per member')
+    parser.add_argument('--member-mu', type=float, default=2.3, help='Log-normal mu of team size (e^mu ~ median)')
+    parser.add_argument('--max-team-size', type=int, default=5000)
+    parser.add_argument('--recency', type=float, default=1.5, help='>1 concentrates usage in recent weeks')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--end', help='Last day of generated history, YYYY-MM-DD (default today)')
+    parser.add_argument('--truncate', action='store_true', help='Delete previously generated tenants first')
+    load(parser.parse_args())
@@ -11,18 +11,21 @@ DB_USER = os.getenv("DB_USER", "mobiledevarkatiss")
 DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_PASSWORD = os.getenv("DB_PASSWORD", None)
 DB_PORT = os.getenv("DB_PORT", "5432")
+# BYPASSRLS role for cross-tenant work (tenancy.py)
+DB_ADMIN_ROLE = os.getenv("DB_ADMIN_ROLE", "tenant_admin")
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_FILE = os.path.join(BASE_DIR, 'storage.json')
 
-def get_db_connection(db_name=None):
+def get_db_connection(db_name=None, admin=False):
     try:
         conn = psycopg2.connect(
             database=db_name if db_name else "postgres",
             user=DB_USER,
             host=DB_HOST,
             password=DB_PASSWORD,
-            port=DB_PORT
+            port=DB_PORT,
+            options=f"-c role={DB_ADMIN_ROLE}" if admin else None
         )
         return conn
     except Exception as e:
@@ -68,7 +71,10 @@ def create_tables():
             status VARCHAR(50) DEFAULT 'active',
             created_at TIMESTAMP,
             api_key VARCHAR(100),
-            settings JSONB
+            settings JSONB,
+            usage_retention_days INTEGER,
+            usage_compacted_before DATE,
+            deleted_at TIMESTAMP
         );
     """)
     
@@ -83,7 +89,13 @@ def create_tables():
             team_key VARCHAR(100),
             model VARCHAR(100),
             created_at TIMESTAMP,
-            styles JSONB
+            styles JSONB,
+            monthly_token_quota BIGINT,
+            monthly_cost_quota FLOAT,
+            member_count INTEGER NOT NULL DEFAULT 0,
+            lifetime_tokens BIGINT NOT NULL DEFAULT 0,
+            lifetime_cost FLOAT NOT NULL DEFAULT 0.0,
+            last_activity_at TIMESTAMP
         );
     """)
     
@@ -124,21 +136,122 @@ def create_tables():
             timestamp TIMESTAMP
         );
     """)
+
+    # Tenant list: name prefix search and per-tenant team lookups
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_tenants_name_prefix ON tenants (lower(name) text_pattern_ops);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_teams_tenant_id ON teams (tenant_id);")
+    # Tenants waiting for their purge job (softdelete.py)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_tenants_deleted ON tenants (id) WHERE deleted_at IS NOT NULL;")
+
+    # Trigram indexes for typeahead search (search.py)
+    cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_tenants_name_trgm ON tenants USING gin (name gin_trgm_ops);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_teams_name_trgm ON teams USING gin (name gin_trgm_ops);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_team_members_email_trgm ON team_members USING gin (email gin_trgm_ops);")
+
+    # Usage lookups per team and time range (aggregates, quotas)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_token_usage_team_timestamp ON token_usage (team_id, timestamp);")
+
+    # Shared rate limiter state (ratelimit.py), safe to lose on crash
+    cur.execute("""
+        CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit_buckets (
+            key VARCHAR(120) PRIMARY KEY,
+            rate FLOAT NOT NULL,
+            burst FLOAT NOT NULL,
+            tokens FLOAT NOT NULL,
+            allowed BOOLEAN NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL
+        );
+    """)
+
+    # Background job queue (jobs.py)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id VARCHAR(50) PRIMARY KEY,
+            kind VARCHAR(100) NOT NULL,
+            payload JSONB NOT NULL DEFAULT '{}',
+            status VARCHAR(20) NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            run_at TIMESTAMP NOT NULL,
+            progress JSONB,
+            result JSONB,
+            error TEXT,
+            locked_by VARCHAR(100),
+            locked_at TIMESTAMP,
+            created_at TIMESTAMP NOT NULL,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queued ON jobs (run_at) WHERE status = 'queued';")
+
+    # Daily usage rollups per team and user, rebuilt by the rollups.recompute job
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS token_usage_daily (
+            team_id VARCHAR(50) REFERENCES teams(id) ON DELETE CASCADE,
+            day DATE NOT NULL,
+            email VARCHAR(255),
+            tokens_in BIGINT NOT NULL DEFAULT 0,
+            tokens_out BIGINT NOT NULL DEFAULT 0,
+            cost FLOAT NOT NULL DEFAULT 0.0,
+            events INTEGER NOT NULL DEFAULT 0
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_token_usage_daily_team_day ON token_usage_daily (team_id, day);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_token_usage_daily_day ON token_usage_daily (day);")
+
+    # Row-level security per tenant (tenancy.py): connections see the tenant
+    # named by app.tenant_id and nothing without it. Cross-tenant work (admin
+    # routes, search, jobs, scripts) runs as DB_ADMIN_ROLE, which bypasses the policies.
+    conn.commit()
+    cur.execute("SELECT 1 FROM pg_roles WHERE rolname = %s", (DB_ADMIN_ROLE,))
+    admin_role = cur.fetchone() is not None
+    if not admin_role:
+        # Creating a BYPASSRLS role needs a superuser on most servers
+        try:
+            cur.execute(f'CREATE ROLE "{DB_ADMIN_ROLE}" NOLOGIN BYPASSRLS;')
+            cur.execute(f'GRANT "{DB_ADMIN_ROLE}" TO CURRENT_USER;')
+            conn.commit()
+            admin_role = True
+        except psycopg2.Error as e:
+            conn.rollback()
+            print(f"Could not create role {DB_ADMIN_ROLE}: {e}As a superuser run:\n"
+                  f'  CREATE ROLE "{DB_ADMIN_ROLE}" NOLOGIN BYPASSRLS; GRANT "{DB_ADMIN_ROLE}" TO "{DB_USER}";\n'
+                  "then run db_setup.py again")
+    if admin_role:
+        cur.execute(f'GRANT SELECT, INSERT, UPDATE, DELETE ON ALL TABLES IN SCHEMA public TO "{DB_ADMIN_ROLE}";')
+        cur.execute(f'ALTER DEFAULT PRIVILEGES IN SCHEMA public GRANT SELECT, INSERT, UPDATE, DELETE ON TABLES TO "{DB_ADMIN_ROLE}";')
+    setting = "current_setting('app.tenant_id', true)"
+    policies = {
+        'tenants': f"id = {setting}",
+        'teams': f"tenant_id = {setting}",
+        'files': f"tenant_id = {setting}",
+        # Through teams, which is filtered by its own policy
+        'team_members': "team_id IN (SELECT id FROM teams)",
+        'token_usage': "team_id IN (SELECT id FROM teams)",
+        'token_usage_daily': "team_id IN (SELECT id FROM teams)",
+    }
+    for table, condition in policies.items():
+        cur.execute(f"ALTER TABLE {table} ENABLE ROW LEVEL SECURITY;")
+        cur.execute(f"ALTER TABLE {table} FORCE ROW LEVEL SECURITY;")
+        cur.execute(f"DROP POLICY IF EXISTS tenant_isolation ON {table};")
+        cur.execute(f"CREATE POLICY tenant_isolation ON {table} USING ({condition});")
     
     conn.commit()
     cur.close()
     conn.close()
     print("Tables created successfully.")
 
-def migrate_data():
-    if not os.path.exists(DATA_FILE):
+def migrate_data(data_file=DATA_FILE, progress=None):
+    if not os.path.exists(data_file):
         print("No storage.json found. Skipping migration.")
         return
 
-    with open(DATA_FILE, 'r') as f:
+    with open(data_file, 'r') as f:
         data = json.load(f)
 
-    conn = get_db_connection(DB_NAME)
+    conn = get_db_connection(DB_NAME, admin=True)
     if not conn:
         return
     cur = conn.cursor()
@@ -164,6 +277,9 @@ def migrate_data():
             json.dumps(t.get('settings', {}))
         ))
 
+    if progress:
+        progress(1, 3, f"Migrated {len(tenants)} tenants")
+
     # Migrate Files
     files_map = data.get('files', {})
     total_files = 0
@@ -173,6 +289,8 @@ def migrate_data():
         if not cur.fetchone():
             print(f"Skipping files for unknown tenant {tenant_id}")
             continue
+        if progress:
+            progress(1, 3, f"Migrating files of {tenant_id}")
             
         for f in file_list:
             cur.execute("SELECT 1 FROM files WHERE id = %s", (f['id'],))
@@ -193,6 +311,8 @@ def migrate_data():
             ))
             total_files += 1
     print(f"Migrated {total_files} files.")
+    if progress:
+        progress(2, 3, f"Migrated {total_files} files")
 
     # Migrate Teams
     teams_map = data.get('teams', {})
@@ -203,6 +323,8 @@ def migrate_data():
         if not cur.fetchone():
             print(f"Skipping teams for unknown tenant {tenant_id}")
             continue
+        if progress:
+            progress(2, 3, f"Migrating teams of {tenant_id}")
 
         for team in team_list:
             cur.execute("SELECT 1 FROM teams WHERE id = %s", (team['id'],))
@@ -230,6 +352,7 @@ def migrate_data():
     cur.close()
     conn.close()
     print("Migration complete.")
+    return {'tenants': len(tenants), 'files': total_files, 'teams': total_teams}
 
 if __name__ == "__main__":
     create_database()
@@ -0,0 +1,99 @@
+# Gunicorn configuration for the tenant portal backend.
+#
+# Run from the backend directory:
+#
+#     gunicorn -c gunicorn.conf.py server:app
+#
+# Every setting can be overridden through the environment (see .env.example),
+# so the same file is used locally and on the deployment host.
+#
+# Worker model
+#   The routes in server.py are short, blocking request/response handlers that
+#   spend most of their time waiting on Postgres (one connection per request).
+#   The default "gthread" worker runs WEB_THREADS threads inside each of
+#   WEB_WORKERS processes, so CPU work (JSON encoding, row munging) scales with
+#   cores while threads overlap the database waits.
+#
+# Route profile used for the defaults below
+#   /api/usage (POST)              high volume, one INSERT, should finish in ms
+#   /login/*, /auth/login (POST)   one or two primary-key lookups
+#   /tenants, /tenants/<id>/...    listing queries, small payloads
+#   /tenants/<id>/usage (GET)      two aggregates over token_usage, the slowest
+#                                  read; WEB_TIMEOUT must stay above its p99
+#   /tenants/<id>/files (POST)     multipart upload, body read into memory
+#
+# Operations
+#   Graceful reload (new code, zero dropped requests):  kill -HUP <master pid>
+#   Graceful shutdown:                                   kill -TERM <master pid>
+#   Add / remove a worker:                               kill -TTIN / -TTOU <master pid>
+#   (TTIN is not checked against WEB_DB_CONNECTIONS)
+
+import multiprocessing
+import os
+import sys
+
+bind = os.getenv("WEB_BIND", f"0.0.0.0:{os.getenv('PORT', '5001')}")
+
+# --- Workers ---
+worker_class = os.getenv("WEB_WORKER_CLASS", "gthread")
+threads = int(os.getenv("WEB_THREADS", 4))
+
+# Database connection budget. A worker has at most one primary connection
+# per thread plus one for the quota reconcile thread (quotas.py) open at a
+# time; DB_POOL_SIZE only bounds how many of them stay open while idle.
+# WEB_DB_CONNECTIONS is this host's share of the server's max_connections:
+# leave room for job workers, migrations, other app hosts and the reserved
+# superuser slots (the default suits one host on a stock max_connections=100).
+# The worker count is capped so that workers * (threads + 1) fits in it.
+db_connections = int(os.getenv("WEB_DB_CONNECTIONS", 80))
+max_workers = max(1, db_connections // (threads + 1))
+workers = int(os.getenv("WEB_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+if workers > max_workers:
+    print(f"gunicorn.conf.py: {workers} workers x {threads + 1} connections exceed "
+          f"WEB_DB_CONNECTIONS={db_connections}, starting {max_workers}")
+    workers = max_workers
+
+# Maximum queued connections waiting for a free worker
+backlog = int(os.getenv("WEB_BACKLOG", 2048))
+
+# --- Timeouts ---
+# A worker silent for longer than this is killed and restarted
+timeout = int(os.getenv("WEB_TIMEOUT", 30))
+# Time given to in-flight requests on reload / shutdown before workers are killed
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", 30))
+# Seconds to hold an idle keep-alive connection open; keep this above the idle
+# timeout of the proxy in front of us so it never reuses a closed socket
+keepalive = int(os.getenv("WEB_KEEPALIVE", 5))
+
+# --- Worker recycling ---
+# Restart each worker after this many requests to bound memory growth; the
+# jitter keeps all workers from recycling at the same moment
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", 10000))
+max_requests_jitter = int(os.getenv("WEB_MAX_REQUESTS_JITTER", 1000))
+
+# --- Reload ---
+# Restart workers when source files change (development only)
+reload = os.getenv("WEB_RELOAD", "0") == "1"
+# Import the app once in the master before forking. Saves memory, but a HUP
+# then no longer picks up new code, so it is off by default.
+preload_app = os.getenv("WEB_PRELOAD", "0") == "1"
+
+# --- Request limits ---
+limit_request_line = 8190
+limit_request_fields = 100
+
+# --- Logging ---
+accesslog = os.getenv("WEB_ACCESS_LOG", "-")
+errorlog = os.getenv("WEB_ERROR_LOG", "-")
+loglevel = os.getenv("WEB_LOG_LEVEL", "info")
+
+# --- Hooks ---
+def post_worker_init(worker):
+    # Database checks run in each worker, after the fork (server.check_database)
+    from server import check_database
+    try:
+        check_database()
+    except RuntimeError as e:
+        worker.log.error("Refusing to start: %s", e)
+        # Exit code gunicorn treats as a boot failure: the master stops instead of respawning
+        sys.exit(3)
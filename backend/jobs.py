@@ -0,0 +1,330 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+import json
+import time
+import select
+import signal
+import socket
+import argparse
+import traceback
+import multiprocessing
+from datetime import date, datetime, timedelta
+import psycopg2
+from flask import request, jsonify
+from auth import require_admin
+from ids import generate_id
+from mappers import JOB
+from tenancy import ADMIN_OPTIONS
+from tasks import HANDLERS
+
+# Durable background job queue on a Postgres table.
+#
+# API workers enqueue() a row into `jobs` and return immediately; worker
+# processes started with
+#
+#     python jobs.py worker --processes 4
+#
+# claim queued jobs with SELECT ... FOR UPDATE SKIP LOCKED, so any number of
+# workers share the queue without double-processing. enqueue() also sends a
+# NOTIFY so idle workers wake at once instead of waiting for the next poll.
+#
+# A failed job is retried with exponential backoff until max_attempts, then
+# marked failed. Handlers report progress through ctx.progress(), which also
+# renews the job's lease; a job whose worker died (lease older than
+# JOB_LEASE_SECONDS) is put back on the queue.
+#
+# Kinds listed in JOB_DAILY (default usage.retention) are enqueued by the
+# workers themselves once per day, so no cron entry is needed for them.
+#
+# Handlers are registered with @handler('kind') in tasks.py.
+
+DB_NAME = os.getenv("DB_NAME", "master_admin_db")
+DB_USER = os.getenv("DB_USER", "mobiledevarkatiss")
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PASSWORD = os.getenv("DB_PASSWORD", None)
+DB_PORT = os.getenv("DB_PORT", "5432")
+
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", 5))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 300))
+JOB_RETRY_BASE_SECONDS = int(os.getenv("JOB_RETRY_BASE_SECONDS", 10))
+JOB_DAILY = [kind.strip() for kind in os.getenv("JOB_DAILY", "usage.retention").split(',') if kind.strip()]
+NOTIFY_CHANNEL = 'jobs'
+
+def get_db_connection():
+    try:
+        conn = psycopg2.connect(
+            database=DB_NAME,
+            user=DB_USER,
+            host=DB_HOST,
+            password=DB_PASSWORD,
+            port=DB_PORT,
+            # Jobs work across tenants (tenancy.py)
+            options=ADMIN_OPTIONS
+        )
+        return conn
+    except Exception as e:
+        print(f"Error connecting to database: {e}")
+        return None
+
+# --- Producer side ---
+
+def enqueue(conn, kind, payload=None, max_attempts=3, run_at=None):
+    # Inserts with the caller's connection; the job becomes visible when the caller commits
+    job_id = generate_id('job')
+    cur = conn.cursor()
+    cur.execute(f"""
+        INSERT INTO jobs (id, kind, payload, status, max_attempts, run_at, created_at)
+        VALUES (%s, %s, %s, 'queued', %s, %s, now())
+        RETURNING {JOB.columns}
+    """, (job_id, kind, json.dumps(payload or {}), max_attempts, run_at or datetime.now()))
+    job = JOB.map_row(cur.fetchone())
+    cur.execute(f"NOTIFY {NOTIFY_CHANNEL}")
+    cur.close()
+    return job
+
+def enqueue_daily(conn, day):
+    # The job id is derived from the kind and the day: every worker tries,
+    # the first insert wins and the others are no-ops
+    cur = conn.cursor()
+    for kind in JOB_DAILY:
+        cur.execute("""
+            INSERT INTO jobs (id, kind, payload, status, max_attempts, run_at, created_at)
+            VALUES (%s, %s, '{}', 'queued', 3, now(), now())
+            ON CONFLICT (id) DO NOTHING
+        """, (f"job_daily_{kind}_{day.isoformat()}", kind))
+    conn.commit()
+    cur.close()
+
+# --- Worker side ---
+
+class JobContext:
+    def __init__(self, job_id, payload, attempt, connect):
+        self.job_id = job_id
+        self.payload = payload
+        self.attempt = attempt
+        self.connect = connect
+        self.conn = connect()
+        if self.conn is None:
+            raise RuntimeError('No database connection')
+        self.conn.autocommit = True
+
+    def progress(self, done, total=None, message=None):
+        # Persists progress and renews the lease. Handlers call it at least once
+        # per batch: a job silent for JOB_LEASE_SECONDS is requeued while it runs.
+        cur = self.conn.cursor()
+        cur.execute("""
+            UPDATE jobs SET progress = %s, locked_at = now() WHERE id = %s
+        """, (json.dumps({'done': done, 'total': total, 'message': message}), self.job_id))
+        cur.close()
+
+    def close(self):
+        self.conn.close()
+
+def claim(conn, worker_id):
+    cur = conn.cursor()
+    # Requeue jobs whose worker stopped renewing its lease, or fail them once
+    # they have used up their attempts (a job that kills its worker would
+    # otherwise run forever)
+    cur.execute("""
+        UPDATE jobs SET
+            status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+            error = CASE WHEN attempts >= max_attempts THEN 'Lease expired on the last attempt' ELSE error END,
+            finished_at = CASE WHEN attempts >= max_attempts THEN now() ELSE finished_at END,
+            locked_by = NULL
+        WHERE status = 'running' AND locked_at < now() - make_interval(secs => %s)
+    """, (JOB_LEASE_SECONDS,))
+    cur.execute("""
+        UPDATE jobs
+        SET status = 'running', attempts = attempts + 1, locked_by = %s, locked_at = now(), started_at = now()
+        WHERE id = (
+            SELECT id FROM jobs
+            WHERE status = 'queued' AND run_at <= now()
+            ORDER BY run_at
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, kind, payload, attempts, max_attempts
+    """, (worker_id,))
+    row = cur.fetchone()
+    conn.commit()
+    cur.close()
+    return row
+
+def finish(conn, job_id, result):
+    cur = conn.cursor()
+    cur.execute("""
+        UPDATE jobs SET status = 'succeeded', result = %s, error = NULL, locked_by = NULL, finished_at = now()
+        WHERE id = %s
+    """, (json.dumps(result), job_id))
+    conn.commit()
+    cur.close()
+
+def fail(conn, job_id, attempts, max_attempts, error):
+    cur = conn.cursor()
+    if attempts < max_attempts:
+        retry_at = datetime.now() + timedelta(seconds=JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+        cur.execute("""
+            UPDATE jobs SET status = 'queued', run_at = %s, error = %s, locked_by = NULL WHERE id = %s
+        """, (retry_at, error, job_id))
+    else:
+        cur.execute("""
+            UPDATE jobs SET status = 'failed', error = %s, locked_by = NULL, finished_at = now() WHERE id = %s
+        """, (error, job_id))
+    conn.commit()
+    cur.close()
+
+def run_one(conn, worker_id):
+    row = claim(conn, worker_id)
+    if not row:
+        return False
+    job_id, kind, payload, attempts, max_attempts = row
+    print(f"[{worker_id}] Running {kind} {job_id} (attempt {attempts}/{max_attempts})")
+
+    func = HANDLERS.get(kind)
+    if func is None:
+        fail(conn, job_id, max_attempts, max_attempts, f"Unknown job kind: {kind}")
+        return True
+
+    ctx = None
+    try:
+        ctx = JobContext(job_id, payload or {}, attempts, get_db_connection)
+        result = func(ctx)
+        finish(conn, job_id, result if result is not None else {})
+        print(f"[{worker_id}] Finished {kind} {job_id}")
+    except Exception as e:
+        traceback.print_exc()
+        fail(conn, job_id, attempts, max_attempts, f"{type(e).__name__}: {e}")
+    finally:
+        if ctx:
+            ctx.close()
+    return True
+
+def worker_loop(index):
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    signal.signal(signal.SIGINT, lambda *_: stopping.append(True))
+
+    conn = get_db_connection()
+    listener = get_db_connection()
+    if not conn or not listener:
+        return
+    listener.autocommit = True
+    listener.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+    print(f"[{worker_id}] Worker {index} started")
+
+    scheduled = None
+    while not stopping:
+        try:
+            if scheduled != date.today():
+                enqueue_daily(conn, date.today())
+                scheduled = date.today()
+            if run_one(conn, worker_id):
+                continue
+        except psycopg2.Error as e:
+            print(f"[{worker_id}] Database error: {e}")
+            conn.close()
+            time.sleep(JOB_POLL_SECONDS)
+            conn = get_db_connection() or conn
+            continue
+        # Idle: sleep until a NOTIFY arrives or the poll interval passes
+        if select.select([listener], [], [], JOB_POLL_SECONDS) != ([], [], []):
+            listener.poll()
+            listener.notifies.clear()
+
+    print(f"[{worker_id}] Worker stopped")
+    conn.close()
+    listener.close()
+
+def run_workers(processes):
+    if processes == 1:
+        worker_loop(0)
+        return
+    children = [multiprocessing.Process(target=worker_loop, args=(i,)) for i in range(processes)]
+    for child in children:
+        child.start()
+
+    def forward(signum, frame):
+        for child in children:
+            child.terminate()
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for child in children:
+        child.join()
+
+# --- API ---
+
+def init_jobs(app, connect):
+    @app.route('/admin/jobs', methods=['POST'])
+    @require_admin
+    def create_job():
+        body = request.json or {}
+        kind = body.get('kind')
+        if not kind:
+            return jsonify({'error': 'kind required'}), 400
+
+        conn = connect()
+        if not conn:
+            return jsonify({'error': 'Database error'}), 500
+        job = enqueue(conn, kind, body.get('payload'), body.get('maxAttempts', 3))
+        conn.commit()
+        conn.close()
+        return jsonify(job), 202
+
+    @app.route('/admin/jobs', methods=['GET'])
+    @require_admin
+    def list_jobs():
+        status = request.args.get('status')
+        limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+
+        conn = connect()
+        if not conn:
+            return jsonify({'error': 'Database error'}), 500
+        cur = conn.cursor()
+        if status:
+            cur.execute(f"SELECT {JOB.columns} FROM jobs WHERE status = %s ORDER BY created_at DESC LIMIT %s", (status, limit))
+        else:
+            cur.execute(f"SELECT {JOB.columns} FROM jobs ORDER BY created_at DESC LIMIT %s", (limit,))
+        jobs = JOB.map_rows(cur.fetchall())
+        cur.close()
+        conn.close()
+        return jsonify(jobs)
+
+    @app.route('/admin/jobs/<job_id>', methods=['GET'])
+    @require_admin
+    def get_job(job_id):
+        conn = connect()
+        if not conn:
+            return jsonify({'error': 'Database error'}), 500
+        cur = conn.cursor()
+        cur.execute(f"SELECT {JOB.columns} FROM jobs WHERE id = %s", (job_id,))
+        row = cur.fetchone()
+        cur.close()
+        conn.close()
+        if not row:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(JOB.map_row(row))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Background job queue')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('worker', help='Run job worker processes')
+    p.add_argument('--processes', type=int, default=1)
+
+    p = sub.add_parser('enqueue', help='Queue a job from the command line')
+    p.add_argument('kind')
+    p.add_argument('--payload', default='{}', help='JSON payload')
+
+    args = parser.parse_args()
+    if args.command == 'worker':
+        run_workers(args.processes)
+    else:
+        conn = get_db_connection()
+        if conn:
+            job = enqueue(conn, args.kind, json.loads(args.payload))
+            conn.commit()
+            conn.close()
+            print(f"Queued {job['kind']} job {job['id']}")
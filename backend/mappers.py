@@ -0,0 +1,112 @@
+# Declarative row specs, one per entity / result shape.
+#
+# A RowSpec lists (sql expression, response key) pairs. From that it builds
+# the exact SELECT / RETURNING column list and compiles a tuple -> dict
+# mapper, so routes use plain tuple cursors and map results in one tight
+# loop instead of renaming keys on RealDictCursor rows. Values are left
+# untouched; datetimes and Decimals are encoded by the JSON provider
+# (serialization.py).
+#
+#     cur.execute(f"SELECT {TEAM.columns} FROM teams WHERE tenant_id = %s", (id,))
+#     teams = TEAM.map_rows(cur.fetchall())
+
+class RowSpec:
+    def __init__(self, *columns):
+        self.expressions = tuple(expr for expr, _ in columns)
+        self.keys = tuple(key for _, key in columns)
+        self.columns = ', '.join(self.expressions)
+
+        body = ', '.join(f"{key!r}: row[{i}]" for i, key in enumerate(self.keys))
+        namespace = {}
+        exec(f"def map_row(row):\n    return {{{body}}}\n"
+             f"def map_rows(rows):\n    return [{{{body}}} for row in rows]\n", namespace)
+        self.map_row = namespace['map_row']
+        self.map_rows = namespace['map_rows']
+
+    def map_records(self, records):
+        # Rows aggregated in SQL with json_agg(x) / row_to_json(x) arrive as
+        # objects keyed by column name, in select-list order
+        return self.map_rows([list(record.values()) for record in records])
+
+# --- Entities ---
+
+TENANT = RowSpec(
+    ('id', 'id'),
+    ('name', 'name'),
+    ('status', 'status'),
+    ('created_at', 'createdAt'),
+    ('api_key', 'apiKey'),
+    ('settings', 'settings'),
+    ('provider', 'provider'),
+    ('model', 'model'),
+    ('llm_api_key', 'llm_api_key'),
+    ('usage_retention_days', 'usageRetentionDays'),
+)
+
+TEAM = RowSpec(
+    ('id', 'id'),
+    ('name', 'name'),
+    ('provider', 'provider'),
+    ('api_key', 'apiKey'),
+    ('team_key', 'teamKey'),
+    ('model', 'model'),
+    ('created_at', 'createdAt'),
+    ('styles', 'styles'),
+    ('monthly_token_quota', 'monthlyTokenQuota'),
+    ('monthly_cost_quota', 'monthlyCostQuota'),
+    ('member_count', 'memberCount'),
+    ('lifetime_tokens', 'lifetimeTokens'),
+    ('lifetime_cost', 'lifetimeCost'),
+    ('last_activity_at', 'lastActivityAt'),
+)
+
+# File listings leave out the stored content, only the upload response returns it
+FILE = RowSpec(
+    ('id', 'id'),
+    ('name', 'name'),
+    ('size', 'size'),
+    ('uploaded_at', 'uploadedAt'),
+    ('url', 'url'),
+)
+
+FILE_WITH_CONTENT = RowSpec(*zip(FILE.expressions + ('content',), FILE.keys + ('content',)))
+
+MEMBER = RowSpec(
+    ('id', 'id'),
+    ('team_id', 'team_id'),
+    ('email', 'email'),
+    ('created_at', 'createdAt'),
+)
+
+JOB = RowSpec(
+    ('id', 'id'),
+    ('kind', 'kind'),
+    ('payload', 'payload'),
+    ('status', 'status'),
+    ('attempts', 'attempts'),
+    ('max_attempts', 'maxAttempts'),
+    ('progress', 'progress'),
+    ('result', 'result'),
+    ('error', 'error'),
+    ('run_at', 'runAt'),
+    ('created_at', 'createdAt'),
+    ('started_at', 'startedAt'),
+    ('finished_at', 'finishedAt'),
+)
+
+# --- Usage aggregates ---
+
+TEAM_USAGE = RowSpec(
+    ('t.name AS team_name', 'team_name'),
+    ('t.id AS team_id', 'team_id'),
+    ('COALESCE(SUM(u.tokens_in), 0) AS total_tokens_in', 'total_tokens_in'),
+    ('COALESCE(SUM(u.tokens_out), 0) AS total_tokens_out', 'total_tokens_out'),
+    ('COALESCE(SUM(u.cost), 0) AS total_cost', 'total_cost'),
+)
+
+USER_USAGE = RowSpec(
+    ('u.email', 'email'),
+    ('t.name AS team_name', 'team_name'),
+    ('SUM(u.cost) AS total_cost', 'total_cost'),
+    ('SUM(u.tokens_in + u.tokens_out) AS total_tokens', 'total_tokens'),
+)
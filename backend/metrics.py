@@ -0,0 +1,185 @@
+import time
+import threading
+from bisect import bisect_left
+import psycopg2.extensions
+from flask import g, request, has_request_context, Response
+from tracing import record_query
+
+# Per-route request and database metrics in Prometheus text format.
+#
+# init_metrics(app) times every request and exposes GET /metrics. Database
+# time is collected by InstrumentedConnection / InstrumentedCursor, which
+# get_db_connection() passes to psycopg2.connect(), so every cursor a route
+# opens is timed without changes to the route itself. The same cursor feeds
+# statement-level tracing (tracing.py).
+#
+# Values live in the worker process that served the request. Under gunicorn
+# with several workers each scrape sees one worker; give every worker its own
+# scrape target (or sum across pods) rather than reading a single process.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+_lock = threading.Lock()
+_registry = []
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.series = {}
+        _registry.append(self)
+
+    def inc(self, label_values=(), amount=1):
+        with _lock:
+            self.series[label_values] = self.series.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self.series.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self.series = {}
+        _registry.append(self)
+
+    def observe(self, label_values, value):
+        index = bisect_left(self.buckets, value)
+        with _lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total, count) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+# --- Metrics ---
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Request latency by route',
+                            ('method', 'route'))
+REQUESTS = Counter('http_requests_total', 'Requests by route and status code',
+                   ('method', 'route', 'status'))
+DB_CONNECT = Histogram('db_connect_duration_seconds', 'Time spent opening database connections per request',
+                       ('route',))
+DB_QUERY = Histogram('db_query_duration_seconds', 'Time spent executing SQL per request',
+                     ('route',))
+DB_QUERIES = Counter('db_queries_total', 'SQL statements executed', ('route',))
+DB_ROWS = Histogram('db_rows_returned', 'Rows returned or affected per request', ('route',),
+                    buckets=ROW_BUCKETS)
+
+def render_metrics():
+    with _lock:
+        lines = []
+        for metric in _registry:
+            lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+# --- Request hooks ---
+
+def _route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+def _request_stats():
+    if not has_request_context():
+        return None
+    return g.get('_metrics')
+
+def record_db_connect(seconds):
+    stats = _request_stats()
+    if stats is not None:
+        stats['db_connect'] += seconds
+
+def record_db_query(seconds, rows):
+    stats = _request_stats()
+    if stats is not None:
+        stats['db_query'] += seconds
+        stats['queries'] += 1
+        if rows > 0:
+            stats['rows'] += rows
+
+def _before_request():
+    g._metrics = {'start': time.perf_counter(), 'db_connect': 0.0, 'db_query': 0.0, 'queries': 0, 'rows': 0}
+
+def _after_request(response):
+    stats = g.pop('_metrics', None)
+    if stats is None:
+        return response
+    route = _route()
+    if route == '/metrics':
+        return response
+    REQUEST_LATENCY.observe((request.method, route), time.perf_counter() - stats['start'])
+    REQUESTS.inc((request.method, route, str(response.status_code)))
+    if stats['queries'] or stats['db_connect']:
+        DB_CONNECT.observe((route,), stats['db_connect'])
+        DB_QUERY.observe((route,), stats['db_query'])
+        DB_QUERIES.inc((route,), stats['queries'])
+        DB_ROWS.observe((route,), stats['rows'])
+    return response
+
+def init_metrics(app):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+# --- psycopg2 instrumentation ---
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    def _record(self, query, params, start_ns, start):
+        duration = time.perf_counter() - start
+        record_db_query(duration, self.rowcount)
+        if not isinstance(query, str):
+            query = query.decode() if isinstance(query, bytes) else query.as_string(self)
+        record_query(query, params, start_ns, duration, self.rowcount)
+
+    def execute(self, query, vars=None):
+        start_ns, start = time.time_ns(), time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self._record(query, vars, start_ns, start)
+
+    def executemany(self, query, vars_list):
+        start_ns, start = time.time_ns(), time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            self._record(query, None, start_ns, start)
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = InstrumentedCursor
@@ -35,3 +35,179 @@ BEGIN
         ALTER TABLE token_usage ADD CONSTRAINT token_usage_team_id_fkey FOREIGN KEY (team_id) REFERENCES teams(id) ON DELETE CASCADE;
     END IF;
 END $$;
+
+-- Migration: Per-team monthly usage quotas (NULL = unlimited)
+ALTER TABLE teams ADD COLUMN IF NOT EXISTS monthly_token_quota BIGINT;
+ALTER TABLE teams ADD COLUMN IF NOT EXISTS monthly_cost_quota FLOAT;
+
+-- CONCURRENTLY so usage ingestion is not blocked while it builds; it cannot run in a
+-- transaction, so apply_migration_local.py runs it on its own after the rest (with psql,
+-- do not use --single-transaction)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_token_usage_team_timestamp ON token_usage (team_id, timestamp);
+
+-- Migration: Shared rate limiter state (UNLOGGED: no WAL, emptied after a crash)
+CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit_buckets (
+    key VARCHAR(120) PRIMARY KEY,
+    rate FLOAT NOT NULL,
+    burst FLOAT NOT NULL,
+    tokens FLOAT NOT NULL,
+    allowed BOOLEAN NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL
+);
+
+-- Migration: Background job queue
+CREATE TABLE IF NOT EXISTS jobs (
+    id VARCHAR(50) PRIMARY KEY,
+    kind VARCHAR(100) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    status VARCHAR(20) NOT NULL DEFAULT 'queued', -- queued | running | succeeded | failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    run_at TIMESTAMP NOT NULL,
+    progress JSONB,
+    result JSONB,
+    error TEXT,
+    locked_by VARCHAR(100),
+    locked_at TIMESTAMP,
+    created_at TIMESTAMP NOT NULL,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_jobs_queued ON jobs (run_at) WHERE status = 'queued';
+
+-- Migration: Daily usage rollups per team and user
+CREATE TABLE IF NOT EXISTS token_usage_daily (
+    team_id VARCHAR(50) REFERENCES teams(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    email VARCHAR(255),
+    tokens_in BIGINT NOT NULL DEFAULT 0,
+    tokens_out BIGINT NOT NULL DEFAULT 0,
+    cost FLOAT NOT NULL DEFAULT 0.0,
+    events INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_token_usage_daily_team_day ON token_usage_daily (team_id, day);
+CREATE INDEX IF NOT EXISTS idx_token_usage_daily_day ON token_usage_daily (day);
+
+-- Migration: Usage retention per tenant (NULL = USAGE_RETENTION_DAYS, 0 = keep raw rows forever)
+ALTER TABLE tenants ADD COLUMN IF NOT EXISTS usage_retention_days INTEGER;
+-- Days before this date are served from token_usage_daily and the archive files
+ALTER TABLE tenants ADD COLUMN IF NOT EXISTS usage_compacted_before DATE;
+
+-- Migration: Tenant list filtering (name prefix) and per-tenant team lookups
+CREATE INDEX IF NOT EXISTS idx_tenants_name_prefix ON tenants (lower(name) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_teams_tenant_id ON teams (tenant_id);
+
+-- Migration: Trigram indexes for typeahead search
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_tenants_name_trgm ON tenants USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_teams_name_trgm ON teams USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_team_members_email_trgm ON team_members USING gin (email gin_trgm_ops);
+
+-- Migration: Denormalized team counters (maintained by counters.py)
+-- Backfilled once, when the columns are added: afterwards counters.py keeps
+-- them current, and a second backfill would overwrite them. Later drift can
+-- be repaired with the teams.recount job.
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name = 'teams' AND column_name = 'member_count') THEN
+        RETURN;
+    END IF;
+    ALTER TABLE teams ADD COLUMN member_count INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE teams ADD COLUMN IF NOT EXISTS lifetime_tokens BIGINT NOT NULL DEFAULT 0;
+    ALTER TABLE teams ADD COLUMN IF NOT EXISTS lifetime_cost FLOAT NOT NULL DEFAULT 0.0;
+    ALTER TABLE teams ADD COLUMN IF NOT EXISTS last_activity_at TIMESTAMP;
+
+    -- Row-level security applies to the table owner too: backfill every tenant as the admin role
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'tenant_admin') THEN
+        SET LOCAL ROLE tenant_admin;
+    END IF;
+    -- counters.REFRESH_TEAM_COUNTERS for every team: raw rows before
+    -- usage_compacted_before are already in the rollups and are skipped
+    UPDATE teams t SET
+        member_count = (SELECT COUNT(*) FROM team_members m WHERE m.team_id = t.id),
+        lifetime_tokens =
+            (SELECT COALESCE(SUM(COALESCE(u.tokens_in, 0) + COALESCE(u.tokens_out, 0)), 0)
+             FROM token_usage u JOIN tenants n ON n.id = t.tenant_id
+             WHERE u.team_id = t.id AND (n.usage_compacted_before IS NULL OR u.timestamp >= n.usage_compacted_before))
+            + (SELECT COALESCE(SUM(d.tokens_in + d.tokens_out), 0) FROM token_usage_daily d JOIN tenants n ON n.id = t.tenant_id
+               WHERE d.team_id = t.id AND d.day < n.usage_compacted_before),
+        lifetime_cost =
+            (SELECT COALESCE(SUM(u.cost), 0)
+             FROM token_usage u JOIN tenants n ON n.id = t.tenant_id
+             WHERE u.team_id = t.id AND (n.usage_compacted_before IS NULL OR u.timestamp >= n.usage_compacted_before))
+            + (SELECT COALESCE(SUM(d.cost), 0) FROM token_usage_daily d JOIN tenants n ON n.id = t.tenant_id
+               WHERE d.team_id = t.id AND d.day < n.usage_compacted_before),
+        last_activity_at = COALESCE(
+            (SELECT MAX(u.timestamp)
+             FROM token_usage u JOIN tenants n ON n.id = t.tenant_id
+             WHERE u.team_id = t.id AND (n.usage_compacted_before IS NULL OR u.timestamp >= n.usage_compacted_before)),
+            (SELECT MAX(d.day)::timestamp FROM token_usage_daily d WHERE d.team_id = t.id));
+    RESET ROLE;
+END $$;
+
+-- Migration: Soft-deleted tenants, hidden until the tenant.delete job purges them
+ALTER TABLE tenants ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP;
+CREATE INDEX IF NOT EXISTS idx_tenants_deleted ON tenants (id) WHERE deleted_at IS NOT NULL;
+
+-- Migration: Row-level security per tenant (tenancy.py)
+-- Scoped connections set app.tenant_id per transaction and see that tenant;
+-- connections without it see nothing. Not enforced for superusers or BYPASSRLS roles.
+ALTER TABLE tenants ENABLE ROW LEVEL SECURITY;
+ALTER TABLE tenants FORCE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS tenant_isolation ON tenants;
+CREATE POLICY tenant_isolation ON tenants USING (
+    id = current_setting('app.tenant_id', true));
+
+ALTER TABLE teams ENABLE ROW LEVEL SECURITY;
+ALTER TABLE teams FORCE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS tenant_isolation ON teams;
+CREATE POLICY tenant_isolation ON teams USING (
+    tenant_id = current_setting('app.tenant_id', true));
+
+ALTER TABLE files ENABLE ROW LEVEL SECURITY;
+ALTER TABLE files FORCE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS tenant_isolation ON files;
+CREATE POLICY tenant_isolation ON files USING (
+    tenant_id = current_setting('app.tenant_id', true));
+
+-- Through teams, which is filtered by its own policy
+ALTER TABLE team_members ENABLE ROW LEVEL SECURITY;
+ALTER TABLE team_members FORCE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS tenant_isolation ON team_members;
+CREATE POLICY tenant_isolation ON team_members USING (
+    team_id IN (SELECT id FROM teams));
+
+ALTER TABLE token_usage ENABLE ROW LEVEL SECURITY;
+ALTER TABLE token_usage FORCE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS tenant_isolation ON token_usage;
+CREATE POLICY tenant_isolation ON token_usage USING (
+    team_id IN (SELECT id FROM teams));
+
+ALTER TABLE token_usage_daily ENABLE ROW LEVEL SECURITY;
+ALTER TABLE token_usage_daily FORCE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS tenant_isolation ON token_usage_daily;
+CREATE POLICY tenant_isolation ON token_usage_daily USING (
+    team_id IN (SELECT id FROM teams));
+
+-- Migration: Admin role for cross-tenant work (tenancy.py, DB_ADMIN_ROLE)
+-- Admin routes, search, jobs and scripts switch to this role, which bypasses the
+-- policies above. Creating a BYPASSRLS role needs a superuser on most servers:
+--   CREATE ROLE tenant_admin NOLOGIN BYPASSRLS; GRANT tenant_admin TO <DB_USER>;
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'tenant_admin') THEN
+        CREATE ROLE tenant_admin NOLOGIN BYPASSRLS;
+        GRANT tenant_admin TO CURRENT_USER;
+    END IF;
+EXCEPTION WHEN insufficient_privilege THEN
+    RAISE WARNING 'Could not create role tenant_admin: create it as a superuser (see migration.sql)';
+END $$;
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'tenant_admin') THEN
+        GRANT SELECT, INSERT, UPDATE, DELETE ON ALL TABLES IN SCHEMA public TO tenant_admin;
+        ALTER DEFAULT PRIVILEGES IN SCHEMA public GRANT SELECT, INSERT, UPDATE, DELETE ON TABLES TO tenant_admin;
+    END IF;
+END $$;
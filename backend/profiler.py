@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter
+from flask import request, jsonify, Response
+from auth import require_admin
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# On-demand statistical profiler for a live worker.
+#
+# POST /admin/profile?seconds=10&interval_ms=10 samples the stacks of every
+# other thread in the worker that serves the request, via
+# sys._current_frames(), then returns them in collapsed-stack format
+# ("frame;frame;frame count" per line), which flamegraph.pl, speedscope and
+# inferno read directly.
+#
+# Only one profile may run at a time across all workers on the host: the run
+# holds an exclusive flock on PROFILE_LOCK_FILE and a concurrent request gets
+# 409 instead of waiting.
+
+PROFILE_LOCK_FILE = os.getenv("PROFILE_LOCK_FILE", "/tmp/tenant-portal-profile.lock")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 60))
+
+_local_lock = threading.Lock()
+
+class ProfileBusy(Exception):
+    pass
+
+class _ProfileGuard:
+    def __enter__(self):
+        if not _local_lock.acquire(blocking=False):
+            raise ProfileBusy()
+        self.lock_file = None
+        if fcntl is not None:
+            self.lock_file = open(PROFILE_LOCK_FILE, 'w')
+            try:
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self.lock_file.close()
+                _local_lock.release()
+                raise ProfileBusy()
+            self.lock_file.write(str(os.getpid()))
+            self.lock_file.flush()
+        return self
+
+    def __exit__(self, *exc):
+        if self.lock_file is not None:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.lock_file.close()
+        _local_lock.release()
+
+def _frame_label(frame):
+    code = frame.f_code
+    filename = os.path.basename(code.co_filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(';', ':')
+
+def sample_stacks(seconds, interval):
+    own_thread = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    stacks = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(thread_id, f"thread-{thread_id}"))
+            stacks[';'.join(reversed(labels))] += 1
+        samples += 1
+        time.sleep(interval)
+
+    return stacks, samples
+
+def collapse(stacks):
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+def init_profiler(app):
+    @app.route('/admin/profile', methods=['POST'])
+    @require_admin
+    def profile_worker():
+        try:
+            seconds = float(request.args.get('seconds', 10))
+            interval = float(request.args.get('interval_ms', 10)) / 1000
+        except ValueError:
+            return jsonify({'error': 'seconds and interval_ms must be numbers'}), 400
+        if not 0 < seconds <= PROFILE_MAX_SECONDS or not 0.001 <= interval <= 1:
+            return jsonify({'error': f'seconds must be in (0, {PROFILE_MAX_SECONDS}] and interval_ms in [1, 1000]'}), 400
+
+        try:
+            with _ProfileGuard():
+                stacks, samples = sample_stacks(seconds, interval)
+        except ProfileBusy:
+            return jsonify({'error': 'A profile is already running'}), 409
+
+        response = Response(collapse(stacks), mimetype='text/plain')
+        response.headers['X-Profile-Samples'] = str(samples)
+        response.headers['X-Profile-Pid'] = str(os.getpid())
+        return response
@@ -0,0 +1,220 @@
+import os
+import math
+import time
+import threading
+from datetime import datetime
+from flask import jsonify
+from retention import HOT_ROWS
+
+# Per-team monthly usage quotas, enforced from in-memory counters.
+#
+# Teams may set monthly_token_quota and/or monthly_cost_quota (NULL means
+# unlimited). Each worker keeps the limits and the current month's running
+# totals for those teams only, so check() on the /api/usage and /auth/login
+# paths is a couple of dict lookups. Counters are seeded from Postgres on
+# first use, bumped locally after every recorded usage event, and reconciled
+# against Postgres every QUOTA_RECONCILE_SECONDS so usage recorded by other
+# workers is picked up. Between reconciles a team can overshoot its quota by
+# at most what the other workers recorded in that window.
+
+QUOTA_RECONCILE_SECONDS = float(os.getenv("QUOTA_RECONCILE_SECONDS", 30))
+
+def invalid_quota(body):
+    # -> error message when a quota field of a team body is neither null nor a
+    # non-negative number (the token quota a whole one), else None
+    tokens = body.get('monthlyTokenQuota')
+    if tokens is not None and (isinstance(tokens, bool) or not isinstance(tokens, int) or tokens < 0):
+        return 'monthlyTokenQuota must be a non-negative integer or null'
+    cost = body.get('monthlyCostQuota')
+    if cost is not None and (isinstance(cost, bool) or not isinstance(cost, (int, float)) or not 0 <= cost < math.inf):
+        return 'monthlyCostQuota must be a non-negative number or null'
+    return None
+
+def month_start(now=None):
+    now = now or datetime.now()
+    return now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def next_month_start(now=None):
+    start = month_start(now)
+    return start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+
+def month_usage(cur, team_ids, start):
+    # -> {team_id: [tokens, cost]} since start, for teams with usage.
+    # Raw rows plus rollups of days already compacted by retention.py.
+    cur.execute(f"""
+        SELECT team_id, COALESCE(SUM(tokens_in + tokens_out), 0), COALESCE(SUM(cost), 0)
+        FROM (
+            SELECT u.team_id, u.tokens_in, u.tokens_out, u.cost
+            FROM token_usage u
+            JOIN teams t ON t.id = u.team_id
+            JOIN tenants n ON n.id = t.tenant_id
+            WHERE u.team_id = ANY(%s) AND u.timestamp >= %s AND {HOT_ROWS}
+            UNION ALL
+            SELECT d.team_id, d.tokens_in, d.tokens_out, d.cost
+            FROM token_usage_daily d
+            JOIN teams t ON t.id = d.team_id
+            JOIN tenants n ON n.id = t.tenant_id
+            WHERE d.team_id = ANY(%s) AND d.day >= %s AND d.day < n.usage_compacted_before
+        ) u
+        GROUP BY team_id
+    """, (team_ids, start, team_ids, start.date()))
+    return {team_id: [int(tokens), float(cost)] for team_id, tokens, cost in cur.fetchall()}
+
+class QuotaManager:
+    def __init__(self, connect, reconcile_interval=QUOTA_RECONCILE_SECONDS):
+        self.connect = connect
+        self.reconcile_interval = reconcile_interval
+        self.lock = threading.Lock()
+        self.pid = None
+        self.month = None
+        # team_id -> (token quota or None, cost quota or None)
+        self.limits = {}
+        # team_id -> [tokens, cost] for the current month
+        self.usage = {}
+        # Increments recorded while a reconcile query is in flight
+        self.pending = None
+
+    # --- Loading ---
+
+    def _ensure_started(self):
+        # Load lazily in each worker: threads and state do not survive gunicorn's fork
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.limits = {}
+            self.usage = {}
+        # The loop starts first so a failed initial load is retried on the
+        # next reconcile instead of leaving this worker without limits
+        threading.Thread(target=self._reconcile_loop, name='quota-reconcile', daemon=True).start()
+        try:
+            self.reconcile()
+        except Exception as e:
+            print(f"Error loading quotas: {e}")
+
+    def _reconcile_loop(self):
+        while True:
+            time.sleep(self.reconcile_interval)
+            try:
+                self.reconcile()
+            except Exception as e:
+                print(f"Error reconciling quotas: {e}")
+
+    def reconcile(self):
+        start = month_start()
+        conn = self.connect()
+        if not conn:
+            return
+        with self.lock:
+            self.pending = {}
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT id, monthly_token_quota, monthly_cost_quota
+                FROM teams
+                WHERE monthly_token_quota IS NOT NULL OR monthly_cost_quota IS NOT NULL
+            """)
+            limits = {row[0]: (row[1], row[2]) for row in cur.fetchall()}
+            usage = {team_id: [0, 0.0] for team_id in limits}
+            if limits:
+                usage.update(month_usage(cur, list(limits), start))
+            cur.close()
+        finally:
+            conn.close()
+
+        with self.lock:
+            for team_id, (tokens, cost) in self.pending.items():
+                if team_id in usage:
+                    usage[team_id][0] += tokens
+                    usage[team_id][1] += cost
+            self.pending = None
+            self.limits = limits
+            self.usage = usage
+            self.month = start
+
+    # --- Hot path ---
+
+    def _roll_month(self):
+        start = month_start()
+        if self.month is not None and start != self.month:
+            with self.lock:
+                if start != self.month:
+                    self.month = start
+                    self.usage = {team_id: [0, 0.0] for team_id in self.limits}
+
+    def check(self, team_id):
+        # Returns None when the team may proceed, else a description of the exceeded quota
+        self._ensure_started()
+        self._roll_month()
+        limit = self.limits.get(team_id)
+        if limit is None:
+            return None
+        token_quota, cost_quota = limit
+        tokens, cost = self.usage.get(team_id, (0, 0.0))
+        if token_quota is not None and tokens >= token_quota:
+            return {'metric': 'tokens', 'limit': token_quota, 'used': tokens}
+        if cost_quota is not None and cost >= cost_quota:
+            return {'metric': 'cost', 'limit': cost_quota, 'used': round(cost, 6)}
+        return None
+
+    def add(self, team_id, tokens, cost):
+        if team_id not in self.limits:
+            return
+        with self.lock:
+            counters = self.usage.setdefault(team_id, [0, 0.0])
+            counters[0] += tokens
+            counters[1] += cost
+            if self.pending is not None:
+                pending = self.pending.setdefault(team_id, [0, 0.0])
+                pending[0] += tokens
+                pending[1] += cost
+
+    def load_team(self, team_id):
+        # Seeds the counters of a team that was not tracked yet from its own
+        # usage only, on top of what add() recorded meanwhile
+        start = month_start()
+        conn = self.connect()
+        if not conn:
+            return
+        try:
+            cur = conn.cursor()
+            tokens, cost = month_usage(cur, [team_id], start).get(team_id, (0, 0.0))
+            cur.close()
+        finally:
+            conn.close()
+        with self.lock:
+            if team_id in self.limits:
+                counters = self.usage.setdefault(team_id, [0, 0.0])
+                counters[0] += tokens
+                counters[1] += cost
+
+    def set_limits(self, team_id, token_quota, cost_quota, new_team=False):
+        # Applied immediately in this worker; other workers pick it up on their next reconcile.
+        # A team created just now has no usage yet, so it is not loaded.
+        self._ensure_started()
+        with self.lock:
+            if token_quota is None and cost_quota is None:
+                self.limits.pop(team_id, None)
+                self.usage.pop(team_id, None)
+                return
+            self.limits[team_id] = (token_quota, cost_quota)
+            tracked = team_id in self.usage
+            self.usage.setdefault(team_id, [0, 0.0])
+        if not tracked and not new_team:
+            self.load_team(team_id)
+
+def quota_exceeded_response(team_id, exceeded):
+    # 429 on every route, like rate limiting; `code` tells the two apart
+    resets_at = next_month_start()
+    response = jsonify({
+        'error': 'Monthly usage quota exceeded',
+        'code': 'quota_exceeded',
+        'teamId': team_id,
+        'quota': exceeded,
+        'resetsAt': resets_at.isoformat(),
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil((resets_at - datetime.now()).total_seconds())))
+    return response
@@ -0,0 +1,211 @@
+import os
+import math
+import time
+import threading
+from collections import OrderedDict
+from flask import jsonify
+
+# Token-bucket admission control per tenant and per team.
+#
+# Limits come from the tenant's settings JSON and apply to the tenant as a
+# whole and to each of its teams separately (rate = requests per second
+# refilled, burst = bucket size):
+#
+#     "rateLimits": {"tenant": {"rate": 50, "burst": 100},
+#                    "team":   {"rate": 10, "burst": 20}}
+#
+# Tenants without settings fall back to RATE_LIMIT_TENANT_* / RATE_LIMIT_TEAM_*
+# (0 = unlimited, the default). Entity -> (tenant, limits) lookups are cached
+# per worker for RATE_LIMIT_CONFIG_TTL seconds, ids that match nothing for
+# RATE_LIMIT_MISS_TTL, in an LRU of RATE_LIMIT_CONFIG_CACHE_SIZE entries, so a
+# flood of made-up ids can neither grow memory nor open connections.
+#
+# A request checked against both the tenant and the team bucket only takes
+# a token when both admit it.
+#
+# RATE_LIMIT_BACKEND selects where bucket state lives:
+#   memory    per worker process; the effective limit is multiplied by the
+#             number of workers
+#   postgres  shared by all workers and hosts, in the UNLOGGED table
+#             rate_limit_buckets; one extra round trip per checked request on
+#             a pooled connection
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_CONFIG_TTL = float(os.getenv("RATE_LIMIT_CONFIG_TTL", 60))
+RATE_LIMIT_MISS_TTL = float(os.getenv("RATE_LIMIT_MISS_TTL", 5))
+RATE_LIMIT_CONFIG_CACHE_SIZE = int(os.getenv("RATE_LIMIT_CONFIG_CACHE_SIZE", 10000))
+DEFAULT_LIMITS = {
+    'tenant': {'rate': float(os.getenv("RATE_LIMIT_TENANT_RATE", 0)), 'burst': float(os.getenv("RATE_LIMIT_TENANT_BURST", 0))},
+    'team': {'rate': float(os.getenv("RATE_LIMIT_TEAM_RATE", 0)), 'burst': float(os.getenv("RATE_LIMIT_TEAM_BURST", 0))},
+}
+
+def _limits_from_settings(settings):
+    configured = (settings or {}).get('rateLimits') or {}
+    limits = {}
+    for scope in ('tenant', 'team'):
+        entry = configured.get(scope) or DEFAULT_LIMITS[scope]
+        rate = float(entry.get('rate') or 0)
+        burst = float(entry.get('burst') or rate)
+        limits[scope] = (rate, max(burst, 1.0)) if rate > 0 else None
+    return limits
+
+# --- Backends ---
+
+class MemoryBackend:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key -> [tokens, last refill (monotonic)]
+        self.buckets = {}
+
+    def acquire(self, requests):
+        # requests: [(key, rate, burst)] -> seconds to wait, or 0 when admitted
+        now = time.monotonic()
+        wait = 0.0
+        with self.lock:
+            buckets = []
+            for key, rate, burst in requests:
+                bucket = self.buckets.get(key)
+                if bucket is None:
+                    bucket = self.buckets[key] = [burst, now]
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+                if bucket[0] < 1:
+                    wait = max(wait, (1 - bucket[0]) / rate)
+                buckets.append(bucket)
+            if wait == 0:
+                for bucket in buckets:
+                    bucket[0] -= 1
+        return wait
+
+# Refills every requested bucket under row locks and takes a token from each
+# only when all of them admit the request. Both statements go in one round
+# trip and run in one implicit transaction.
+ACQUIRE_BUCKETS = """
+    INSERT INTO rate_limit_buckets (key, rate, burst, tokens, allowed, updated_at)
+    SELECT key, rate, burst, burst, TRUE, now() FROM unnest(%(keys)s::varchar[], %(rates)s::float8[], %(bursts)s::float8[]) AS r (key, rate, burst)
+    ON CONFLICT (key) DO NOTHING;
+
+    WITH locked AS (
+        SELECT b.key, r.rate, r.burst,
+               LEAST(r.burst, b.tokens + EXTRACT(EPOCH FROM now() - b.updated_at) * r.rate) AS tokens
+        FROM rate_limit_buckets b
+        JOIN unnest(%(keys)s::varchar[], %(rates)s::float8[], %(bursts)s::float8[]) AS r (key, rate, burst) ON r.key = b.key
+        ORDER BY b.key
+        FOR UPDATE OF b
+    ),
+    decision AS (
+        SELECT bool_and(tokens >= 1) AS admitted FROM locked
+    )
+    UPDATE rate_limit_buckets b SET
+        rate = l.rate,
+        burst = l.burst,
+        tokens = l.tokens - CASE WHEN d.admitted THEN 1 ELSE 0 END,
+        allowed = l.tokens >= 1,
+        updated_at = now()
+    FROM locked l, decision d
+    WHERE b.key = l.key
+    RETURNING b.allowed, b.tokens, b.rate
+"""
+
+class PostgresBackend:
+    def __init__(self, connect):
+        self.connect = connect
+
+    def acquire(self, requests):
+        conn = self.connect()
+        if conn is None:
+            return 0.0 # Fail open: admission control must not take the API down with the database
+        try:
+            conn.autocommit = True
+            cur = conn.cursor()
+            cur.execute(ACQUIRE_BUCKETS, {
+                'keys': [key for key, _, _ in requests],
+                'rates': [rate for _, rate, _ in requests],
+                'bursts': [burst for _, _, burst in requests],
+            })
+            rows = cur.fetchall()
+            cur.close()
+        except Exception as e:
+            print(f"Error checking rate limit: {e}")
+            return 0.0
+        finally:
+            conn.close()
+        wait = 0.0
+        for allowed, tokens, rate in rows:
+            if not allowed:
+                wait = max(wait, (1 - tokens) / rate)
+        return wait
+
+# --- Limiter ---
+
+class RateLimiter:
+    def __init__(self, connect, backend=RATE_LIMIT_BACKEND):
+        self.connect = connect
+        self.backend = PostgresBackend(connect) if backend == 'postgres' else MemoryBackend()
+        self.lock = threading.Lock()
+        # entity id -> (expires, tenant_id, team_id, limits), least recently used first
+        self.config = OrderedDict()
+
+    def _resolve(self, entity_id):
+        now = time.monotonic()
+        with self.lock:
+            cached = self.config.get(entity_id)
+            if cached and cached[0] > now:
+                self.config.move_to_end(entity_id)
+                return cached[1:]
+
+        resolved = (None, None, None)
+        conn = self.connect()
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                    SELECT id, NULL, settings FROM tenants WHERE id = %s
+                    UNION ALL
+                    SELECT n.id, t.id, n.settings FROM teams t JOIN tenants n ON n.id = t.tenant_id WHERE t.id = %s
+                    LIMIT 1
+                """, (entity_id, entity_id))
+                row = cur.fetchone()
+                cur.close()
+                if row:
+                    resolved = (row[0], row[1], _limits_from_settings(row[2]))
+            finally:
+                conn.close()
+
+        ttl = RATE_LIMIT_CONFIG_TTL if resolved[0] else RATE_LIMIT_MISS_TTL
+        with self.lock:
+            self.config[entity_id] = (now + ttl,) + resolved
+            self.config.move_to_end(entity_id)
+            while len(self.config) > RATE_LIMIT_CONFIG_CACHE_SIZE:
+                self.config.popitem(last=False)
+        return resolved
+
+    def check(self, entity_id):
+        # Returns None when admitted, else the number of seconds to wait
+        if not entity_id:
+            return None
+        tenant_id, team_id, limits = self._resolve(entity_id)
+        if not limits:
+            return None
+
+        requests = []
+        if limits['tenant']:
+            requests.append((f"tenant:{tenant_id}",) + limits['tenant'])
+        if team_id and limits['team']:
+            requests.append((f"team:{team_id}",) + limits['team'])
+        if not requests:
+            return None
+
+        wait = self.backend.acquire(requests)
+        return wait if wait > 0 else None
+
+    def invalidate_tenant(self, tenant_id):
+        # Called when tenant settings change so this worker applies new limits at once
+        with self.lock:
+            self.config = OrderedDict((k, v) for k, v in self.config.items() if v[1] != tenant_id)
+
+def rate_limited_response(retry_after):
+    response = jsonify({'error': 'Too many requests', 'code': 'rate_limited', 'retryAfter': round(retry_after, 3)})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
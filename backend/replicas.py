@@ -0,0 +1,158 @@
+import os
+import math
+import time
+import random
+import threading
+import psycopg2
+from flask import request
+from metrics import record_db_connect
+from tenancy import TenantConnection, ConnectionPool
+
+# Read replicas for read-only routes.
+#
+# DB_REPLICA_HOSTS lists streaming standbys (host or host:port) that share
+# DB_NAME, DB_USER and DB_PASSWORD with the primary. Routes that only read
+# call get_read_connection() in server.py, which picks a replica whose replay
+# lag is within REPLICA_MAX_LAG_SECONDS and falls back to the primary when
+# no replica is configured, healthy or reachable. Each worker samples the lag
+# of every replica from a background thread every REPLICA_LAG_CHECK_SECONDS;
+# until the first sample arrives, reads go to the primary.
+#
+# Read-your-writes: a successful write sets a cookie, and requests carrying
+# it read from the primary for READ_YOUR_WRITES_SECONDS, so a client sees its
+# own changes however far the replicas lag behind.
+
+DB_NAME = os.getenv("DB_NAME", "master_admin_db")
+DB_USER = os.getenv("DB_USER", "mobiledevarkatiss")
+DB_PASSWORD = os.getenv("DB_PASSWORD", None)
+DB_PORT = os.getenv("DB_PORT", "5432")
+DB_REPLICA_HOSTS = [host.strip() for host in os.getenv("DB_REPLICA_HOSTS", "").split(",") if host.strip()]
+
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", 5))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv("REPLICA_LAG_CHECK_SECONDS", 2))
+REPLICA_CONNECT_TIMEOUT = int(os.getenv("REPLICA_CONNECT_TIMEOUT", 2))
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", 5))
+READ_YOUR_WRITES_COOKIE = 'read_primary_until'
+
+# Seconds behind the primary, NULL when the standby is not streaming. A caught
+# up standby reports 0 (pg_last_xact_replay_timestamp() stops moving while
+# the primary is idle), but only while its WAL receiver is streaming and has
+# heard from the primary recently: otherwise receive and replay positions
+# agree forever after the link breaks.
+REPLICA_LAG = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (
+            SELECT 1 FROM pg_stat_wal_receiver
+            WHERE status = 'streaming' AND last_msg_receipt_time > now() - make_interval(secs => %s)
+        ) THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+def connect_replica(host, port):
+    start = time.perf_counter()
+    try:
+        return psycopg2.connect(
+            database=DB_NAME,
+            user=DB_USER,
+            host=host,
+            password=DB_PASSWORD,
+            port=port,
+            connect_timeout=REPLICA_CONNECT_TIMEOUT,
+            connection_factory=TenantConnection
+        )
+    except Exception as e:
+        print(f"Error connecting to replica {host}:{port}: {e}")
+        return None
+    finally:
+        record_db_connect(time.perf_counter() - start)
+
+class Replica:
+    def __init__(self, address):
+        host, _, port = address.partition(':')
+        self.name = address
+        self.pool = ConnectionPool(lambda: connect_replica(host, port or DB_PORT))
+        # None until the first check succeeds, and whenever the replica is unreachable
+        self.lag = None
+
+    def check(self):
+        try:
+            conn = self.pool.get()
+        except Exception as e:
+            # Includes a role that bypasses row-level security (tenancy.py)
+            print(f"Error checking replica {self.name}: {e}")
+            conn = None
+        if conn is None:
+            self.lag = None
+            return
+        try:
+            cur = conn.cursor()
+            cur.execute(REPLICA_LAG, (REPLICA_MAX_LAG_SECONDS,))
+            lag = cur.fetchone()[0]
+            self.lag = float(lag) if lag is not None else None
+            cur.close()
+        except Exception as e:
+            print(f"Error checking replica {self.name}: {e}")
+            self.lag = None
+        finally:
+            conn.close()
+
+class ReplicaRouter:
+    def __init__(self, addresses=DB_REPLICA_HOSTS):
+        self.replicas = [Replica(address) for address in addresses]
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def _ensure_started(self):
+        # Monitor threads do not survive gunicorn's fork: start one per worker.
+        # Requests never wait for it; replicas are unused until checked.
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            for replica in self.replicas:
+                replica.lag = None
+        threading.Thread(target=self._monitor_loop, name='replica-lag', daemon=True).start()
+
+    def _monitor_loop(self):
+        while True:
+            for replica in self.replicas:
+                replica.check()
+            time.sleep(REPLICA_LAG_CHECK_SECONDS)
+
+    def sticky(self):
+        # True while this client's last write may not have reached the replicas
+        try:
+            return float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def get(self, tenant_id=None, admin=False):
+        # -> a replica connection, or None when the caller should use the primary
+        if not self.replicas or self.sticky():
+            return None
+        self._ensure_started()
+        candidates = [r for r in self.replicas if r.lag is not None and r.lag <= REPLICA_MAX_LAG_SECONDS]
+        random.shuffle(candidates)
+        for replica in candidates:
+            conn = replica.pool.get(tenant_id, admin)
+            if conn is not None:
+                return conn
+            replica.lag = None # Skipped until the monitor reaches it again
+        return None
+
+def init_replicas(app):
+    router = ReplicaRouter()
+
+    @app.after_request
+    def remember_writes(response):
+        if router.replicas and request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            response.set_cookie(READ_YOUR_WRITES_COOKIE, str(round(time.time() + READ_YOUR_WRITES_SECONDS, 3)),
+                                max_age=math.ceil(READ_YOUR_WRITES_SECONDS), httponly=True, samesite='Lax')
+        return response
+
+    return router
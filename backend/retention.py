@@ -0,0 +1,215 @@
+import os
+import time
+from datetime import date, datetime, timedelta
+import numpy as np
+from psycopg2.extras import execute_values
+
+# Retention and archival for token_usage.
+#
+# Each tenant keeps raw usage rows for usage_retention_days (NULL falls back
+# to USAGE_RETENTION_DAYS, 0 keeps everything). The usage.retention job
+# (tasks.py), which the job workers enqueue daily (JOB_DAILY in jobs.py),
+# walks every tenant and, for each day older than the window that still has
+# raw rows:
+#
+#   1. locks the tenant row, reads the day's raw rows and merges them with
+#      the day's existing archive, if any (rows that arrived late for an
+#      archived day)
+#   2. writes the merged rows to a compressed columnar archive
+#      USAGE_ARCHIVE_DIR/<tenant>/<YYYY-MM>/<YYYY-MM-DD>.npz
+#   3. in the same transaction, replaces the day's rollups in
+#      token_usage_daily with the merged totals and advances
+#      tenants.usage_compacted_before past the day
+#   4. deletes the raw ids from token_usage in small committed batches with
+#      a pause in between, so ingestion is never blocked
+#
+# The row lock (NO KEY UPDATE, so inserts referencing the tenant go on)
+# serializes steps 1-3 with the members.scrub_usage job, which rewrites
+# archives too.
+#
+# usage_compacted_before is the only switch readers look at: days before it
+# come from the rollups (or the archives), later days from raw rows, and raw
+# rows before it are ignored whether or not step 4 has removed them yet, and
+# rows that arrive late for a compacted day count once the next run has
+# folded them in. A job that dies between steps 2 and 3 leaves an archive the
+# next run merges again by id; readers skip archives at or after the cutoff.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+USAGE_ARCHIVE_DIR = os.getenv("USAGE_ARCHIVE_DIR", os.path.join(BASE_DIR, 'archive', 'usage'))
+USAGE_RETENTION_DAYS = int(os.getenv("USAGE_RETENTION_DAYS", 0))
+RETENTION_DELETE_BATCH_SIZE = int(os.getenv("RETENTION_DELETE_BATCH_SIZE", 2000))
+RETENTION_DELETE_PAUSE_SECONDS = float(os.getenv("RETENTION_DELETE_PAUSE_SECONDS", 0.1))
+
+ARCHIVE_COLUMNS = ('id', 'team_id', 'email', 'model', 'tokens_in', 'tokens_out', 'cost', 'timestamp')
+
+# Raw rows before the cutoff are already in the rollups (and may still be
+# waiting for deletion); use in a WHERE clause with tenants aliased n
+HOT_ROWS = "(n.usage_compacted_before IS NULL OR u.timestamp >= n.usage_compacted_before)"
+
+# Raw rows plus compacted rollups as one relation with the token_usage
+# columns the aggregates use. Bind the tenant id twice.
+USAGE_SOURCES = f"""
+    SELECT u.team_id, u.email, u.tokens_in, u.tokens_out, u.cost
+    FROM token_usage u
+    JOIN teams t ON t.id = u.team_id
+    JOIN tenants n ON n.id = t.tenant_id
+    WHERE t.tenant_id = %s AND {HOT_ROWS}
+    UNION ALL
+    SELECT d.team_id, d.email, d.tokens_in, d.tokens_out, d.cost
+    FROM token_usage_daily d
+    JOIN teams t ON t.id = d.team_id
+    JOIN tenants n ON n.id = t.tenant_id
+    WHERE t.tenant_id = %s AND d.day < n.usage_compacted_before
+"""
+
+def effective_retention(days):
+    return USAGE_RETENTION_DAYS if days is None else days
+
+def tenant_archive_dir(tenant_id):
+    return os.path.join(USAGE_ARCHIVE_DIR, tenant_id)
+
+def archive_path(tenant_id, day):
+    return os.path.join(tenant_archive_dir(tenant_id), day.strftime('%Y-%m'), f"{day.isoformat()}.npz")
+
+# --- Archive files ---
+
+def write_archive(path, rows):
+    columns = list(zip(*rows)) if rows else [()] * len(ARCHIVE_COLUMNS)
+    ids, team_ids, emails, models, tokens_in, tokens_out, costs, timestamps = columns
+    arrays = {
+        'id': np.array(ids, dtype=str),
+        'team_id': np.array(team_ids, dtype=str),
+        'email': np.array([e or '' for e in emails], dtype=str),
+        'model': np.array([m or '' for m in models], dtype=str),
+        'tokens_in': np.array([v or 0 for v in tokens_in], dtype=np.int64),
+        'tokens_out': np.array([v or 0 for v in tokens_out], dtype=np.int64),
+        'cost': np.array([v or 0.0 for v in costs], dtype=np.float64),
+        'timestamp': np.array(timestamps, dtype='datetime64[ms]'),
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def read_archive(path, columns=ARCHIVE_COLUMNS):
+    with np.load(path) as data:
+        return {name: data[name] for name in columns}
+
+def archive_rows(path):
+    # -> rows in ARCHIVE_COLUMNS order, as read from token_usage
+    data = read_archive(path)
+    columns = {name: data[name].tolist() for name in ARCHIVE_COLUMNS}
+    for name in ('email', 'model'):
+        # write_archive stores NULL as ''
+        columns[name] = [value or None for value in columns[name]]
+    return list(zip(*(columns[name] for name in ARCHIVE_COLUMNS)))
+
+def scrub_archive(path, team_id, emails, before):
+    # Replaces emails ({old: replacement or None}) on the team's rows recorded
+    # before `before`; -> the team's rows after the rewrite
+    rows = []
+    changed = False
+    for row in archive_rows(path):
+        if row[1] == team_id and row[2] in emails and row[7] < before:
+            row = row[:2] + (emails[row[2]],) + row[3:]
+            changed = True
+        rows.append(row)
+    if changed:
+        write_archive(path, rows)
+    return [row for row in rows if row[1] == team_id]
+
+def archive_day(path):
+    # <YYYY-MM-DD>.npz -> date
+    return date.fromisoformat(os.path.basename(path)[:-len('.npz')])
+
+# --- Compaction ---
+
+def delete_ids(conn, ids, progress=None):
+    cur = conn.cursor()
+    deleted = 0
+    for start in range(0, len(ids), RETENTION_DELETE_BATCH_SIZE):
+        cur.execute("DELETE FROM token_usage WHERE id = ANY(%s)", (list(ids[start:start + RETENTION_DELETE_BATCH_SIZE]),))
+        deleted += cur.rowcount
+        conn.commit()
+        if progress:
+            progress(deleted)
+        time.sleep(RETENTION_DELETE_PAUSE_SECONDS)
+    cur.close()
+    return deleted
+
+def rollup_rows(rows, day):
+    totals = {}
+    for _, team_id, email, _, tokens_in, tokens_out, cost, _ in rows:
+        entry = totals.setdefault((team_id, email), [0, 0, 0.0, 0])
+        entry[0] += tokens_in or 0
+        entry[1] += tokens_out or 0
+        entry[2] += cost or 0.0
+        entry[3] += 1
+    return [(team_id, day, email, *entry) for (team_id, email), entry in totals.items()]
+
+def compact_day(conn, tenant_id, team_ids, day, progress=None):
+    path = archive_path(tenant_id, day)
+    start = datetime.combine(day, datetime.min.time())
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM tenants WHERE id = %s FOR NO KEY UPDATE", (tenant_id,))
+    cur.execute(f"""
+        SELECT {', '.join(ARCHIVE_COLUMNS)}
+        FROM token_usage
+        WHERE team_id = ANY(%s) AND timestamp >= %s AND timestamp < %s
+    """, (team_ids, start, start + timedelta(days=1)))
+    raw = cur.fetchall()
+
+    rows = archive_rows(path) if os.path.exists(path) else []
+    archived = {row[0] for row in rows}
+    late = [row for row in raw if row[0] not in archived]
+    if late or not rows:
+        rows += late
+        write_archive(path, rows)
+
+    # Rollups and cutoff switch together, so readers never see the day in
+    # both or in neither; the transaction has held the tenant lock since the read
+    rollups = rollup_rows(rows, day)
+    cur.execute("DELETE FROM token_usage_daily WHERE team_id = ANY(%s) AND day = %s", (team_ids, day))
+    if rollups:
+        execute_values(cur, """
+            INSERT INTO token_usage_daily (team_id, day, email, tokens_in, tokens_out, cost, events) VALUES %s
+        """, rollups)
+    cur.execute("""
+        UPDATE tenants SET usage_compacted_before = GREATEST(usage_compacted_before, %s) WHERE id = %s
+    """, (day + timedelta(days=1), tenant_id))
+    conn.commit()
+    cur.close()
+
+    deleted = delete_ids(conn, [row[0] for row in raw], progress)
+    return len(rollups), deleted
+
+def compact_tenant(conn, tenant_id, retention_days, progress=None):
+    cutoff = date.today() - timedelta(days=retention_days)
+    cur = conn.cursor()
+    cur.execute("SELECT id FROM teams WHERE tenant_id = %s", (tenant_id,))
+    team_ids = [row[0] for row in cur.fetchall()]
+    days = []
+    if team_ids:
+        cur.execute("""
+            SELECT DISTINCT timestamp::date FROM token_usage
+            WHERE team_id = ANY(%s) AND timestamp < %s
+            ORDER BY 1
+        """, (team_ids, cutoff))
+        days = [row[0] for row in cur.fetchall()]
+    conn.commit()
+    cur.close()
+
+    stats = {'days': 0, 'rollups': 0, 'deleted': 0}
+    for day in days:
+        # progress(day, rows deleted so far) runs after every delete batch
+        rolled, deleted = compact_day(conn, tenant_id, team_ids, day,
+                                      (lambda rows: progress(day, rows)) if progress else None)
+        stats['days'] += 1
+        stats['rollups'] += rolled
+        stats['deleted'] += deleted
+        if progress:
+            progress(day, deleted)
+    return stats
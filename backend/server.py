@@ -4,16 +4,37 @@ from dotenv import load_dotenv
 load_dotenv()
 import json
 import time
-import random
-import string
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import execute_values
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from datetime import datetime
+from serialization import init_json
+from ids import generate_id, generate_ids, generate_key
+from metrics import init_metrics, record_db_connect
+from tracing import init_tracing
+from profiler import init_profiler
+from auth import ADMIN_TOKEN
+from quotas import QuotaManager, quota_exceeded_response, invalid_quota
+from ratelimit import RateLimiter, rate_limited_response
+from jobs import init_jobs, enqueue
+from retention import USAGE_SOURCES, HOT_ROWS
+from analytics import init_analytics
+from search import init_search
+from softdelete import init_soft_delete
+from tenancy import TenantConnection, ConnectionPool, request_tenant_id
+from replicas import init_replicas
+from counters import members_added, members_removed, usage_added
+from bulk import BULK_MEMBER_LIMIT, BULK_PROVISION_LIMIT, emails_from_request, classify_emails, items_from_request, missing_fields
+from mappers import TENANT, TEAM, FILE, FILE_WITH_CONTENT, MEMBER, TEAM_USAGE, USER_USAGE
 
 app = Flask(__name__)
-CORS(app)
+# X-Total-Count: total rows of paginated lists (GET /tenants)
+CORS(app, expose_headers=['X-Total-Count'])
+init_json(app)
+init_metrics(app)
+init_tracing(app)
+init_profiler(app)
 
 DB_NAME = os.getenv("DB_NAME", "master_admin_db")
 DB_USER = os.getenv("DB_USER", "mobiledevarkatiss")
@@ -22,22 +43,66 @@ DB_PASSWORD = os.getenv("DB_PASSWORD", None)
 DB_PORT = os.getenv("DB_PORT", "5432")
 
 # --- Helpers ---
-def get_db_connection():
+def open_db_connection():
+    start = time.perf_counter()
     try:
         conn = psycopg2.connect(
             database=DB_NAME,
             user=DB_USER,
             host=DB_HOST,
             password=DB_PASSWORD,
-            port=DB_PORT
+            port=DB_PORT,
+            connection_factory=TenantConnection
         )
         return conn
     except Exception as e:
         print(f"Error connecting to database: {e}")
         return None
+    finally:
+        record_db_connect(time.perf_counter() - start)
 
-def generate_id(prefix):
-    return f"{prefix}_" + ''.join(random.choices(string.ascii_lowercase + string.digits, k=8))
+db_pool = ConnectionPool(open_db_connection)
+
+def check_database():
+    # Raises when the role bypasses row-level security or the admin role is
+    # missing (tenancy.py). Called once per worker process after the fork
+    # (gunicorn.conf.py), never at import: a preloading master must not hold
+    # a connection its workers would inherit. When the database is down the
+    # check runs on the first connection instead.
+    conn = db_pool.get()
+    if conn:
+        conn.close()
+
+def get_db_connection(admin=False):
+    # Connections of /tenants/<id>/... requests only see that tenant's rows;
+    # cross-tenant routes pass admin=True, anything else sees no rows (tenancy.py)
+    return db_pool.get(request_tenant_id(), admin)
+
+replicas = init_replicas(app)
+
+def get_read_connection(admin=False):
+    # Read-only routes: a replica within the lag limit, else the primary (replicas.py)
+    return replicas.get(request_tenant_id(), admin) or get_db_connection(admin)
+
+def get_admin_connection():
+    return db_pool.get(admin=True)
+
+# Cross-tenant caches and admin routes use admin connections
+quotas = QuotaManager(get_admin_connection)
+rate_limiter = RateLimiter(get_admin_connection)
+init_jobs(app, get_admin_connection)
+init_analytics(app, get_read_connection)
+init_search(app, get_read_connection)
+deleted_tenants = init_soft_delete(app, get_admin_connection)
+
+OVERVIEW_RECENT_FILES = int(os.getenv("OVERVIEW_RECENT_FILES", 10))
+TENANT_PAGE_MAX = int(os.getenv("TENANT_PAGE_MAX", 1000))
+
+# GET /tenants sort keys; the stat sorts need include=stats
+TENANT_SORTS = {'name': 'lower(name)', 'createdAt': 'created_at', 'status': 'status',
+                'teamCount': 'team_count', 'memberCount': 'member_count', 'cost30d': 'cost_30d'}
+TENANT_STAT_SORTS = ('team_count', 'member_count', 'cost_30d')
+MEMBER_USAGE_MODES = ('keep', 'purge', 'anonymize')
 
 # --- Routes ---
 
@@ -57,7 +122,7 @@ def health_check():
 def login_admin():
     body = request.json
     if body.get('username') == 'admin' and body.get('password') == 'admin123':
-        return jsonify({'success': True, 'token': 'mock_admin_token', 'user': {'id': 'admin', 'name': 'Master Admin'}})
+        return jsonify({'success': True, 'token': ADMIN_TOKEN, 'user': {'id': 'admin', 'name': 'Master Admin'}})
     return jsonify({'error': 'Invalid credentials'}), 401
 
 @app.route('/login/tenant', methods=['POST'])
@@ -65,19 +130,24 @@ def login_tenant():
     body = request.json
     tenant_id = body.get('tenantId')
     
-    conn = get_db_connection()
+    retry_after = rate_limiter.check(tenant_id)
+    if retry_after:
+        return rate_limited_response(retry_after)
+    
+    conn = get_db_connection(admin=True)
     if not conn:
         return jsonify({'error': 'Database connection failed'}), 500
         
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute("SELECT * FROM tenants WHERE id = %s", (tenant_id,))
-    tenant = cur.fetchone()
+    cur = conn.cursor()
+    cur.execute("SELECT id, name, status FROM tenants WHERE id = %s AND deleted_at IS NULL", (tenant_id,))
+    row = cur.fetchone()
     cur.close()
     conn.close()
     
-    if not tenant:
+    if not row:
         return jsonify({'error': 'Invalid tenant ID'}), 401
     
+    tenant = dict(zip(('id', 'name', 'status'), row))
     if tenant['status'] == 'disabled':
         return jsonify({'error': 'Account is disabled'}), 403
         
@@ -89,15 +159,20 @@ def login_sso():
     body = request.json
     entity_id = body.get('tenantId') # Reuse tenantId field for both
     
-    conn = get_db_connection()
+    retry_after = rate_limiter.check(entity_id)
+    if retry_after:
+        return rate_limited_response(retry_after)
+    
+    conn = get_db_connection(admin=True)
     if not conn:
         return jsonify({'error': 'Database error'}), 500
         
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur = conn.cursor()
     
     # Check if it is a Tenant
-    cur.execute("SELECT * FROM tenants WHERE id = %s", (entity_id,))
-    tenant = cur.fetchone()
+    cur.execute(f"SELECT {TENANT.columns} FROM tenants WHERE id = %s AND deleted_at IS NULL", (entity_id,))
+    row = cur.fetchone()
+    tenant = TENANT.map_row(row) if row else None
     
     if tenant:
         cur.close()
@@ -118,15 +193,23 @@ def login_sso():
         })
 
     # Check if it is a Team
-    cur.execute("SELECT * FROM teams WHERE id = %s", (entity_id,))
-    found_team = cur.fetchone()
+    cur.execute(f"""
+        SELECT {TEAM.columns} FROM teams
+        WHERE id = %s AND tenant_id IN (SELECT id FROM tenants WHERE deleted_at IS NULL)
+    """, (entity_id,))
+    row = cur.fetchone()
+    found_team = TEAM.map_row(row) if row else None
     cur.close()
     conn.close()
             
     if found_team:
         # Validate Team Key
-        if found_team.get('team_key') != body.get('apiKey'):
+        if found_team['teamKey'] != body.get('apiKey'):
              return jsonify({'error': 'Invalid Team Key'}), 401
+
+        exceeded = quotas.check(found_team['id'])
+        if exceeded:
+            return quota_exceeded_response(found_team['id'], exceeded)
              
         # Return team info AND LLM Config
         return jsonify({
@@ -136,7 +219,7 @@ def login_sso():
             'user': {'id': found_team['id'], 'name': found_team['name']},
             'config': {
                 'apiProvider': found_team['provider'],
-                'apiKey': found_team.get('api_key'), # This is the LLM Provider API Key
+                'apiKey': found_team['apiKey'], # This is the LLM Provider API Key
                 'apiModelId': found_team.get('model')
             },
             'styles': found_team.get('styles', {})
@@ -146,21 +229,82 @@ def login_sso():
 
 @app.route('/tenants', methods=['GET'])
 def get_tenants():
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute("SELECT * FROM tenants")
-    tenants = cur.fetchall()
+    # ?status=active&q=acm&sort=-cost30d&limit=50&offset=0&include=stats
+    # The total before pagination is returned in X-Total-Count.
+    include_stats = 'stats' in request.args.get('include', '').split(',')
+    sort = request.args.get('sort', 'name')
+    column = TENANT_SORTS.get(sort.lstrip('-'))
+    if column is None or (column in TENANT_STAT_SORTS and not include_stats):
+        return jsonify({'error': f'Invalid sort: {sort}'}), 400
+    limit = request.args.get('limit', type=int)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    if limit is not None:
+        limit = max(1, min(limit, TENANT_PAGE_MAX))
+
+    where = ["n.deleted_at IS NULL"]
+    params = []
+    if request.args.get('status'):
+        where.append("n.status = %s")
+        params.append(request.args['status'])
+    if request.args.get('q'):
+        # Prefix match served by idx_tenants_name_prefix
+        prefix = request.args['q'].lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        where.append("lower(n.name) LIKE %s")
+        params.append(prefix + '%')
+
+    # Stats are computed in the outer query, so only for the returned page
+    # unless the sort needs them
+    stats = ''
+    if include_stats:
+        stats = f""",
+            (SELECT COUNT(*) FROM teams t WHERE t.tenant_id = n.id) AS team_count,
+            (SELECT COALESCE(SUM(t.member_count), 0) FROM teams t WHERE t.tenant_id = n.id) AS member_count,
+            (SELECT COALESCE(SUM(u.cost), 0) FROM token_usage u JOIN teams t ON t.id = u.team_id
+             WHERE t.tenant_id = n.id AND u.timestamp >= now() - interval '30 days' AND {HOT_ROWS})
+            + (SELECT COALESCE(SUM(d.cost), 0) FROM token_usage_daily d JOIN teams t ON t.id = d.team_id
+               WHERE t.tenant_id = n.id AND d.day >= current_date - 30 AND d.day < n.usage_compacted_before) AS cost_30d"""
+
+    pagination = ''
+    if limit is not None:
+        pagination = "LIMIT %s OFFSET %s"
+        params += [limit, offset]
+
+    # The count is joined to the page rather than read from it, so a page past
+    # the end still reports the total (one row of NULLs carrying it)
+    order = f"ORDER BY {column} {'DESC' if sort.startswith('-') else 'ASC'}, id"
+    conn = get_read_connection(admin=True)
+    cur = conn.cursor()
+    cur.execute(f"""
+        WITH matching AS (
+            SELECT {TENANT.columns}, usage_compacted_before
+            FROM tenants n
+            WHERE {' AND '.join(where)}
+        ), page AS (
+            SELECT n.*{stats}
+            FROM matching n
+            {order}
+            {pagination}
+        )
+        SELECT page.*, total.count
+        FROM (SELECT COUNT(*) FROM matching) total
+        LEFT JOIN page ON true
+        {order}
+    """, tuple(params))
+    rows = cur.fetchall()
     cur.close()
     conn.close()
-    
-    # Fix datetime serialization for JSON
-    for t in tenants:
-        if t['created_at']:
-            t['createdAt'] = t.pop('created_at').isoformat()
-        if t['api_key']:
-            t['apiKey'] = t.pop('api_key')
-            
-    return jsonify(tenants)
+
+    total = rows[0][-1]
+    rows = [row for row in rows if row[0] is not None]
+    tenants = TENANT.map_rows(rows)
+    width = len(TENANT.keys)
+    if include_stats:
+        for tenant, row in zip(tenants, rows):
+            tenant['teamCount'], tenant['memberCount'], tenant['cost30d'] = row[width + 1:width + 4]
+
+    response = jsonify(tenants)
+    response.headers['X-Total-Count'] = str(total)
+    return response
 
 @app.route('/tenants', methods=['POST'])
 def create_tenant():
@@ -169,36 +313,68 @@ def create_tenant():
         return jsonify({'error': 'Name required'}), 400
         
     new_id = generate_id('tnt')
-    new_api_key = generate_id('ak')
+    new_api_key = generate_key('ak')
     created_at = datetime.now()
     
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute("""
+    conn = get_db_connection(admin=True)
+    cur = conn.cursor()
+    cur.execute(f"""
         INSERT INTO tenants (id, name, status, created_at, api_key, provider, model, llm_api_key, settings)
-        VALUES (%s, %s, 'active', %s, %s, %s, %s, %s, '{}')
-        RETURNING *
+        VALUES (%s, %s, 'active', %s, %s, %s, %s, %s, '{{}}')
+        RETURNING {TENANT.columns}
     """, (new_id, name, created_at, new_api_key, 
           request.json.get('provider', 'gemini'),
           request.json.get('model', 'gemini-2.0-flash-001'),
           request.json.get('apiKey')
     ))
-    new_tenant = cur.fetchone()
+    new_tenant = TENANT.map_row(cur.fetchone())
     conn.commit()
     cur.close()
     conn.close()
     
-    # Format for response
-    new_tenant['createdAt'] = new_tenant.pop('created_at').isoformat()
-    new_tenant['apiKey'] = new_tenant.pop('api_key')
-    
     return jsonify(new_tenant)
 
+@app.route('/tenants/bulk', methods=['POST'])
+def create_tenants_bulk():
+    items = items_from_request(request, 'tenants')
+    if items is None:
+        return jsonify({'error': 'Provide a list of tenants'}), 400
+    if len(items) > BULK_PROVISION_LIMIT:
+        return jsonify({'error': f'At most {BULK_PROVISION_LIMIT} tenants per request'}), 413
+    errors = missing_fields(items, ('name',))
+    if errors:
+        return jsonify({'error': 'Invalid tenants', 'details': errors}), 400
+    if not items:
+        return jsonify([])
+
+    created_at = datetime.now()
+    ids = generate_ids('tnt', len(items))
+    rows = [(new_id, item['name'], created_at, generate_key('ak'),
+             item.get('provider', 'gemini'), item.get('model', 'gemini-2.0-flash-001'), item.get('apiKey'))
+            for new_id, item in zip(ids, items)]
+
+    conn = get_db_connection(admin=True)
+    if not conn:
+        return jsonify({'error': 'Database error'}), 500
+    # A single multi-row INSERT is atomic on its own; autocommit saves the COMMIT round trip
+    conn.autocommit = True
+    cur = conn.cursor()
+    returned = execute_values(cur, f"""
+        INSERT INTO tenants (id, name, status, created_at, api_key, provider, model, llm_api_key, settings)
+        VALUES %s
+        RETURNING {TENANT.columns}
+    """, rows, template="(%s, %s, 'active', %s, %s, %s, %s, %s, '{}')", page_size=len(rows), fetch=True)
+    cur.close()
+    conn.close()
+
+    by_id = {tenant['id']: tenant for tenant in TENANT.map_rows(returned)}
+    return jsonify([by_id[new_id] for new_id in ids])
+
 @app.route('/tenants/<id>', methods=['PATCH'])
 def update_tenant(id):
     body = request.json
     conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur = conn.cursor()
     
     fields = []
     values = []
@@ -221,6 +397,14 @@ def update_tenant(id):
     if 'settings' in body:
         fields.append("settings = %s")
         values.append(json.dumps(body['settings']))
+    if 'usageRetentionDays' in body:
+        days = body['usageRetentionDays']
+        if days is not None and (not isinstance(days, int) or days < 0):
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'usageRetentionDays must be a non-negative integer or null'}), 400
+        fields.append("usage_retention_days = %s")
+        values.append(days)
         
     if not fields:
         cur.close()
@@ -228,18 +412,19 @@ def update_tenant(id):
         return jsonify({'error': 'No fields to update'}), 400
         
     values.append(id)
-    cur.execute(f"UPDATE tenants SET {', '.join(fields)} WHERE id = %s RETURNING *", tuple(values))
-    tenant = cur.fetchone()
+    cur.execute(f"UPDATE tenants SET {', '.join(fields)} WHERE id = %s RETURNING {TENANT.columns}", tuple(values))
+    row = cur.fetchone()
     conn.commit()
     cur.close()
     conn.close()
     
-    if not tenant:
+    if not row:
         return jsonify({'error': 'Not found'}), 404
     
-    tenant['createdAt'] = tenant.pop('created_at').isoformat()
-    tenant['apiKey'] = tenant.pop('api_key')
-    return jsonify(tenant)
+    if 'settings' in body:
+        rate_limiter.invalidate_tenant(id)
+    
+    return jsonify(TENANT.map_row(row))
 
 @app.route('/tenants/<id>/status', methods=['PATCH'])
 def update_tenant_status(id):
@@ -248,52 +433,115 @@ def update_tenant_status(id):
         return jsonify({'error': 'Invalid status'}), 400
         
     conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur = conn.cursor()
     
-    cur.execute("UPDATE tenants SET status = %s WHERE id = %s RETURNING *", (status, id))
-    tenant = cur.fetchone()
+    cur.execute(f"UPDATE tenants SET status = %s WHERE id = %s RETURNING {TENANT.columns}", (status, id))
+    row = cur.fetchone()
     conn.commit()
     cur.close()
     conn.close()
     
-    if not tenant:
+    if not row:
         return jsonify({'error': 'Not found'}), 404
     
-    tenant['createdAt'] = tenant.pop('created_at').isoformat()
-    tenant['apiKey'] = tenant.pop('api_key')
-    return jsonify(tenant)
+    return jsonify(TENANT.map_row(row))
 
 @app.route('/tenants/<id>', methods=['GET'])
 def get_tenant(id):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute("SELECT * FROM tenants WHERE id = %s", (id,))
-    tenant = cur.fetchone()
+    conn = get_read_connection()
+    cur = conn.cursor()
+    cur.execute(f"SELECT {TENANT.columns} FROM tenants WHERE id = %s", (id,))
+    row = cur.fetchone()
     cur.close()
     conn.close()
     
-    if not tenant:
+    if not row:
         return jsonify({'error': 'Not found'}), 404
         
-    tenant['createdAt'] = tenant.pop('created_at').isoformat()
-    tenant['apiKey'] = tenant.pop('api_key')
-    return jsonify(tenant)
+    return jsonify(TENANT.map_row(row))
+
+@app.route('/tenants/<id>/overview', methods=['GET'])
+def get_tenant_overview(id):
+    # Everything the tenant dashboard shows, as one statement on one connection:
+    # each part is aggregated to JSON in its own scalar subquery
+    conn = get_read_connection()
+    if not conn:
+        return jsonify({'error': 'Database error'}), 500
+    cur = conn.cursor()
+    cur.execute(f"""
+        WITH usage AS ({USAGE_SOURCES})
+        SELECT
+            (SELECT row_to_json(x) FROM (SELECT {TENANT.columns} FROM tenants WHERE id = %s) x),
+            (SELECT COALESCE(json_agg(x ORDER BY x.created_at), '[]') FROM (
+                SELECT {TEAM.columns} FROM teams WHERE tenant_id = %s
+            ) x),
+            (SELECT json_build_object('count', COUNT(*), 'totalSize', COALESCE(SUM(size), 0), 'lastUploadedAt', MAX(uploaded_at))
+             FROM files WHERE tenant_id = %s),
+            (SELECT COALESCE(json_agg(x ORDER BY x.uploaded_at DESC), '[]') FROM (
+                SELECT {FILE.columns} FROM files WHERE tenant_id = %s ORDER BY uploaded_at DESC LIMIT %s
+            ) x),
+            (SELECT COALESCE(json_agg(x), '[]') FROM (
+                SELECT {TEAM_USAGE.columns}
+                FROM teams t
+                LEFT JOIN usage u ON t.id = u.team_id
+                WHERE t.tenant_id = %s
+                GROUP BY t.id, t.name
+            ) x),
+            (SELECT COALESCE(json_agg(x ORDER BY x.total_cost DESC), '[]') FROM (
+                SELECT {USER_USAGE.columns}
+                FROM usage u
+                JOIN teams t ON u.team_id = t.id
+                WHERE u.email IS NOT NULL
+                GROUP BY u.email, t.name
+                ORDER BY total_cost DESC
+                LIMIT 10
+            ) x)
+    """, (id, id, id, id, id, id, OVERVIEW_RECENT_FILES, id))
+    tenant, teams, file_summary, recent_files, team_usage, user_usage = cur.fetchone()
+    cur.close()
+    conn.close()
+
+    if not tenant:
+        return jsonify({'error': 'Not found'}), 404
+
+    return jsonify({
+        'tenant': TENANT.map_records([tenant])[0],
+        'teams': TEAM.map_records(teams),
+        'files': {**file_summary, 'recent': FILE.map_records(recent_files)},
+        'usage': {
+            'teamUsage': TEAM_USAGE.map_records(team_usage),
+            'userUsage': USER_USAGE.map_records(user_usage),
+        },
+    })
+
+@app.route('/tenants/<id>', methods=['DELETE'])
+def delete_tenant(id):
+    # Tenants can own millions of rows: the tenant is hidden at once
+    # (softdelete.py) and its rows are purged by a background job
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("UPDATE tenants SET deleted_at = now() WHERE id = %s AND deleted_at IS NULL RETURNING id", (id,))
+    deleted = cur.fetchone()
+    cur.close()
+    if not deleted:
+        conn.close()
+        return jsonify({'error': 'Not found'}), 404
+
+    job = enqueue(conn, 'tenant.delete', {'tenantId': id})
+    conn.commit()
+    conn.close()
+    deleted_tenants.add(id)
+    return jsonify(job), 202
 
 @app.route('/tenants/<id>/files', methods=['GET'])
 def get_files(id):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute("SELECT * FROM files WHERE tenant_id = %s ORDER BY uploaded_at DESC", (id,))
-    files = cur.fetchall()
+    conn = get_read_connection()
+    cur = conn.cursor()
+    cur.execute(f"SELECT {FILE.columns} FROM files WHERE tenant_id = %s ORDER BY uploaded_at DESC", (id,))
+    files = FILE.map_rows(cur.fetchall())
     cur.close()
     conn.close()
     
-    for f in files:
-        if f['uploaded_at']:
-            f['uploadedAt'] = f.pop('uploaded_at').isoformat()
-        if 'tenant_id' in f:
-            del f['tenant_id'] # Don't need to return this redundancy
-            
     return jsonify(files)
 
 @app.route('/tenants/<id>/branding', methods=['PATCH'])
@@ -303,7 +551,7 @@ def update_tenant_branding(id):
     font = body.get('font')
     
     conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur = conn.cursor()
     
     # First get current settings
     cur.execute("SELECT settings FROM tenants WHERE id = %s", (id,))
@@ -313,39 +561,30 @@ def update_tenant_branding(id):
         conn.close()
         return jsonify({'error': 'Not found'}), 404
         
-    settings = result['settings'] or {}
+    settings = result[0] or {}
     
     if color:
         settings['brandColor'] = color
     if font:
         settings['font'] = font
         
-    cur.execute("UPDATE tenants SET settings = %s WHERE id = %s RETURNING *", (json.dumps(settings), id))
-    tenant = cur.fetchone()
+    cur.execute(f"UPDATE tenants SET settings = %s WHERE id = %s RETURNING {TENANT.columns}", (json.dumps(settings), id))
+    tenant = TENANT.map_row(cur.fetchone())
     conn.commit()
     cur.close()
     conn.close()
     
-    tenant['createdAt'] = tenant.pop('created_at').isoformat()
-    tenant['apiKey'] = tenant.pop('api_key')
     return jsonify(tenant)
 
 @app.route('/tenants/<id>/teams', methods=['GET'])
 def get_teams(id):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute("SELECT * FROM teams WHERE tenant_id = %s", (id,))
-    teams = cur.fetchall()
+    conn = get_read_connection()
+    cur = conn.cursor()
+    cur.execute(f"SELECT {TEAM.columns} FROM teams WHERE tenant_id = %s", (id,))
+    teams = TEAM.map_rows(cur.fetchall())
     cur.close()
     conn.close()
     
-    for t in teams:
-        if t['created_at']:
-            t['createdAt'] = t.pop('created_at').isoformat()
-        t['apiKey'] = t.pop('api_key')
-        t['teamKey'] = t.pop('team_key')
-        del t['tenant_id']
-        
     return jsonify(teams)
 
 @app.route('/tenants/<id>/teams', methods=['POST'])
@@ -353,16 +592,19 @@ def create_team(id):
     body = request.json
     if not body.get('name') or not body.get('provider'):
         return jsonify({'error': 'Name and Provider required'}), 400
+    quota_error = invalid_quota(body)
+    if quota_error:
+        return jsonify({'error': quota_error}), 400
 
     new_id = generate_id('team')
-    team_key = generate_id('tkey')
+    team_key = generate_key('tkey')
     created_at = datetime.now()
     
     conn = get_db_connection()
     if not conn:
         return jsonify({'error': 'Database error'}), 500
         
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur = conn.cursor()
     
     # Ensure tenant exists
     cur.execute("SELECT 1 FROM tenants WHERE id = %s", (id,))
@@ -371,10 +613,11 @@ def create_team(id):
         conn.close()
         return jsonify({'error': 'Tenant Not Found'}), 404
     
-    cur.execute("""
-        INSERT INTO teams (id, tenant_id, name, provider, api_key, team_key, model, created_at, styles)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, '{}')
-        RETURNING *
+    cur.execute(f"""
+        INSERT INTO teams (id, tenant_id, name, provider, api_key, team_key, model, created_at, styles,
+                           monthly_token_quota, monthly_cost_quota)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, '{{}}', %s, %s)
+        RETURNING {TEAM.columns}
     """, (
         new_id, 
         id, 
@@ -383,28 +626,81 @@ def create_team(id):
         body.get('apiKey'), 
         team_key, 
         body.get('model', 'default'), 
-        created_at
+        created_at,
+        body.get('monthlyTokenQuota'),
+        body.get('monthlyCostQuota')
     ))
-    new_team = cur.fetchone()
+    new_team = TEAM.map_row(cur.fetchone())
     conn.commit()
     cur.close()
     conn.close()
     
-    new_team['createdAt'] = new_team.pop('created_at').isoformat()
-    new_team['apiKey'] = new_team.pop('api_key')
-    new_team['teamKey'] = new_team.pop('team_key')
-    del new_team['tenant_id']
+    if new_team['monthlyTokenQuota'] is not None or new_team['monthlyCostQuota'] is not None:
+        quotas.set_limits(new_team['id'], new_team['monthlyTokenQuota'], new_team['monthlyCostQuota'])
     
     return jsonify(new_team)
 
+@app.route('/tenants/<id>/teams/bulk', methods=['POST'])
+def create_teams_bulk(id):
+    items = items_from_request(request, 'teams')
+    if items is None:
+        return jsonify({'error': 'Provide a list of teams'}), 400
+    if len(items) > BULK_PROVISION_LIMIT:
+        return jsonify({'error': f'At most {BULK_PROVISION_LIMIT} teams per request'}), 413
+    errors = missing_fields(items, ('name', 'provider'))
+    for i, item in enumerate(items):
+        quota_error = invalid_quota(item)
+        if quota_error:
+            errors.append({'index': i, 'error': quota_error})
+    if errors:
+        errors.sort(key=lambda error: error['index'])
+        return jsonify({'error': 'Invalid teams', 'details': errors}), 400
+    if not items:
+        return jsonify([])
+
+    created_at = datetime.now()
+    ids = generate_ids('team', len(items))
+    rows = [(new_id, id, item['name'], item['provider'], item.get('apiKey'), generate_key('tkey'),
+             item.get('model', 'default'), created_at, item.get('monthlyTokenQuota'), item.get('monthlyCostQuota'))
+            for new_id, item in zip(ids, items)]
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database error'}), 500
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        # The tenant check is the foreign key: one statement, one round trip
+        returned = execute_values(cur, f"""
+            INSERT INTO teams (id, tenant_id, name, provider, api_key, team_key, model, created_at, styles,
+                               monthly_token_quota, monthly_cost_quota)
+            VALUES %s
+            RETURNING {TEAM.columns}
+        """, rows, template="(%s, %s, %s, %s, %s, %s, %s, %s, '{}', %s, %s)", page_size=len(rows), fetch=True)
+    except psycopg2.errors.ForeignKeyViolation:
+        return jsonify({'error': 'Tenant Not Found'}), 404
+    finally:
+        cur.close()
+        conn.close()
+
+    by_id = {team['id']: team for team in TEAM.map_rows(returned)}
+    teams = [by_id[new_id] for new_id in ids]
+    for team in teams:
+        if team['monthlyTokenQuota'] is not None or team['monthlyCostQuota'] is not None:
+            quotas.set_limits(team['id'], team['monthlyTokenQuota'], team['monthlyCostQuota'], new_team=True)
+    return jsonify(teams)
+
 @app.route('/tenants/<id>/teams/<team_id>', methods=['PATCH'])
 def update_team(id, team_id):
     body = request.json
+    quota_error = invalid_quota(body)
+    if quota_error:
+        return jsonify({'error': quota_error}), 400
     conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur = conn.cursor()
     
-    # Check if team exists and belongs to tenant
-    cur.execute("SELECT * FROM teams WHERE id = %s AND tenant_id = %s", (team_id, id))
+    # Check if team exists and belongs to tenant (row-level security checks it again)
+    cur.execute(f"SELECT {TEAM.columns} FROM teams WHERE id = %s AND tenant_id = %s", (team_id, id))
     team = cur.fetchone()
     
     if not team:
@@ -431,29 +727,29 @@ def update_team(id, team_id):
     if 'styles' in body:
         fields.append("styles = %s")
         values.append(json.dumps(body['styles']))
+    if 'monthlyTokenQuota' in body:
+        fields.append("monthly_token_quota = %s")
+        values.append(body['monthlyTokenQuota'])
+    if 'monthlyCostQuota' in body:
+        fields.append("monthly_cost_quota = %s")
+        values.append(body['monthlyCostQuota'])
         
     if not fields:
         cur.close()
         conn.close()
-        team['createdAt'] = team.pop('created_at').isoformat()
-        team['apiKey'] = team.pop('api_key')
-        team['teamKey'] = team.pop('team_key')
-        del team['tenant_id']
-        return jsonify(team)
+        return jsonify(TEAM.map_row(team))
         
-    values.append(team_id)
-    query = f"UPDATE teams SET {', '.join(fields)} WHERE id = %s RETURNING *"
+    values += [team_id, id]
+    query = f"UPDATE teams SET {', '.join(fields)} WHERE id = %s AND tenant_id = %s RETURNING {TEAM.columns}"
     
     cur.execute(query, tuple(values))
-    updated_team = cur.fetchone()
+    updated_team = TEAM.map_row(cur.fetchone())
     conn.commit()
     cur.close()
     conn.close()
     
-    updated_team['createdAt'] = updated_team.pop('created_at').isoformat()
-    updated_team['apiKey'] = updated_team.pop('api_key')
-    updated_team['teamKey'] = updated_team.pop('team_key')
-    del updated_team['tenant_id']
+    if 'monthlyTokenQuota' in body or 'monthlyCostQuota' in body:
+        quotas.set_limits(team_id, updated_team['monthlyTokenQuota'], updated_team['monthlyCostQuota'])
     
     return jsonify(updated_team)
 
@@ -472,44 +768,179 @@ def add_team_member(id, team_id):
     if not conn:
         return jsonify({'error': 'Database error'}), 500
         
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur = conn.cursor()
     
-    # Check if member already exists
-    cur.execute("SELECT 1 FROM team_members WHERE team_id = %s AND email = %s", (team_id, email))
-    if cur.fetchone():
+    # No row when the team is missing or belongs to another tenant
+    cur.execute("""
+        SELECT EXISTS (SELECT 1 FROM team_members WHERE team_id = t.id AND email = %s)
+        FROM teams t WHERE t.id = %s AND t.tenant_id = %s
+    """, (email, team_id, id))
+    row = cur.fetchone()
+    if not row or row[0]:
         cur.close()
         conn.close()
+        if not row:
+            return jsonify({'error': 'Team not found'}), 404
         return jsonify({'error': 'Member already exists'}), 409
         
-    cur.execute("""
+    cur.execute(members_added(f"""
         INSERT INTO team_members (id, team_id, email, created_at)
         VALUES (%s, %s, %s, %s)
-        RETURNING *
-    """, (new_id, team_id, email, created_at))
+        RETURNING {MEMBER.columns}
+    """), (new_id, team_id, email, created_at))
     
-    new_member = cur.fetchone()
+    new_member = MEMBER.map_row(cur.fetchone())
     conn.commit()
     cur.close()
     conn.close()
     
-    new_member['createdAt'] = new_member.pop('created_at').isoformat()
     return jsonify(new_member)
 
+@app.route('/tenants/<id>/teams/<team_id>/members/bulk', methods=['POST'])
+def add_team_members_bulk(id, team_id):
+    emails = emails_from_request(request)
+    if emails is None:
+        return jsonify({'error': 'Provide a list of emails or a CSV file'}), 400
+    if len(emails) > BULK_MEMBER_LIMIT:
+        return jsonify({'error': f'At most {BULK_MEMBER_LIMIT} emails per request'}), 413
+
+    valid, outcomes = classify_emails(emails)
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database error'}), 500
+    cur = conn.cursor()
+
+    cur.execute("SELECT 1 FROM teams WHERE id = %s AND tenant_id = %s", (team_id, id))
+    if not cur.fetchone():
+        cur.close()
+        conn.close()
+        return jsonify({'error': 'Team not found'}), 404
+
+    added = {}
+    if valid:
+        # One statement for the whole list and the member count; existing members are
+        # skipped by the unique constraint
+        created_at = datetime.now()
+        rows = execute_values(cur, members_added(f"""
+            INSERT INTO team_members (id, team_id, email, created_at)
+            VALUES %s
+            ON CONFLICT (team_id, email) DO NOTHING
+            RETURNING {MEMBER.columns}
+        """), [(generate_id('mem'), team_id, email, created_at) for email in valid], page_size=len(valid), fetch=True)
+        added = {member['email']: member for member in MEMBER.map_rows(rows)}
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    results = []
+    counts = {'added': 0, 'duplicate': 0, 'invalid': 0}
+    for i, email in enumerate(emails):
+        status = outcomes.get(i)
+        email = email.strip() if isinstance(email, str) else email
+        if status is None:
+            status = 'added' if email in added else 'duplicate'
+        result = {'email': email, 'status': status}
+        if status == 'added':
+            result['member'] = added.pop(email)
+        counts[status] += 1
+        results.append(result)
+
+    return jsonify({**counts, 'results': results})
+
 @app.route('/tenants/<id>/teams/<team_id>/members', methods=['GET'])
 def get_team_members(id, team_id):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute("SELECT * FROM team_members WHERE team_id = %s ORDER BY created_at DESC", (team_id,))
-    members = cur.fetchall()
+    # Empty for teams of other tenants
+    conn = get_read_connection()
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT {MEMBER.columns} FROM team_members
+        WHERE team_id = %s AND team_id IN (SELECT id FROM teams WHERE tenant_id = %s)
+        ORDER BY created_at DESC
+    """, (team_id, id))
+    members = MEMBER.map_rows(cur.fetchall())
     cur.close()
     conn.close()
     
-    for m in members:
-        if m['created_at']:
-            m['createdAt'] = m.pop('created_at').isoformat()
-            
     return jsonify(members)
 
+def remove_members(cur, id, team_id, member_ids, emails, usage_mode):
+    # Set-based delete scoped to the tenant's team, member_count updated in the
+    # same statement; optionally queues the usage scrub in the same transaction
+    # (token_usage timestamps come from datetime.now() too, see record_usage)
+    removed_at = datetime.now()
+    cur.execute(members_removed(f"""
+        DELETE FROM team_members
+        WHERE team_id = %s
+          AND team_id IN (SELECT id FROM teams WHERE tenant_id = %s)
+          AND (id = ANY(%s) OR email = ANY(%s))
+        RETURNING {MEMBER.columns}
+    """), (team_id, id, member_ids, emails))
+    removed = MEMBER.map_rows(cur.fetchall())
+
+    job = None
+    if removed and usage_mode in ('purge', 'anonymize'):
+        job = enqueue(cur.connection, 'members.scrub_usage', {
+            'teamId': team_id,
+            'mode': usage_mode,
+            # Only usage from before the removal: a member re-added later keeps the new usage
+            'removedAt': removed_at.isoformat(),
+            # Pseudonyms are random, so they cannot be traced back to the address
+            'emails': {m['email']: (f"removed-{generate_key('anon')}@anonymized.invalid" if usage_mode == 'anonymize' else None)
+                       for m in removed},
+        })
+    return removed, job
+
+@app.route('/tenants/<id>/teams/<team_id>/members/<member_id>', methods=['DELETE'])
+def remove_team_member(id, team_id, member_id):
+    # ?usage=keep (default) | purge (clear the email on past usage) | anonymize (replace it)
+    usage_mode = request.args.get('usage', 'keep')
+    if usage_mode not in MEMBER_USAGE_MODES:
+        return jsonify({'error': f'usage must be one of {", ".join(MEMBER_USAGE_MODES)}'}), 400
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database error'}), 500
+    cur = conn.cursor()
+    removed, job = remove_members(cur, id, team_id, [member_id], [], usage_mode)
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    if not removed:
+        return jsonify({'error': 'Member not found'}), 404
+    return jsonify({'member': removed[0], 'job': job})
+
+@app.route('/tenants/<id>/teams/<team_id>/members/bulk-delete', methods=['POST'])
+def remove_team_members_bulk(id, team_id):
+    # {"ids": [...], "emails": [...], "usage": "keep" | "purge" | "anonymize"}
+    body = request.get_json(silent=True) or {}
+    member_ids = body.get('ids') or []
+    emails = body.get('emails') or []
+    usage_mode = body.get('usage', 'keep')
+    if not isinstance(member_ids, list) or not isinstance(emails, list) or not (member_ids or emails):
+        return jsonify({'error': 'Provide ids and/or emails'}), 400
+    if not all(isinstance(value, str) and value for value in member_ids + emails):
+        return jsonify({'error': 'ids and emails must be non-empty strings'}), 400
+    if len(member_ids) + len(emails) > BULK_MEMBER_LIMIT:
+        return jsonify({'error': f'At most {BULK_MEMBER_LIMIT} members per request'}), 413
+    if usage_mode not in MEMBER_USAGE_MODES:
+        return jsonify({'error': f'usage must be one of {", ".join(MEMBER_USAGE_MODES)}'}), 400
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database error'}), 500
+    cur = conn.cursor()
+    removed, job = remove_members(cur, id, team_id, member_ids, emails, usage_mode)
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    removed_ids = {m['id'] for m in removed}
+    removed_emails = {m['email'] for m in removed}
+    not_found = [v for v in member_ids if v not in removed_ids] + [v for v in emails if v not in removed_emails]
+    return jsonify({'removed': len(removed), 'members': removed, 'notFound': not_found, 'job': job})
+
 # --- Token Usage ---
 
 @app.route('/api/usage', methods=['POST'])
@@ -524,61 +955,71 @@ def record_usage():
     
     if not team_id:
         return jsonify({'error': 'Team ID required'}), 400
+    
+    retry_after = rate_limiter.check(team_id)
+    if retry_after:
+        return rate_limited_response(retry_after)
+    
+    exceeded = quotas.check(team_id)
+    if exceeded:
+        return quota_exceeded_response(team_id, exceeded)
         
     new_id = generate_id('usage')
     timestamp = datetime.now()
     
-    conn = get_db_connection()
+    conn = get_db_connection(admin=True)
     if not conn:
         return jsonify({'error': 'Database error'}), 500
         
     cur = conn.cursor()
-    cur.execute("""
+    # Nothing is inserted for unknown teams or teams of a deleted tenant
+    cur.execute(usage_added("""
         INSERT INTO token_usage (id, team_id, email, tokens_in, tokens_out, cost, model, timestamp)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-    """, (new_id, team_id, email, tokens_in, tokens_out, cost, model, timestamp))
+        SELECT %s, t.id, %s, %s, %s, %s, %s, %s
+        FROM teams t JOIN tenants n ON n.id = t.tenant_id
+        WHERE t.id = %s AND n.deleted_at IS NULL
+        RETURNING team_id, tokens_in, tokens_out, cost, timestamp
+    """), (new_id, email, tokens_in, tokens_out, cost, model, timestamp, team_id))
+    recorded = cur.fetchone()
     
     conn.commit()
     cur.close()
     conn.close()
     
+    if not recorded:
+        return jsonify({'error': 'Team not found'}), 404
+    
+    quotas.add(team_id, (tokens_in or 0) + (tokens_out or 0), float(cost or 0))
+    
     return jsonify({'success': True})
 
 @app.route('/tenants/<id>/usage', methods=['GET'])
 def get_tenant_usage(id):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    conn = get_read_connection()
+    cur = conn.cursor()
     
+    # Raw usage still in the hot table plus rollups of compacted days (retention.py)
     # Get usage aggregated by team
-    cur.execute("""
-        SELECT 
-            t.name as team_name,
-            t.id as team_id,
-            COALESCE(SUM(u.tokens_in), 0) as total_tokens_in,
-            COALESCE(SUM(u.tokens_out), 0) as total_tokens_out,
-            COALESCE(SUM(u.cost), 0) as total_cost
+    cur.execute(f"""
+        SELECT {TEAM_USAGE.columns}
         FROM teams t
-        LEFT JOIN token_usage u ON t.id = u.team_id
+        LEFT JOIN ({USAGE_SOURCES}) u ON t.id = u.team_id
         WHERE t.tenant_id = %s
         GROUP BY t.id, t.name
-    """, (id,))
-    team_usage = cur.fetchall()
+    """, (id, id, id))
+    team_usage = TEAM_USAGE.map_rows(cur.fetchall())
     
     # Get top users by cost
-    cur.execute("""
-        SELECT 
-            u.email,
-            t.name as team_name,
-            SUM(u.cost) as total_cost,
-            SUM(u.tokens_in + u.tokens_out) as total_tokens
-        FROM token_usage u
+    cur.execute(f"""
+        SELECT {USER_USAGE.columns}
+        FROM ({USAGE_SOURCES}) u
         JOIN teams t ON u.team_id = t.id
-        WHERE t.tenant_id = %s AND u.email IS NOT NULL
+        WHERE u.email IS NOT NULL
         GROUP BY u.email, t.name
         ORDER BY total_cost DESC
         LIMIT 10
-    """, (id,))
-    user_usage = cur.fetchall()
+    """, (id, id))
+    user_usage = USER_USAGE.map_rows(cur.fetchall())
     
     cur.close()
     conn.close()
@@ -608,7 +1049,7 @@ def upload_file(id):
     if not conn:
         return jsonify({'error': 'Database error'}), 500
         
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur = conn.cursor()
     
     # Check tenant
     cur.execute("SELECT 1 FROM tenants WHERE id = %s", (id,))
@@ -617,20 +1058,17 @@ def upload_file(id):
         conn.close()
         return jsonify({'error': 'Tenant not found'}), 404
         
-    cur.execute("""
+    cur.execute(f"""
         INSERT INTO files (id, tenant_id, name, size, content, uploaded_at, url)
         VALUES (%s, %s, %s, %s, %s, %s, '#')
-        RETURNING *
+        RETURNING {FILE_WITH_CONTENT.columns}
     """, (new_id, id, file.filename, len(file_content), content_str, upload_time))
     
-    new_file = cur.fetchone()
+    new_file = FILE_WITH_CONTENT.map_row(cur.fetchone())
     conn.commit()
     cur.close()
     conn.close()
     
-    new_file['uploadedAt'] = new_file.pop('uploaded_at').isoformat()
-    del new_file['tenant_id']
-    
     return jsonify(new_file)
 
 @app.route('/tenants/<id>/files/<file_id>', methods=['DELETE'])
@@ -651,5 +1089,9 @@ def delete_file(id, file_id):
     return jsonify({'success': True})
 
 if __name__ == '__main__':
+    # Local development only. Production runs under gunicorn:
+    #   gunicorn -c gunicorn.conf.py server:app
     port = int(os.environ.get('PORT', 5001))
-    app.run(host='0.0.0.0', port=port, debug=True)
+    debug = os.environ.get('FLASK_DEBUG', '0') == '1'
+    check_database()
+    app.run(host='0.0.0.0', port=port, debug=debug)
@@ -0,0 +1,66 @@
+import os
+import time
+import threading
+from flask import request, jsonify
+
+# Soft-deleted tenants.
+#
+# DELETE /tenants/<id> sets tenants.deleted_at and queues the tenant.delete
+# purge job (tasks.py), which removes the child rows in small batches and
+# finally the tenant row itself. Until then the tenant must be invisible:
+#
+#   - routes under /tenants/<id>/... answer 404 through the before_request
+#     hook below, which checks a per-worker set of deleted tenant ids
+#     refreshed every DELETED_TENANTS_TTL seconds (the worker that handled the
+#     DELETE knows at once, the others within the TTL)
+#   - queries that are not keyed by a tenant in the URL (tenant list, search,
+#     logins, usage ingestion) filter on deleted_at IS NULL themselves
+#
+# The set only holds tenants whose purge is still running, so it stays small.
+
+DELETED_TENANTS_TTL = float(os.getenv("DELETED_TENANTS_TTL", 2))
+
+class DeletedTenants:
+    def __init__(self, connect, ttl=DELETED_TENANTS_TTL):
+        self.connect = connect
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.ids = frozenset()
+        self.expires = 0.0
+
+    def _refresh(self):
+        conn = self.connect()
+        if not conn:
+            # Keep the last known set rather than reconnecting on every request
+            self.expires = time.monotonic() + self.ttl
+            return
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT id FROM tenants WHERE deleted_at IS NOT NULL")
+            ids = frozenset(row[0] for row in cur.fetchall())
+            cur.close()
+        finally:
+            conn.close()
+        with self.lock:
+            self.ids = ids
+            self.expires = time.monotonic() + self.ttl
+
+    def contains(self, tenant_id):
+        if time.monotonic() >= self.expires:
+            self._refresh()
+        return tenant_id in self.ids
+
+    def add(self, tenant_id):
+        with self.lock:
+            self.ids = self.ids | {tenant_id}
+
+def init_soft_delete(app, connect):
+    deleted = DeletedTenants(connect)
+
+    @app.before_request
+    def hide_deleted_tenants():
+        tenant_id = (request.view_args or {}).get('id')
+        if tenant_id and request.path.startswith('/tenants/') and deleted.contains(tenant_id):
+            return jsonify({'error': 'Not found'}), 404
+
+    return deleted
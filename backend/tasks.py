@@ -0,0 +1,318 @@
+import os
+import time
+import shutil
+from datetime import date, datetime, timedelta
+from psycopg2.extras import execute_values
+import db_setup
+import retention
+from counters import REFRESH_TEAM_COUNTERS
+
+# Job handlers run by `python jobs.py worker`.
+#
+# Each handler receives a JobContext (jobs.py): ctx.payload is the JSON
+# payload, ctx.connect() opens a database connection and ctx.progress()
+# reports progress and renews the job's lease, so handlers call it after every
+# batch. The return value is stored as the job result. Handlers may be
+# retried after a partial run, so every step must be safe to repeat.
+
+DELETE_BATCH_SIZE = int(os.getenv("JOB_DELETE_BATCH_SIZE", 5000))
+DELETE_PAUSE_SECONDS = float(os.getenv("JOB_DELETE_PAUSE_SECONDS", 0.05))
+DELETE_FILE_BATCH_SIZE = int(os.getenv("JOB_DELETE_FILE_BATCH_SIZE", 200))
+RECOUNT_BATCH_SIZE = int(os.getenv("JOB_RECOUNT_BATCH_SIZE", 500))
+
+HANDLERS = {}
+
+def handler(kind):
+    def register(f):
+        HANDLERS[kind] = f
+        return f
+    return register
+
+def parse_day(value, default):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else default
+
+# --- Usage rollups ---
+
+# Teams whose tenant has compacted `day`: their raw rows are archived, so the
+# rollups are the only copy and must not be rebuilt
+COMPACTED_TEAMS = """
+    SELECT t.id FROM teams t JOIN tenants n ON n.id = t.tenant_id WHERE n.usage_compacted_before > %s
+"""
+
+def recompute_day(cur, day):
+    # Rebuilds the rollups of every team that still has raw usage on `day`;
+    # teams without raw rows keep their existing rollups
+    start = datetime.combine(day, datetime.min.time())
+    end = start + timedelta(days=1)
+    cur.execute(f"""
+        DELETE FROM token_usage_daily
+        WHERE day = %s AND team_id IN (
+            SELECT DISTINCT team_id FROM token_usage WHERE timestamp >= %s AND timestamp < %s
+        ) AND team_id NOT IN ({COMPACTED_TEAMS})
+    """, (day, start, end, day))
+    cur.execute(f"""
+        INSERT INTO token_usage_daily (team_id, day, email, tokens_in, tokens_out, cost, events)
+        SELECT team_id, %s, email, COALESCE(SUM(tokens_in), 0), COALESCE(SUM(tokens_out), 0), COALESCE(SUM(cost), 0), COUNT(*)
+        FROM token_usage
+        WHERE timestamp >= %s AND timestamp < %s AND team_id NOT IN ({COMPACTED_TEAMS})
+        GROUP BY team_id, email
+    """, (day, start, end, day))
+    return cur.rowcount
+
+@handler('rollups.recompute')
+def recompute_rollups(ctx):
+    # payload: {"from": "YYYY-MM-DD", "to": "YYYY-MM-DD"}, both inclusive, default yesterday..today
+    today = date.today()
+    first = parse_day(ctx.payload.get('from'), today - timedelta(days=1))
+    last = parse_day(ctx.payload.get('to'), today)
+    days = (last - first).days + 1
+
+    conn = ctx.connect()
+    rows = 0
+    try:
+        cur = conn.cursor()
+        for n in range(days):
+            rows += recompute_day(cur, first + timedelta(days=n))
+            conn.commit()
+            ctx.progress(n + 1, days)
+        cur.close()
+    finally:
+        conn.close()
+    return {'days': days, 'rows': rows}
+
+# --- Member usage scrubbing ---
+
+def replace_team_rollups(cur, team_id, day, rows):
+    cur.execute("DELETE FROM token_usage_daily WHERE team_id = %s AND day = %s", (team_id, day))
+    rollups = retention.rollup_rows(rows, day)
+    if rollups:
+        execute_values(cur, """
+            INSERT INTO token_usage_daily (team_id, day, email, tokens_in, tokens_out, cost, events) VALUES %s
+        """, rollups)
+
+@handler('members.scrub_usage')
+def scrub_member_usage(ctx):
+    # payload: {"teamId": "...", "mode": "purge" | "anonymize", "emails": {old: replacement or null},
+    #           "removedAt": "<ISO timestamp>"}
+    # Rewrites the email on usage recorded before the removal, one day of the
+    # team's history at a time (bounded batches on the (team_id, timestamp)
+    # index): raw rows, then the day's rollups, rebuilt from the rewritten
+    # archive file for days already compacted by retention.py. Usage of a
+    # member who was re-added after the removal is left alone. Each day runs
+    # under the tenant row lock that compaction takes, so the two never
+    # rewrite the same archive at once.
+    team_id = ctx.payload['teamId']
+    emails = ctx.payload['emails']
+    old_emails = list(emails)
+    replacements = [emails[email] for email in old_emails]
+    removed_at = datetime.fromisoformat(ctx.payload['removedAt'])
+    conn = ctx.connect()
+    updated = 0
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT tenant_id FROM teams WHERE id = %s", (team_id,))
+        team = cur.fetchone()
+        cur.execute("""
+            SELECT LEAST(
+                (SELECT MIN(timestamp)::date FROM token_usage WHERE team_id = %s AND timestamp < %s),
+                (SELECT MIN(day) FROM token_usage_daily WHERE team_id = %s AND day <= %s))
+        """, (team_id, removed_at, team_id, removed_at.date()))
+        first = cur.fetchone()[0]
+        conn.commit()
+        if team and first:
+            tenant_id = team[0]
+            days = (removed_at.date() - first).days + 1
+            for n in range(days):
+                day = first + timedelta(days=n)
+                start = datetime.combine(day, datetime.min.time())
+                end = min(start + timedelta(days=1), removed_at)
+                cur.execute("SELECT usage_compacted_before FROM tenants WHERE id = %s FOR NO KEY UPDATE", (tenant_id,))
+                cutoff = cur.fetchone()[0]
+                cur.execute("""
+                    UPDATE token_usage u SET email = m.replacement
+                    FROM unnest(%s::varchar[], %s::varchar[]) AS m(email, replacement)
+                    WHERE u.team_id = %s AND u.timestamp >= %s AND u.timestamp < %s AND u.email = m.email
+                """, (old_emails, replacements, team_id, start, end))
+                updated += cur.rowcount
+                path = retention.archive_path(tenant_id, day)
+                if cutoff and day < cutoff:
+                    # Compacted: the rollups are rebuilt from the rewritten archive
+                    if os.path.exists(path):
+                        replace_team_rollups(cur, team_id, day, retention.scrub_archive(path, team_id, emails, removed_at))
+                    elif day < removed_at.date():
+                        # Archive gone: the rollups are all that is left
+                        cur.execute("""
+                            UPDATE token_usage_daily d SET email = m.replacement
+                            FROM unnest(%s::varchar[], %s::varchar[]) AS m(email, replacement)
+                            WHERE d.team_id = %s AND d.day = %s AND d.email = m.email
+                        """, (old_emails, replacements, team_id, day))
+                else:
+                    # Not compacted yet: rebuilt from the raw rows, like recompute_day
+                    cur.execute(f"""
+                        SELECT {', '.join(retention.ARCHIVE_COLUMNS)} FROM token_usage
+                        WHERE team_id = %s AND timestamp >= %s AND timestamp < %s
+                    """, (team_id, start, start + timedelta(days=1)))
+                    rows = cur.fetchall()
+                    if rows:
+                        replace_team_rollups(cur, team_id, day, rows)
+                conn.commit()
+                ctx.progress(n + 1, days, f"{updated} usage rows updated")
+                time.sleep(DELETE_PAUSE_SECONDS)
+        cur.close()
+    finally:
+        conn.close()
+    return {'usageRows': updated}
+
+# --- Team counters ---
+
+@handler('teams.recount')
+def recount_teams(ctx):
+    # payload: {"tenantId": "..."} or {"teamIds": [...]}, default every team
+    conn = ctx.connect()
+    updated = 0
+    try:
+        cur = conn.cursor()
+        team_ids = ctx.payload.get('teamIds')
+        if ctx.payload.get('tenantId'):
+            cur.execute("SELECT id FROM teams WHERE tenant_id = %s", (ctx.payload['tenantId'],))
+            team_ids = [row[0] for row in cur.fetchall()]
+        elif team_ids is None:
+            cur.execute("SELECT id FROM teams ORDER BY id")
+            team_ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+        for start in range(0, len(team_ids), RECOUNT_BATCH_SIZE):
+            cur.execute(REFRESH_TEAM_COUNTERS, {'team_ids': team_ids[start:start + RECOUNT_BATCH_SIZE]})
+            updated += cur.rowcount
+            conn.commit()
+            ctx.progress(min(start + RECOUNT_BATCH_SIZE, len(team_ids)), len(team_ids))
+        cur.close()
+    finally:
+        conn.close()
+    return {'teams': updated}
+
+# --- Retention ---
+
+@handler('usage.retention')
+def apply_retention(ctx):
+    # payload: {"tenantId": "..."} to limit the run to one tenant, default all
+    conn = ctx.connect()
+    try:
+        cur = conn.cursor()
+        if ctx.payload.get('tenantId'):
+            cur.execute("SELECT id, usage_retention_days FROM tenants WHERE id = %s", (ctx.payload['tenantId'],))
+        else:
+            cur.execute("SELECT id, usage_retention_days FROM tenants WHERE deleted_at IS NULL ORDER BY id")
+        tenants = [(tenant_id, retention.effective_retention(days)) for tenant_id, days in cur.fetchall()]
+        tenants = [(tenant_id, days) for tenant_id, days in tenants if days > 0]
+        conn.commit()
+        cur.close()
+
+        results = {}
+        for n, (tenant_id, days) in enumerate(tenants):
+            stats = retention.compact_tenant(conn, tenant_id, days,
+                                             lambda day, rows: ctx.progress(n, len(tenants), f"{tenant_id} {day}: {rows} rows deleted"))
+            if stats['days']:
+                results[tenant_id] = stats
+            ctx.progress(n + 1, len(tenants))
+    finally:
+        conn.close()
+    return {'tenants': len(tenants), 'compacted': results}
+
+# --- storage.json import ---
+
+@handler('storage.import')
+def import_storage(ctx):
+    # payload: {"path": "..."} relative to the backend directory, default storage.json
+    path = ctx.payload.get('path')
+    data_file = os.path.join(db_setup.BASE_DIR, path) if path else db_setup.DATA_FILE
+    if not os.path.exists(data_file):
+        raise FileNotFoundError(data_file)
+    ctx.progress(0, 3, 'Importing tenants')
+    counts = db_setup.migrate_data(data_file, progress=ctx.progress)
+    ctx.progress(3, 3, 'Done')
+    return counts
+
+# --- Tenant deletion ---
+
+def delete_in_batches(ctx, conn, label, sql, params, batch_size, step):
+    # Deletes through `sql` (which must LIMIT its own id subquery) one committed
+    # batch at a time, pausing in between so it never holds long locks.
+    # step is (phase, phases) for the job's progress.
+    done, phases = step
+    cur = conn.cursor()
+    total = 0
+    while True:
+        cur.execute(sql, params + (batch_size,))
+        deleted = cur.rowcount
+        conn.commit()
+        total += deleted
+        ctx.progress(done, phases, f"Deleting {label}: {total} rows")
+        if deleted < batch_size:
+            break
+        time.sleep(DELETE_PAUSE_SECONDS)
+    cur.close()
+    return total
+
+@handler('tenant.delete')
+def delete_tenant(ctx):
+    # payload: {"tenantId": "..."}
+    # DELETE /tenants/<id> has already set deleted_at, which hides the tenant
+    # and stops usage ingestion for its teams (softdelete.py). Child rows are
+    # purged in small committed batches, the tenant row itself goes last, so a
+    # retried job picks up where the previous attempt stopped.
+    tenant_id = ctx.payload['tenantId']
+    conn = ctx.connect()
+    try:
+        cur = conn.cursor()
+        cur.execute("UPDATE tenants SET deleted_at = COALESCE(deleted_at, now()) WHERE id = %s", (tenant_id,))
+        cur.execute("SELECT id FROM teams WHERE tenant_id = %s", (tenant_id,))
+        team_ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+        cur.close()
+
+        phases = [
+            ('usage', """
+                DELETE FROM token_usage WHERE id IN (
+                    SELECT id FROM token_usage WHERE team_id = ANY(%s) LIMIT %s
+                )
+            """, (team_ids,), DELETE_BATCH_SIZE),
+            # Rollups have no id column; batch on the physical row id
+            ('rollups', """
+                DELETE FROM token_usage_daily WHERE ctid = ANY(ARRAY(
+                    SELECT ctid FROM token_usage_daily WHERE team_id = ANY(%s) LIMIT %s
+                ))
+            """, (team_ids,), DELETE_BATCH_SIZE),
+            ('members', """
+                DELETE FROM team_members WHERE id IN (
+                    SELECT id FROM team_members WHERE team_id = ANY(%s) LIMIT %s
+                )
+            """, (team_ids,), DELETE_BATCH_SIZE),
+            # File rows carry their content, so they go in smaller batches
+            ('files', """
+                DELETE FROM files WHERE id IN (
+                    SELECT id FROM files WHERE tenant_id = %s LIMIT %s
+                )
+            """, (tenant_id,), DELETE_FILE_BATCH_SIZE),
+        ]
+        if not team_ids:
+            phases = phases[-1:]
+
+        deleted = {}
+        total = len(phases) + 1
+        for done, (label, sql, params, batch_size) in enumerate(phases):
+            ctx.progress(done, total, f"Deleting {label}")
+            deleted[label] = delete_in_batches(ctx, conn, label, sql, params, batch_size, (done, total))
+
+        # Teams go with the tenant through ON DELETE CASCADE
+        ctx.progress(len(phases), total, "Deleting tenant")
+        cur = conn.cursor()
+        cur.execute("DELETE FROM tenants WHERE id = %s", (tenant_id,))
+        deleted['tenant'] = cur.rowcount
+        conn.commit()
+        cur.close()
+        shutil.rmtree(retention.tenant_archive_dir(tenant_id), ignore_errors=True)
+        ctx.progress(total, total, "Deleted")
+    finally:
+        conn.close()
+    deleted['teams'] = len(team_ids)
+    return deleted
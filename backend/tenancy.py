@@ -0,0 +1,217 @@
+import os
+import time
+import threading
+import psycopg2
+import psycopg2.extensions
+from psycopg2 import sql
+from flask import request, has_request_context
+from metrics import InstrumentedConnection, InstrumentedCursor
+
+# Tenant isolation with row-level security, and the connection pool.
+#
+# The policies (db_setup.py / migration.sql) limit tenants, teams, files,
+# team_members, token_usage and token_usage_daily to the tenant named by the
+# app.tenant_id setting. A connection without it sees no rows at all. Every
+# connection is therefore one of:
+#
+#   tenant    get_db_connection() in server.py during a /tenants/<id>/...
+#             request: app.tenant_id is set to that tenant
+#   admin     get_db_connection(admin=True) for cross-tenant routes, caches
+#             and search: switches to DB_ADMIN_ROLE, a NOLOGIN role with
+#             BYPASSRLS granted to DB_USER. Jobs and scripts connect with
+#             that role for the whole session.
+#   neither   sees nothing, so a route that forgets its scope fails closed
+#
+# Both switches are transaction-local (set_config(..., true), the SET LOCAL
+# equivalent that accepts a bound value, and SET LOCAL ROLE), prepended to the
+# first statement of each transaction: no extra round trip, and they end with
+# the transaction, so a pooled connection never carries them into the next
+# request.
+#
+# Admin connections also exist for speed: Postgres evaluates the policy
+# before any filter that is not leakproof (ILIKE, LIKE on lower(), pg_trgm's
+# <%), so under a policy the trigram and prefix indexes cannot be used and
+# those queries scan the table. Routes keep their own tenant_id conditions,
+# which is all the isolation an admin connection has.
+#
+# RLS does not apply to superusers or roles with BYPASSRLS, so pools refuse
+# such a DB_USER on their first connection (DB_ALLOW_RLS_BYPASS=1 lets a local
+# superuser through with a warning), and check that DB_ADMIN_ROLE is usable.
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+# Idle connections older than this are pinged before reuse
+DB_POOL_PING_SECONDS = float(os.getenv("DB_POOL_PING_SECONDS", 30))
+DB_ALLOW_RLS_BYPASS = os.getenv("DB_ALLOW_RLS_BYPASS", "0") == "1"
+DB_ADMIN_ROLE = os.getenv("DB_ADMIN_ROLE", "tenant_admin")
+
+BYPASSES_RLS = "SELECT rolsuper OR rolbypassrls FROM pg_roles WHERE rolname = current_user"
+ADMIN_ROLE_USABLE = "SELECT rolbypassrls AND pg_has_role(current_user, oid, 'MEMBER') FROM pg_roles WHERE rolname = %s"
+
+def quote_ident(name):
+    return '"' + name.replace('"', '""') + '"'
+
+SET_TENANT = "SELECT set_config('app.tenant_id', %s, true);"
+# Role names cannot be bound parameters
+SET_ADMIN = f"SET LOCAL ROLE {quote_ident(DB_ADMIN_ROLE)};"
+# psycopg2.connect(options=...) for connections that stay admin for the whole session
+ADMIN_OPTIONS = f"-c role={DB_ADMIN_ROLE}"
+
+def request_tenant_id():
+    # <id> of routes under /tenants/<id>/..., None elsewhere
+    if has_request_context() and request.path.startswith('/tenants/'):
+        return (request.view_args or {}).get('id')
+    return None
+
+def check_rls_enforced(conn):
+    cur = conn.cursor()
+    cur.execute(BYPASSES_RLS)
+    bypasses = cur.fetchone()[0]
+    cur.execute(ADMIN_ROLE_USABLE, (DB_ADMIN_ROLE,))
+    admin = cur.fetchone()
+    cur.close()
+    conn.rollback()
+    if not (admin and admin[0]):
+        raise RuntimeError(f"Role {DB_ADMIN_ROLE} must exist with BYPASSRLS and be granted to {conn.info.user} "
+                           "(see migration.sql): cross-tenant queries run as that role")
+    if not bypasses:
+        return
+    message = f"Database role {conn.info.user} is a superuser or has BYPASSRLS: tenant row-level security is not enforced"
+    if not DB_ALLOW_RLS_BYPASS:
+        raise RuntimeError(message)
+    print(f"WARNING: {message}")
+
+class ScopedCursor(psycopg2.extensions.cursor):
+    def _scoped(self, query, vars):
+        conn = self.connection
+        if conn.tenant_id is None and not conn.admin:
+            return query
+        if not conn.autocommit and conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return query # Already set for this transaction
+        if conn.tenant_id is not None:
+            prefix = self.mogrify(SET_TENANT, (conn.tenant_id,))
+        else:
+            prefix = SET_ADMIN.encode(psycopg2.extensions.encodings[conn.encoding])
+        if vars is not None:
+            prefix = prefix.replace(b'%', b'%%')
+        if isinstance(query, sql.Composable):
+            query = query.as_string(self)
+        if isinstance(query, str):
+            query = query.encode(psycopg2.extensions.encodings[conn.encoding])
+        return prefix + query
+
+    def execute(self, query, vars=None):
+        return super().execute(self._scoped(query, vars), vars)
+
+    def executemany(self, query, vars_list):
+        return super().executemany(self._scoped(query, vars_list), vars_list)
+
+# Instrumentation wraps the scoping, so metrics and traces show the route's own SQL
+class TenantCursor(InstrumentedCursor, ScopedCursor):
+    pass
+
+class TenantConnection(InstrumentedConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = TenantCursor
+        self.tenant_id = None
+        self.admin = False
+        self.pool = None
+
+    def close(self):
+        # Pooled connections go back to the pool
+        if self.pool is not None and not self.closed:
+            self.pool.put(self)
+        else:
+            super().close()
+
+    def discard(self):
+        self.pool = None
+        super().close()
+
+def alive(conn):
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.close()
+        conn.rollback()
+        return True
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        return False
+
+class ConnectionPool:
+    # Keeps up to `size` idle connections per worker process; more can be open
+    # at once under load, the extras are closed when returned. Connections that
+    # died while idle (database restart, failover) are dropped before reuse.
+    def __init__(self, connect, size=DB_POOL_SIZE, verify=check_rls_enforced):
+        self.connect = connect
+        self.size = size
+        # Run on the first connection the pool opens
+        self.verify = verify
+        self.lock = threading.Lock()
+        self.idle = []
+        self.pid = os.getpid()
+
+    def _take(self):
+        # -> a live idle connection or None
+        while True:
+            with self.lock:
+                if self.pid != os.getpid():
+                    # Forked worker: never share the parent's sockets
+                    self.idle = []
+                    self.pid = os.getpid()
+                if not self.idle:
+                    return None
+                conn, since = self.idle.pop()
+            if not conn.closed and (time.monotonic() - since < DB_POOL_PING_SECONDS or alive(conn)):
+                return conn
+            conn.discard()
+            # One dead connection usually means the server went away: drop the rest too
+            self._flush()
+
+    def get(self, tenant_id=None, admin=False):
+        # tenant_id scopes the connection to one tenant, admin=True to all of
+        # them; with neither it sees no tenant rows
+        conn = self._take()
+        if conn is None:
+            conn = self.connect()
+            if conn is None:
+                return None
+            if self.verify is not None:
+                try:
+                    self.verify(conn)
+                except Exception:
+                    conn.close()
+                    raise
+                self.verify = None
+            conn.pool = self
+        conn.tenant_id = tenant_id
+        conn.admin = admin and tenant_id is None
+        return conn
+
+    def _flush(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn, _ in idle:
+            conn.discard()
+
+    def put(self, conn):
+        if conn.closed:
+            # Broken during the request: the idle ones most likely are too
+            conn.pool = None
+            self._flush()
+            return
+        try:
+            if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if conn.autocommit:
+                conn.autocommit = False
+        except psycopg2.Error:
+            conn.discard()
+            return
+        conn.tenant_id = None
+        conn.admin = False
+        with self.lock:
+            if len(self.idle) < self.size and self.pid == os.getpid():
+                self.idle.append((conn, time.monotonic()))
+                return
+        conn.discard()
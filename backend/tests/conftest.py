@@ -0,0 +1,122 @@
+import os
+import sys
+
+import psycopg2
+import pytest
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+# Backend modules are flat scripts run from backend/; make them importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Database tests run against a scratch database on DB_HOST, created with a
+# superuser account; they are skipped when the server is unreachable. The
+# modules read DB_* at import, so point them at it before any test imports them.
+TEST_DB_SUPERUSER = os.getenv("TEST_DB_SUPERUSER", "postgres")
+TEST_DB_SUPERUSER_PASSWORD = os.getenv("TEST_DB_SUPERUSER_PASSWORD", None)
+TEST_DB_NAME = os.getenv("TEST_DB_NAME", "master_admin_test")
+TEST_DB_USER = os.getenv("TEST_DB_USER", "master_admin_test")
+TEST_DB_PASSWORD = "master_admin_test"
+
+os.environ["DB_NAME"] = TEST_DB_NAME
+os.environ["DB_USER"] = TEST_DB_USER
+os.environ["DB_PASSWORD"] = TEST_DB_PASSWORD
+os.environ.setdefault("DB_HOST", "localhost")
+os.environ.setdefault("DB_PORT", "5432")
+
+# Tables emptied before each database test
+TABLES = ('tenants', 'teams', 'files', 'team_members', 'token_usage', 'token_usage_daily',
+          'rate_limit_buckets', 'jobs')
+
+def superuser_connection(database="postgres"):
+    conn = psycopg2.connect(database=database, user=TEST_DB_SUPERUSER, password=TEST_DB_SUPERUSER_PASSWORD,
+                            host=os.environ["DB_HOST"], port=os.environ["DB_PORT"], connect_timeout=3)
+    conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    return conn
+
+@pytest.fixture(scope="session")
+def database():
+    try:
+        conn = superuser_connection()
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"No test database server: {e}")
+    from tenancy import DB_ADMIN_ROLE
+    cur = conn.cursor()
+    cur.execute(f"DROP DATABASE IF EXISTS {TEST_DB_NAME} WITH (FORCE)")
+    for role, options in ((TEST_DB_USER, f"LOGIN PASSWORD '{TEST_DB_PASSWORD}'"), (DB_ADMIN_ROLE, "NOLOGIN BYPASSRLS")):
+        cur.execute("SELECT 1 FROM pg_roles WHERE rolname = %s", (role,))
+        if not cur.fetchone():
+            cur.execute(f'CREATE ROLE "{role}" {options}')
+    cur.execute(f'GRANT "{DB_ADMIN_ROLE}" TO "{TEST_DB_USER}"')
+    cur.execute(f'CREATE DATABASE {TEST_DB_NAME} OWNER "{TEST_DB_USER}"')
+    cur.close()
+    conn.close()
+
+    # pg_trgm is a trusted extension, but only from Postgres 13
+    conn = superuser_connection(TEST_DB_NAME)
+    conn.cursor().execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    conn.close()
+
+    # Fresh install, then the migrations on top, as on a deployed database
+    import db_setup
+    db_setup.create_tables()
+    apply_migration()
+
+def apply_migration():
+    # migration.sql as the table owner (DB_USER)
+    import db_setup
+    conn = db_setup.get_db_connection(TEST_DB_NAME)
+    from apply_migration_local import split_concurrent, create_concurrent_indexes
+    with open(os.path.join(db_setup.BASE_DIR, 'migration.sql')) as f:
+        sql, indexes = split_concurrent(f.read())
+    conn.cursor().execute(sql)
+    conn.commit()
+    create_concurrent_indexes(conn, indexes)
+    conn.close()
+
+@pytest.fixture
+def migrate(database):
+    # -> migrate(*statements): runs the statements as the table owner, then migration.sql
+    def run(*statements):
+        import db_setup
+        conn = db_setup.get_db_connection(TEST_DB_NAME)
+        for statement in statements:
+            conn.cursor().execute(statement)
+        conn.commit()
+        conn.close()
+        apply_migration()
+    return run
+
+@pytest.fixture
+def db(database):
+    # -> connect(tenant_id=None, admin=False): pooled app connections as in server.py
+    conn = superuser_connection(TEST_DB_NAME)
+    conn.cursor().execute(f"TRUNCATE {', '.join(TABLES)} CASCADE")
+    conn.close()
+
+    from tenancy import ConnectionPool, TenantConnection
+    pool = ConnectionPool(lambda: psycopg2.connect(database=TEST_DB_NAME, user=TEST_DB_USER, password=TEST_DB_PASSWORD,
+                                                   host=os.environ["DB_HOST"], port=os.environ["DB_PORT"],
+                                                   connection_factory=TenantConnection))
+    yield pool.get
+    pool._flush()
+
+@pytest.fixture
+def run_sql(db):
+    # -> run(query, vars=None): runs as the admin role and commits; -> rows, if any
+    def run(query, vars=None):
+        conn = db(admin=True)
+        cur = conn.cursor()
+        cur.execute(query, vars)
+        rows = cur.fetchall() if cur.description else None
+        conn.commit()
+        cur.close()
+        conn.close()
+        return rows
+    return run
+
+@pytest.fixture
+def archive_dir(tmp_path, monkeypatch):
+    import retention
+    monkeypatch.setattr(retention, 'USAGE_ARCHIVE_DIR', str(tmp_path / 'usage'))
+    monkeypatch.setattr(retention, 'RETENTION_DELETE_PAUSE_SECONDS', 0)
+    return tmp_path / 'usage'
@@ -0,0 +1,57 @@
+from datetime import date, datetime
+import retention
+from analytics import build_report, compaction_cutoffs, scan_archives, scan_hot, scan_month
+from retention import archive_path, compact_day, write_archive
+
+def usage(run_sql, id, team_id, timestamp, tokens_in, model='gpt'):
+    run_sql("INSERT INTO token_usage (id, team_id, email, tokens_in, tokens_out, cost, model, timestamp) "
+            "VALUES (%s, %s, 'a@x.io', %s, 1, 0.5, %s, %s)", (id, team_id, tokens_in, model, timestamp))
+
+def seed(run_sql):
+    run_sql("INSERT INTO tenants (id, name) VALUES ('t1', 'Acme')")
+    run_sql("INSERT INTO teams (id, tenant_id, name) VALUES ('tm1', 't1', 'Sales')")
+    usage(run_sql, 'u1', 'tm1', datetime(2025, 1, 10, 9), 10)
+    usage(run_sql, 'u2', 'tm1', datetime(2025, 1, 10, 17), 20)
+    usage(run_sql, 'u3', 'tm1', datetime(2025, 1, 20, 9), 40)
+
+def test_scan_month_sums_tokens_exactly(archive_dir):
+    # float64 weights would round 2**53 + 1 + 1 down to 2**53
+    path = archive_path('t1', date(2025, 1, 1))
+    rows = [('u1', 'tm1', 'a@x.io', 'gpt', 2**53 + 1, 0, 0.0, datetime(2025, 1, 1)),
+            ('u2', 'tm1', 'a@x.io', 'gpt', 1, 0, 0.0, datetime(2025, 1, 1))]
+    write_archive(path, rows)
+    assert scan_month('t1', '2025-01', [path], ['team']) == {('tm1',): [2**53 + 2, 0, 0.0, 2]}
+
+def test_report_merges_archived_and_hot_days(db, run_sql, archive_dir):
+    seed(run_sql)
+    conn = db(admin=True)
+    compact_day(conn, 't1', ['tm1'], date(2025, 1, 10))
+    conn.close()
+    assert run_sql("SELECT id FROM token_usage ORDER BY id") == [('u3',)]
+
+    conn = db('t1')
+    report = build_report(conn, 't1', '2025-01', '2025-01', ['team', 'month'])
+    conn.close()
+    assert report['rows'] == [{'teamId': 'tm1', 'teamName': 'Sales', 'month': '2025-01',
+                               'tokensIn': 70, 'tokensOut': 3, 'cost': 1.5, 'events': 3}]
+    assert report['sources']['archiveFiles'] == 1
+
+def test_hot_scan_uses_the_cutoffs_the_archive_scan_used(db, run_sql, archive_dir, monkeypatch):
+    seed(run_sql)
+    conn = db('t1')
+    cutoffs = compaction_cutoffs(conn, 't1')
+    conn.rollback()
+    assert cutoffs == {}
+
+    # A compaction finishes between the two halves of the report, before its
+    # raw rows are deleted: they must be counted from exactly one side
+    monkeypatch.setattr(retention, 'delete_ids', lambda conn, ids, progress=None: 0)
+    admin = db(admin=True)
+    compact_day(admin, 't1', ['tm1'], date(2025, 1, 10))
+    admin.close()
+
+    archived, files = scan_archives(cutoffs, '2025-01', '2025-01', ['team'])
+    hot = scan_hot(conn, 't1', cutoffs, '2025-01', '2025-01', ['team'])
+    conn.close()
+    assert (archived, files) == ({}, 0)
+    assert hot == {('tm1',): [70, 3, 1.5, 3]}
@@ -0,0 +1,54 @@
+from flask import Flask, request
+from bulk import read_csv_emails, classify_emails, emails_from_request, items_from_request, missing_fields
+
+app = Flask(__name__)
+
+def test_csv_with_header():
+    text = "name,Email\nAnn,ann@example.com\nBob\n\nCid,cid@example.com\n"
+    assert read_csv_emails(text) == ['ann@example.com', '', 'cid@example.com']
+
+def test_csv_without_header():
+    assert read_csv_emails("ann@example.com,x\n bob@example.com\n") == ['ann@example.com', ' bob@example.com']
+
+def test_empty_csv():
+    assert read_csv_emails("") == []
+    assert read_csv_emails("\n , \n") == []
+
+def test_classify_emails():
+    valid, outcomes = classify_emails([' ann@example.com', 'bad', 'ann@example.com', None, 'bob@example.com', 'a b@c.de'])
+    assert valid == ['ann@example.com', 'bob@example.com']
+    assert outcomes == {1: 'invalid', 2: 'duplicate', 3: 'invalid', 5: 'invalid'}
+
+def test_classify_emails_longer_than_the_column():
+    # 255 characters fit team_members.email, 256 would fail the insert
+    fits = 'a' * 243 + '@example.com'
+    too_long = 'a' * 244 + '@example.com'
+    valid, outcomes = classify_emails([fits, too_long])
+    assert valid == [fits]
+    assert outcomes == {1: 'invalid'}
+
+def test_emails_from_json():
+    with app.test_request_context(json={'emails': ['a@b.co']}):
+        assert emails_from_request(request) == ['a@b.co']
+    with app.test_request_context(json=['a@b.co']):
+        assert emails_from_request(request) == ['a@b.co']
+    with app.test_request_context(json={'emails': 'a@b.co'}):
+        assert emails_from_request(request) is None
+
+def test_emails_from_csv_body():
+    with app.test_request_context(data="email\na@b.co\n", content_type='text/csv'):
+        assert emails_from_request(request) == ['a@b.co']
+
+def test_items_from_request():
+    with app.test_request_context(json={'tenants': [{'name': 'a'}]}):
+        assert items_from_request(request, 'tenants') == [{'name': 'a'}]
+    with app.test_request_context(json=[{'name': 'a'}, 'b']):
+        assert items_from_request(request, 'tenants') is None
+
+def test_missing_fields():
+    items = [{'name': 'a', 'email': 'x'}, {'name': ''}, {}]
+    assert missing_fields(items, ('name', 'email')) == [
+        {'index': 1, 'error': 'name, email required'},
+        {'index': 2, 'error': 'name, email required'},
+    ]
+    assert missing_fields([], ('name',)) == []
@@ -0,0 +1,62 @@
+from datetime import date, datetime
+import retention
+from counters import REFRESH_TEAM_COUNTERS, members_added, members_removed, usage_added
+from retention import compact_day
+
+def seed(run_sql):
+    run_sql("INSERT INTO tenants (id, name) VALUES ('t1', 'Acme')")
+    run_sql("INSERT INTO teams (id, tenant_id, name) VALUES ('tm1', 't1', 'Sales')")
+
+def add_usage(run_sql, id, timestamp, tokens_in, cost):
+    run_sql(usage_added("""
+        INSERT INTO token_usage (id, team_id, email, tokens_in, tokens_out, cost, timestamp)
+        VALUES (%s, 'tm1', 'a@x.io', %s, 1, %s, %s)
+        RETURNING team_id, tokens_in, tokens_out, cost, timestamp
+    """), (id, tokens_in, cost, timestamp))
+
+def counters(run_sql):
+    return run_sql("SELECT member_count, lifetime_tokens, lifetime_cost, last_activity_at FROM teams WHERE id = 'tm1'")[0]
+
+def test_members_added_and_removed(db, run_sql):
+    seed(run_sql)
+    rows = run_sql(members_added("""
+        INSERT INTO team_members (id, team_id, email) VALUES ('m1', 'tm1', 'a@x.io'), ('m2', 'tm1', 'b@x.io')
+        RETURNING id, team_id
+    """))
+    assert sorted(rows) == [('m1', 'tm1'), ('m2', 'tm1')]
+    run_sql(members_removed("DELETE FROM team_members WHERE id = 'm1' RETURNING team_id"))
+    run_sql(members_removed("DELETE FROM team_members WHERE id = 'missing' RETURNING team_id"))
+    assert counters(run_sql)[0] == 1
+
+def test_usage_added(db, run_sql):
+    seed(run_sql)
+    add_usage(run_sql, 'u1', datetime(2025, 1, 10), 10, 0.5)
+    add_usage(run_sql, 'u2', datetime(2025, 1, 5), 20, 0.25)
+    assert counters(run_sql) == (0, 32, 0.75, datetime(2025, 1, 10))
+
+def compacted(db, run_sql, monkeypatch):
+    # Day 10 compacted but its raw rows not yet deleted: in both token_usage and the rollups
+    seed(run_sql)
+    add_usage(run_sql, 'u1', datetime(2025, 1, 10), 10, 0.5)
+    add_usage(run_sql, 'u2', datetime(2025, 1, 20), 20, 0.25)
+    monkeypatch.setattr(retention, 'delete_ids', lambda conn, ids, progress=None: 0)
+    conn = db(admin=True)
+    compact_day(conn, 't1', ['tm1'], date(2025, 1, 10))
+    conn.close()
+    run_sql("UPDATE teams SET lifetime_tokens = 0, lifetime_cost = 0, last_activity_at = NULL")
+
+def test_refresh_skips_compacted_raw_rows(db, run_sql, archive_dir, monkeypatch):
+    compacted(db, run_sql, monkeypatch)
+    run_sql(REFRESH_TEAM_COUNTERS, {'team_ids': None})
+    assert counters(run_sql) == (0, 32, 0.75, datetime(2025, 1, 20))
+
+def test_migration_backfills_once(db, run_sql, archive_dir, monkeypatch, migrate):
+    compacted(db, run_sql, monkeypatch)
+    migrate("ALTER TABLE teams DROP COLUMN member_count, DROP COLUMN lifetime_tokens, "
+            "DROP COLUMN lifetime_cost, DROP COLUMN last_activity_at")
+    assert counters(run_sql) == (0, 32, 0.75, datetime(2025, 1, 20))
+
+    # Applying the migrations again leaves the maintained values alone
+    run_sql("UPDATE teams SET lifetime_tokens = 1000")
+    migrate()
+    assert counters(run_sql)[1] == 1000
@@ -0,0 +1,39 @@
+from ids import make_id, generate_id, generate_ids, generate_key
+
+def test_id_layout():
+    id = generate_id('usage')
+    prefix, _, body = id.partition('_')
+    assert prefix == 'usage'
+    assert len(body) == 26
+    assert set(body) <= set('0123456789abcdefghjkmnpqrstvwxyz')
+
+def test_ids_sort_by_timestamp():
+    earlier = make_id('team', 1_700_000_000_000, 2**80 - 1)
+    later = make_id('team', 1_700_000_000_001, 0)
+    assert earlier < later
+
+def test_generated_ids_are_ordered_across_calls():
+    ids = [generate_id('job') for _ in range(1000)]
+    # Same millisecond ids differ only in their random bits
+    assert [id[:14] for id in ids] == sorted(id[:14] for id in ids)
+    assert len(set(ids)) == len(ids)
+
+def test_bulk_ids_are_strictly_ordered():
+    ids = generate_ids('member', 500)
+    assert len(ids) == 500
+    assert ids == sorted(ids)
+    assert len(set(ids)) == 500
+    assert all(len(id) == len('member_') + 26 for id in ids)
+
+def test_bulk_ids_do_not_carry_into_the_timestamp():
+    ids = generate_ids('member', 1000)
+    assert len({id[:len('member_') + 10] for id in ids}) == 1
+
+def test_empty_batch():
+    assert generate_ids('member', 0) == []
+
+def test_keys():
+    key = generate_key('anon')
+    assert key.startswith('anon_')
+    assert len(key) == len('anon_') + 26
+    assert generate_key('anon') != key
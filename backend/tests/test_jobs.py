@@ -0,0 +1,72 @@
+import pytest
+from flask import Flask
+import jobs
+from auth import ADMIN_TOKEN
+from jobs import enqueue, init_jobs, run_one
+from tasks import HANDLERS
+
+ADMIN = {'Authorization': f"Bearer {ADMIN_TOKEN}"}
+
+@pytest.fixture
+def client(db):
+    app = Flask(__name__)
+    init_jobs(app, lambda: db(admin=True))
+    return app.test_client()
+
+def queue(db, kind, payload=None, max_attempts=3):
+    conn = db(admin=True)
+    job = enqueue(conn, kind, payload, max_attempts)
+    conn.commit()
+    conn.close()
+    return job
+
+def work(db):
+    conn = db(admin=True)
+    ran = run_one(conn, 'test-worker')
+    conn.close()
+    return ran
+
+def status(run_sql, job_id):
+    return run_sql("SELECT status, attempts, result, error FROM jobs WHERE id = %s", (job_id,))[0]
+
+def test_run_one_records_the_result(db, run_sql, monkeypatch):
+    def echo(ctx):
+        ctx.progress(1, 1)
+        return {'echo': ctx.payload['value']}
+    monkeypatch.setitem(HANDLERS, 'test.echo', echo)
+    job = queue(db, 'test.echo', {'value': 7})
+    assert work(db)
+    assert status(run_sql, job['id']) == ('succeeded', 1, {'echo': 7}, None)
+    assert not work(db)
+
+def test_failed_jobs_are_retried_then_failed(db, run_sql, monkeypatch):
+    def broken(ctx):
+        raise ValueError('boom')
+    monkeypatch.setitem(HANDLERS, 'test.broken', broken)
+    monkeypatch.setattr(jobs, 'JOB_RETRY_BASE_SECONDS', 0)
+    job = queue(db, 'test.broken', max_attempts=2)
+    assert work(db)
+    assert status(run_sql, job['id']) == ('queued', 1, None, 'ValueError: boom')
+    assert work(db)
+    assert status(run_sql, job['id']) == ('failed', 2, None, 'ValueError: boom')
+
+def test_unknown_kind_fails_at_once(db, run_sql):
+    job = queue(db, 'test.missing')
+    assert work(db)
+    assert status(run_sql, job['id'])[0] == 'failed'
+
+def test_list_jobs_limit(db, client):
+    for _ in range(3):
+        queue(db, 'test.echo')
+    assert client.get('/admin/jobs').status_code == 403
+    assert len(client.get('/admin/jobs?limit=2', headers=ADMIN).get_json()) == 2
+    response = client.get('/admin/jobs?limit=abc', headers=ADMIN)
+    assert response.status_code == 200
+    assert len(response.get_json()) == 3
+    assert len(client.get('/admin/jobs?limit=-5', headers=ADMIN).get_json()) == 1
+    assert client.get('/admin/jobs?status=failed', headers=ADMIN).get_json() == []
+
+def test_get_job(db, client):
+    job = queue(db, 'test.echo')
+    assert client.get(f"/admin/jobs/{job['id']}", headers=ADMIN).get_json()['kind'] == 'test.echo'
+    assert client.get('/admin/jobs/missing', headers=ADMIN).status_code == 404
@@ -0,0 +1,33 @@
+from mappers import RowSpec, MEMBER, FILE, FILE_WITH_CONTENT
+
+SPEC = RowSpec(
+    ('t.id', 'id'),
+    ('t.created_at', 'createdAt'),
+    ("COALESCE(t.name, '')", 'name'),
+)
+
+def test_columns():
+    assert SPEC.columns == "t.id, t.created_at, COALESCE(t.name, '')"
+    assert SPEC.keys == ('id', 'createdAt', 'name')
+
+def test_map_row():
+    assert SPEC.map_row(('a', None, 'x')) == {'id': 'a', 'createdAt': None, 'name': 'x'}
+
+def test_map_rows():
+    rows = [('a', 1, 'x'), ('b', 2, 'y')]
+    assert SPEC.map_rows(rows) == [
+        {'id': 'a', 'createdAt': 1, 'name': 'x'},
+        {'id': 'b', 'createdAt': 2, 'name': 'y'},
+    ]
+    assert SPEC.map_rows([]) == []
+
+def test_map_records_uses_select_list_order():
+    # json_agg objects are keyed by column name, not response key
+    records = [{'id': 'm1', 'team_id': 't1', 'email': 'a@b.co', 'created_at': '2025-01-01T00:00:00'}]
+    assert MEMBER.map_records(records) == [
+        {'id': 'm1', 'team_id': 't1', 'email': 'a@b.co', 'createdAt': '2025-01-01T00:00:00'},
+    ]
+
+def test_derived_spec():
+    assert FILE_WITH_CONTENT.keys == FILE.keys + ('content',)
+    assert FILE_WITH_CONTENT.columns == f"{FILE.columns}, content"
@@ -0,0 +1,63 @@
+from datetime import date, datetime, timedelta
+import pytest
+import tasks
+from jobs import run_one
+from retention import archive_path, archive_rows, compact_day
+
+@pytest.fixture
+def client(db):
+    from server import app
+    return app.test_client()
+
+def seed(db, run_sql):
+    run_sql("INSERT INTO tenants (id, name) VALUES ('t1', 'Acme')")
+    run_sql("INSERT INTO teams (id, tenant_id, name, member_count) VALUES ('tm1', 't1', 'Sales', 2)")
+    run_sql("INSERT INTO team_members (id, team_id, email) VALUES ('m1', 'tm1', 'a@x.io'), ('m2', 'tm1', 'b@x.io')")
+    old = datetime.combine(date.today() - timedelta(days=3), datetime.min.time()) + timedelta(hours=9)
+    for id, email, timestamp in (('u1', 'a@x.io', old), ('u2', 'a@x.io', datetime.now() - timedelta(minutes=5)),
+                                 ('u3', 'b@x.io', datetime.now() - timedelta(minutes=5))):
+        run_sql("INSERT INTO token_usage (id, team_id, email, tokens_in, tokens_out, cost, timestamp) "
+                "VALUES (%s, 'tm1', %s, 10, 1, 0.1, %s)", (id, email, timestamp))
+    conn = db(admin=True)
+    compact_day(conn, 't1', ['tm1'], old.date())
+    conn.close()
+    return old.date()
+
+def test_bulk_delete_validates_ids_and_emails(db, run_sql, client):
+    seed(db, run_sql)
+    url = '/tenants/t1/teams/tm1/members/bulk-delete'
+    for body in ({}, {'ids': 'm1'}, {'ids': [123]}, {'emails': ['']}, {'ids': ['m1', None]}, {'emails': [['a@x.io']]}):
+        assert client.post(url, json=body).status_code == 400, body
+    assert client.post(url, json={'ids': ['m1'], 'usage': 'forget'}).status_code == 400
+    assert run_sql("SELECT COUNT(*) FROM team_members")[0][0] == 2
+
+def test_bulk_delete_and_anonymize_usage(db, run_sql, client, archive_dir, monkeypatch):
+    compacted_day = seed(db, run_sql)
+    response = client.post('/tenants/t1/teams/tm1/members/bulk-delete',
+                           json={'emails': ['a@x.io', 'nobody@x.io'], 'usage': 'anonymize'})
+    body = response.get_json()
+    assert (body['removed'], body['notFound']) == (1, ['nobody@x.io'])
+    assert run_sql("SELECT id FROM team_members") == [('m2',)]
+    assert run_sql("SELECT member_count FROM teams")[0][0] == 1
+
+    # The queued members.scrub_usage job rewrites raw rows, rollups and the archive
+    monkeypatch.setattr(tasks, 'DELETE_PAUSE_SECONDS', 0)
+    conn = db(admin=True)
+    assert run_one(conn, 'test-worker')
+    conn.close()
+    assert run_sql("SELECT status FROM jobs") == [('succeeded',)]
+
+    emails = dict(run_sql("SELECT id, email FROM token_usage"))
+    assert emails['u3'] == 'b@x.io'
+    assert emails['u2'].startswith('removed-') and emails['u2'].endswith('@anonymized.invalid')
+    assert run_sql("SELECT email FROM token_usage_daily WHERE day = %s", (compacted_day,)) == [(emails['u2'],)]
+    assert [row[2] for row in archive_rows(archive_path('t1', compacted_day))] == [emails['u2']]
+
+def test_bulk_add_classifies_long_emails_as_invalid(db, run_sql, client):
+    seed(db, run_sql)
+    too_long = 'a' * 244 + '@example.com'
+    response = client.post('/tenants/t1/teams/tm1/members/bulk', json={'emails': ['c@x.io', too_long, 'b@x.io']})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['added'], body['invalid'], body['duplicate']) == (1, 1, 1)
+    assert run_sql("SELECT member_count FROM teams")[0][0] == 3
@@ -0,0 +1,50 @@
+from datetime import date, datetime, timedelta
+import pytest
+from retention import compact_day
+
+@pytest.fixture
+def client(db):
+    from server import app
+    return app.test_client()
+
+def seed(db, run_sql):
+    run_sql("INSERT INTO tenants (id, name) VALUES ('t1', 'Acme'), ('t2', 'Globex')")
+    run_sql("INSERT INTO teams (id, tenant_id, name, created_at) VALUES ('tm1', 't1', 'Sales', now() - interval '1 day'), "
+            "('tm2', 't1', 'Support', now()), ('tm3', 't2', 'Sales', now())")
+    run_sql("INSERT INTO files (id, tenant_id, name, size, uploaded_at) VALUES "
+            "('f1', 't1', 'a.txt', 10, now() - interval '1 hour'), ('f2', 't1', 'b.txt', 5, now()), "
+            "('f3', 't2', 'c.txt', 99, now())")
+    old = datetime.combine(date.today() - timedelta(days=3), datetime.min.time()) + timedelta(hours=9)
+    for id, team_id, email, cost, timestamp in (('u1', 'tm1', 'a@x.io', 1.0, old), ('u2', 'tm1', 'a@x.io', 2.0, datetime.now()),
+                                                ('u3', 'tm2', 'b@x.io', 0.5, datetime.now()),
+                                                ('u4', 'tm3', 'c@x.io', 9.0, datetime.now())):
+        run_sql("INSERT INTO token_usage (id, team_id, email, tokens_in, tokens_out, cost, timestamp) "
+                "VALUES (%s, %s, %s, 10, 1, %s, %s)", (id, team_id, email, cost, timestamp))
+    # u1 now only exists as a rollup
+    conn = db(admin=True)
+    compact_day(conn, 't1', ['tm1', 'tm2'], old.date())
+    conn.close()
+
+def test_overview_of_an_unknown_tenant(db, client):
+    assert client.get('/tenants/nope/overview').status_code == 404
+
+def test_overview_matches_the_separate_endpoints(db, run_sql, client, archive_dir, monkeypatch):
+    import server
+    seed(db, run_sql)
+    monkeypatch.setattr(server, 'OVERVIEW_RECENT_FILES', 1)
+    response = client.get('/tenants/t1/overview')
+    assert response.status_code == 200
+    body = response.get_json()
+
+    assert body['tenant'] == client.get('/tenants/t1').get_json()
+    assert body['teams'] == client.get('/tenants/t1/teams').get_json()
+    assert [team['id'] for team in body['teams']] == ['tm1', 'tm2']
+
+    files = body['files']
+    assert (files['count'], files['totalSize']) == (2, 15)
+    assert [f['id'] for f in files['recent']] == ['f2']
+
+    usage = {row['team_id']: (row['total_tokens_in'], row['total_cost']) for row in body['usage']['teamUsage']}
+    assert usage == {'tm1': (20, 3.0), 'tm2': (10, 0.5)}
+    users = [(row['email'], row['total_tokens'], row['total_cost']) for row in body['usage']['userUsage']]
+    assert users == [('a@x.io', 22, 3.0), ('b@x.io', 11, 0.5)]
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+import pytest
+from apply_migration_local import split_concurrent
+from quotas import QuotaManager, month_start
+
+@pytest.fixture
+def quotas(db):
+    # No background reconciles during a test
+    return QuotaManager(lambda: db(admin=True), reconcile_interval=3600)
+
+def seed(run_sql):
+    run_sql("INSERT INTO tenants (id, name) VALUES ('t1', 'Acme')")
+    run_sql("INSERT INTO teams (id, tenant_id, name, monthly_token_quota) VALUES ('tm1', 't1', 'Sales', 100), ('tm2', 't1', 'Ops', NULL)")
+    now = datetime.now()
+    for id, team_id, tokens, timestamp in (('u1', 'tm1', 60, now), ('u2', 'tm2', 70, now),
+                                           ('u3', 'tm1', 500, month_start(now) - timedelta(days=1))):
+        run_sql("INSERT INTO token_usage (id, team_id, tokens_in, tokens_out, cost, timestamp) VALUES (%s, %s, %s, 0, 1.0, %s)",
+                (id, team_id, tokens, timestamp))
+
+def test_limits_and_usage_are_loaded(db, run_sql, quotas):
+    seed(run_sql)
+    assert quotas.check('tm1') is None
+    assert quotas.usage == {'tm1': [60, 1.0]}
+    assert quotas.check('tm2') is None
+    quotas.add('tm1', 40, 0.5)
+    assert quotas.check('tm1') == {'metric': 'tokens', 'limit': 100, 'used': 100}
+
+def test_limit_on_an_untracked_team_loads_only_that_team(db, run_sql, quotas, monkeypatch):
+    seed(run_sql)
+    quotas.check('tm1')
+    monkeypatch.setattr(quotas, 'reconcile', lambda: pytest.fail('full reconcile on the request path'))
+    quotas.set_limits('tm2', 50, None)
+    assert quotas.usage['tm2'] == [70, 1.0]
+    assert quotas.check('tm2') == {'metric': 'tokens', 'limit': 50, 'used': 70}
+
+    quotas.set_limits('tm3', 10, None, new_team=True)
+    assert quotas.usage['tm3'] == [0, 0.0]
+    quotas.set_limits('tm2', None, None)
+    assert quotas.check('tm2') is None
+
+def test_concurrent_index_runs_outside_the_migration_script():
+    sql, indexes = split_concurrent("ALTER TABLE teams ADD COLUMN x INT;\n"
+                                    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_a ON token_usage (team_id, timestamp);\n")
+    assert sql == "ALTER TABLE teams ADD COLUMN x INT;\n\n"
+    assert indexes == [('idx_a', "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_a ON token_usage (team_id, timestamp);")]
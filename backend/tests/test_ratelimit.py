@@ -0,0 +1,54 @@
+import pytest
+import ratelimit
+from ratelimit import MemoryBackend, _limits_from_settings
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, 'monotonic', lambda: now[0])
+    return now
+
+def test_burst_then_wait(clock):
+    backend = MemoryBackend()
+    for _ in range(3):
+        assert backend.acquire([('team:a', 1.0, 3.0)]) == 0
+    assert backend.acquire([('team:a', 1.0, 3.0)]) == pytest.approx(1.0)
+
+def test_refill(clock):
+    backend = MemoryBackend()
+    for _ in range(2):
+        backend.acquire([('team:a', 2.0, 2.0)])
+    clock[0] += 0.25
+    assert backend.acquire([('team:a', 2.0, 2.0)]) == pytest.approx(0.25)
+    clock[0] += 0.25
+    assert backend.acquire([('team:a', 2.0, 2.0)]) == 0
+
+def test_refill_is_capped_at_burst(clock):
+    backend = MemoryBackend()
+    backend.acquire([('team:a', 1.0, 2.0)])
+    clock[0] += 3600
+    assert backend.acquire([('team:a', 1.0, 2.0)]) == 0
+    assert backend.acquire([('team:a', 1.0, 2.0)]) == 0
+    assert backend.acquire([('team:a', 1.0, 2.0)]) > 0
+
+def test_denied_request_takes_no_token(clock):
+    backend = MemoryBackend()
+    tenant, team = ('tenant:t', 1.0, 5.0), ('team:a', 1.0, 1.0)
+    assert backend.acquire([tenant, team]) == 0
+    # The team bucket is empty: the tenant bucket must not pay for the denials
+    for _ in range(10):
+        assert backend.acquire([tenant, team]) > 0
+    assert backend.buckets['tenant:t'][0] == pytest.approx(4.0)
+    assert backend.acquire([tenant, ('team:b', 1.0, 1.0)]) == 0
+
+def test_wait_is_the_longest_of_the_denials(clock):
+    backend = MemoryBackend()
+    backend.acquire([('tenant:t', 1.0, 1.0), ('team:a', 0.5, 1.0)])
+    assert backend.acquire([('tenant:t', 1.0, 1.0), ('team:a', 0.5, 1.0)]) == pytest.approx(2.0)
+
+def test_limits_from_settings(monkeypatch):
+    monkeypatch.setattr(ratelimit, 'DEFAULT_LIMITS', {'tenant': {'rate': 0, 'burst': 0}, 'team': {'rate': 0, 'burst': 0}})
+    assert _limits_from_settings(None) == {'tenant': None, 'team': None}
+    limits = _limits_from_settings({'rateLimits': {'tenant': {'rate': 50, 'burst': 100}, 'team': {'rate': 0.5}}})
+    # Burst defaults to the rate and never drops below one request
+    assert limits == {'tenant': (50.0, 100.0), 'team': (0.5, 1.0)}
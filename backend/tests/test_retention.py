@@ -0,0 +1,75 @@
+from datetime import date, datetime, timedelta
+import os
+import retention
+from jobs import enqueue, enqueue_daily, run_one
+from retention import USAGE_SOURCES, archive_path, archive_rows
+
+OLD = date.today() - timedelta(days=40)
+RECENT = date.today() - timedelta(days=5)
+
+def at(day, hour):
+    return datetime.combine(day, datetime.min.time()) + timedelta(hours=hour)
+
+def usage(run_sql, id, team_id, timestamp, tokens_in=10):
+    run_sql("INSERT INTO token_usage (id, team_id, email, tokens_in, tokens_out, cost, timestamp) "
+            "VALUES (%s, %s, 'a@x.io', %s, 1, 0.5, %s)", (id, team_id, tokens_in, timestamp))
+
+def seed(run_sql):
+    run_sql("INSERT INTO tenants (id, name, usage_retention_days) VALUES ('t1', 'Acme', 30), ('t2', 'Keep', NULL)")
+    run_sql("INSERT INTO teams (id, tenant_id, name) VALUES ('tm1', 't1', 'Sales'), ('tm2', 't2', 'Ops')")
+    usage(run_sql, 'u1', 'tm1', at(OLD, 9))
+    usage(run_sql, 'u2', 'tm1', at(OLD, 17), 20)
+    usage(run_sql, 'u3', 'tm1', at(RECENT, 9), 40)
+    usage(run_sql, 'u4', 'tm2', at(OLD, 9))
+
+def totals(run_sql, tenant_id):
+    # Tokens in raw rows plus rollups
+    return int(run_sql(f"SELECT COALESCE(SUM(tokens_in), 0) FROM ({USAGE_SOURCES}) s", (tenant_id, tenant_id))[0][0])
+
+def run_retention(db):
+    conn = db(admin=True)
+    enqueue(conn, 'usage.retention')
+    conn.commit()
+    assert run_one(conn, 'test-worker')
+    conn.close()
+
+def test_daily_jobs_are_enqueued_once_per_day(db, run_sql):
+    conn = db(admin=True)
+    enqueue_daily(conn, date(2025, 1, 1))
+    enqueue_daily(conn, date(2025, 1, 1))
+    enqueue_daily(conn, date(2025, 1, 2))
+    conn.close()
+    assert run_sql("SELECT kind, COUNT(*) FROM jobs GROUP BY kind") == [('usage.retention', 2)]
+
+def test_retention_compacts_days_outside_the_window(db, run_sql, archive_dir):
+    seed(run_sql)
+    before = totals(run_sql, 't1')
+    run_retention(db)
+    assert run_sql("SELECT status FROM jobs") == [('succeeded',)]
+
+    assert run_sql("SELECT id FROM token_usage ORDER BY id") == [('u3',), ('u4',)]
+    assert sorted(row[0] for row in archive_rows(archive_path('t1', OLD))) == ['u1', 'u2']
+    assert run_sql("SELECT day, tokens_in, events FROM token_usage_daily") == [(OLD, 30, 2)]
+    assert run_sql("SELECT usage_compacted_before FROM tenants WHERE id = 't1'") == [(OLD + timedelta(days=1),)]
+    # Tenants without a retention setting fall back to USAGE_RETENTION_DAYS=0: kept as is
+    assert not os.path.exists(archive_path('t2', OLD))
+    assert totals(run_sql, 't1') == before
+
+def test_late_rows_are_folded_in_by_the_next_run(db, run_sql, archive_dir):
+    seed(run_sql)
+    run_retention(db)
+    usage(run_sql, 'u5', 'tm1', at(OLD, 20), 100)
+    # Before the cutoff: ignored until compacted, never counted twice
+    assert totals(run_sql, 't1') == 70
+    run_retention(db)
+    assert totals(run_sql, 't1') == 170
+    assert sorted(row[0] for row in archive_rows(archive_path('t1', OLD))) == ['u1', 'u2', 'u5']
+    assert run_sql("SELECT id FROM token_usage WHERE team_id = 'tm1'") == [('u3',)]
+
+def test_rows_awaiting_deletion_count_once(db, run_sql, archive_dir, monkeypatch):
+    # A run that dies after advancing the cutoff leaves raw rows behind
+    seed(run_sql)
+    monkeypatch.setattr(retention, 'delete_ids', lambda conn, ids, progress=None: 0)
+    run_retention(db)
+    assert run_sql("SELECT COUNT(*) FROM token_usage WHERE team_id = 'tm1'") == [(3,)]
+    assert totals(run_sql, 't1') == 70
@@ -0,0 +1,47 @@
+import pytest
+from search import like_escape
+
+@pytest.fixture
+def client(db):
+    from server import app
+    return app.test_client()
+
+@pytest.fixture
+def seeded(run_sql):
+    run_sql("INSERT INTO tenants (id, name) VALUES ('t1', 'Acme Corp'), ('t2', 'Big Acme'), "
+            "('t3', 'Globex'), ('t4', 'Acme Gone')")
+    run_sql("UPDATE tenants SET deleted_at = now() WHERE id = 't4'")
+    run_sql("INSERT INTO teams (id, tenant_id, name) VALUES ('tm1', 't1', 'Sales'), ('tm2', 't1', 'Support'), "
+            "('tm3', 't2', 'Sales')")
+    run_sql("INSERT INTO team_members (id, team_id, email) VALUES ('m1', 'tm1', 'john@acme.io'), "
+            "('m2', 'tm2', 'johnny@acme.io'), ('m3', 'tm3', 'john@bigacme.io')")
+
+def ids(response):
+    assert response.status_code == 200
+    return [result['id'] for result in response.get_json()['results']]
+
+def test_like_escape():
+    assert like_escape('50%_off\\') == '50\\%\\_off\\\\'
+
+def test_q_is_required(seeded, client):
+    for url in ('/tenants/search', '/tenants/search?q=%20', '/tenants/t1/teams/search', '/tenants/t1/members/search'):
+        assert client.get(url).status_code == 400, url
+
+def test_prefix_matches_rank_first(seeded, client):
+    assert ids(client.get('/tenants/search?q=acme')) == ['t1', 't2']
+    result = client.get('/tenants/search?q=acme&limit=1&offset=1').get_json()
+    assert (result['limit'], result['offset'], [r['id'] for r in result['results']]) == (1, 1, ['t2'])
+
+def test_typos_are_tolerated(seeded, client):
+    assert ids(client.get('/tenants/search?q=globx')) == ['t3']
+    assert ids(client.get('/tenants/search?q=zzzz')) == []
+
+def test_like_wildcards_match_literally(seeded, client):
+    assert ids(client.get('/tenants/search?q=%25')) == []
+
+def test_team_and_member_search_stay_in_the_tenant(seeded, client):
+    assert ids(client.get('/tenants/t1/teams/search?q=sales')) == ['tm1']
+    assert ids(client.get('/tenants/t2/teams/search?q=sales')) == ['tm3']
+    assert ids(client.get('/tenants/t1/members/search?q=john')) == ['m1', 'm2']
+    assert ids(client.get('/tenants/t1/members/search?q=john&teamId=tm2')) == ['m2']
+    assert ids(client.get('/tenants/t1/members/search?q=john&teamId=tm3')) == []
@@ -0,0 +1,91 @@
+import pytest
+import tasks
+from jobs import run_one
+from softdelete import DeletedTenants
+
+@pytest.fixture
+def client(db, archive_dir, monkeypatch):
+    import server
+    # The per-worker set outlives the test; start and end with an empty one
+    monkeypatch.setattr(server.deleted_tenants, 'expires', 0.0)
+    monkeypatch.setattr(server.deleted_tenants, 'ids', frozenset())
+    monkeypatch.setattr(tasks, 'DELETE_PAUSE_SECONDS', 0)
+    return server.app.test_client()
+
+def seed(run_sql):
+    run_sql("INSERT INTO tenants (id, name) VALUES ('gone', 'Gone'), ('kept', 'Kept')")
+    run_sql("INSERT INTO teams (id, tenant_id, name) VALUES ('tm1', 'gone', 'Sales'), ('tm2', 'kept', 'Ops')")
+    run_sql("INSERT INTO team_members (id, team_id, email) VALUES ('m1', 'tm1', 'a@x.io'), ('m2', 'tm2', 'b@x.io')")
+    run_sql("INSERT INTO token_usage (id, team_id, email, tokens_in, timestamp) "
+            "VALUES ('u1', 'tm1', 'a@x.io', 10, now()), ('u2', 'tm2', 'b@x.io', 10, now())")
+    run_sql("INSERT INTO files (id, tenant_id, name, size) VALUES ('f1', 'gone', 'a.txt', 1), ('f2', 'kept', 'b.txt', 1)")
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self):
+        return self
+
+    def execute(self, query, vars=None):
+        pass
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+def test_deleted_tenants_are_cached_for_the_ttl():
+    calls = []
+    rows = [('t1',)]
+    def connect():
+        calls.append(1)
+        return FakeConnection(list(rows))
+
+    deleted = DeletedTenants(connect, ttl=60)
+    assert deleted.contains('t1') and not deleted.contains('t2')
+    rows.append(('t2',))
+    assert not deleted.contains('t2')
+    assert len(calls) == 1
+
+    # The worker that handled the DELETE knows at once
+    deleted.add('t3')
+    assert deleted.contains('t3')
+
+    deleted.expires = 0.0
+    assert deleted.contains('t2')
+    assert len(calls) == 2
+
+def test_deleted_tenants_keep_the_last_set_without_a_database():
+    rows = [('t1',)]
+    connections = [FakeConnection(rows), None]
+    deleted = DeletedTenants(lambda: connections.pop(0), ttl=60)
+    assert deleted.contains('t1')
+    deleted.expires = 0.0
+    assert deleted.contains('t1')
+    assert not connections
+
+def test_delete_hides_the_tenant_until_the_purge_removes_it(db, run_sql, client):
+    seed(run_sql)
+    response = client.delete('/tenants/gone')
+    assert response.status_code == 202
+    assert response.get_json()['kind'] == 'tenant.delete'
+    assert client.delete('/tenants/gone').status_code == 404
+
+    assert client.get('/tenants/gone/teams').status_code == 404
+    assert client.get('/tenants/kept/teams').status_code == 200
+    assert [t['id'] for t in client.get('/tenants').get_json()] == ['kept']
+
+    conn = db(admin=True)
+    assert run_one(conn, 'test-worker')
+    conn.close()
+    status, result = run_sql("SELECT status, result FROM jobs")[0]
+    assert status == 'succeeded'
+    assert result == {'usage': 1, 'rollups': 0, 'members': 1, 'files': 1, 'tenant': 1, 'teams': 1}
+
+    assert run_sql("SELECT id FROM tenants") == [('kept',)]
+    assert run_sql("SELECT id FROM teams") == [('tm2',)]
+    assert run_sql("SELECT id FROM team_members") == [('m2',)]
+    assert run_sql("SELECT id FROM token_usage") == [('u2',)]
+    assert run_sql("SELECT id FROM files") == [('f2',)]
@@ -0,0 +1,40 @@
+import pytest
+
+@pytest.fixture
+def client(db, run_sql):
+    from server import app
+    run_sql("INSERT INTO tenants (id, name) VALUES ('t1', 'Acme')")
+    return app.test_client()
+
+def test_bulk_create_returns_teams_in_request_order(client, run_sql):
+    response = client.post('/tenants/t1/teams/bulk', json={'teams': [
+        {'name': 'Sales', 'provider': 'gemini', 'monthlyTokenQuota': 1000},
+        {'name': 'Ops', 'provider': 'openai', 'monthlyCostQuota': 2.5},
+    ]})
+    assert response.status_code == 200
+    teams = response.get_json()
+    assert [(t['name'], t['monthlyTokenQuota'], t['monthlyCostQuota']) for t in teams] == \
+        [('Sales', 1000, None), ('Ops', None, 2.5)]
+    assert run_sql("SELECT COUNT(*) FROM teams")[0][0] == 2
+
+def test_bulk_create_reports_every_invalid_row(client, run_sql):
+    response = client.post('/tenants/t1/teams/bulk', json={'teams': [
+        {'name': 'Sales', 'provider': 'gemini', 'monthlyTokenQuota': -1},
+        {'name': 'Ops', 'provider': 'gemini'},
+        {'provider': 'gemini'},
+        {'name': 'Support', 'provider': 'gemini', 'monthlyCostQuota': 'lots'},
+        {'name': 'Legal', 'provider': 'gemini', 'monthlyTokenQuota': 1.5},
+    ]})
+    assert response.status_code == 400
+    assert [error['index'] for error in response.get_json()['details']] == [0, 2, 3, 4]
+    assert run_sql("SELECT COUNT(*) FROM teams")[0][0] == 0
+
+def test_bulk_create_for_a_missing_tenant(client):
+    response = client.post('/tenants/missing/teams/bulk', json=[{'name': 'Sales', 'provider': 'gemini'}])
+    assert response.status_code == 404
+
+def test_single_create_and_update_validate_quotas(client):
+    assert client.post('/tenants/t1/teams', json={'name': 'Sales', 'provider': 'gemini', 'monthlyCostQuota': -2}).status_code == 400
+    team = client.post('/tenants/t1/teams', json={'name': 'Sales', 'provider': 'gemini', 'monthlyTokenQuota': 10}).get_json()
+    assert client.patch(f"/tenants/t1/teams/{team['id']}", json={'monthlyTokenQuota': 'ten'}).status_code == 400
+    assert client.patch(f"/tenants/t1/teams/{team['id']}", json={'monthlyTokenQuota': None}).get_json()['monthlyTokenQuota'] is None
@@ -0,0 +1,130 @@
+import psycopg2.extensions
+from psycopg2 import sql
+from search import ranked, search_params
+from tenancy import ScopedCursor
+
+IDLE = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+INTRANS = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+
+class FakeInfo:
+    def __init__(self, status):
+        self.transaction_status = status
+
+class FakeConnection:
+    encoding = 'UTF8'
+
+    def __init__(self, tenant_id, status=IDLE, autocommit=False, admin=False):
+        self.tenant_id = tenant_id
+        self.admin = admin
+        self.info = FakeInfo(status)
+        self.autocommit = autocommit
+
+class FakeCursor:
+    # Just enough of a cursor for ScopedCursor._scoped
+    def __init__(self, connection):
+        self.connection = connection
+
+    def mogrify(self, query, vars):
+        return (query % tuple(psycopg2.extensions.adapt(v).getquoted().decode() for v in vars)).encode()
+
+def scoped(conn, query, vars=None):
+    return ScopedCursor._scoped(FakeCursor(conn), query, vars)
+
+def test_connection_without_scope_is_untouched():
+    assert scoped(FakeConnection(None), "SELECT 1") == "SELECT 1"
+
+def test_first_statement_is_prefixed():
+    assert scoped(FakeConnection('tenant_1'), "SELECT 1") == \
+        b"SELECT set_config('app.tenant_id', 'tenant_1', true);SELECT 1"
+
+def test_prefix_percent_is_escaped_with_vars():
+    # The tenant id is interpolated again by execute() when vars are passed
+    query = scoped(FakeConnection('t%1'), "SELECT * FROM teams WHERE id = %s", ('x',))
+    assert query == b"SELECT set_config('app.tenant_id', 't%%1', true);SELECT * FROM teams WHERE id = %s"
+    assert scoped(FakeConnection('t%1'), "SELECT 1") == b"SELECT set_config('app.tenant_id', 't%1', true);SELECT 1"
+
+def test_later_statements_in_a_transaction_are_not_prefixed():
+    assert scoped(FakeConnection('tenant_1', INTRANS), "SELECT 1") == "SELECT 1"
+
+def test_autocommit_prefixes_every_statement():
+    query = scoped(FakeConnection('tenant_1', INTRANS, autocommit=True), "SELECT 1")
+    assert query.startswith(b"SELECT set_config(")
+
+def test_composed_queries():
+    conn = FakeConnection('tenant_1')
+    cursor = FakeCursor(conn)
+    query = sql.SQL("SELECT 1")
+    assert ScopedCursor._scoped(cursor, query, None) == b"SELECT set_config('app.tenant_id', 'tenant_1', true);SELECT 1"
+
+def test_admin_connection_switches_role():
+    assert scoped(FakeConnection(None, admin=True), "SELECT 1") == b'SET LOCAL ROLE "tenant_admin";SELECT 1'
+    assert scoped(FakeConnection(None, INTRANS, admin=True), "SELECT 1") == "SELECT 1"
+
+# --- Against the database ---
+
+def fetch(conn, query, vars=None):
+    cur = conn.cursor()
+    cur.execute(query, vars)
+    rows = cur.fetchall()
+    cur.close()
+    conn.rollback()
+    return rows
+
+def seed(connect):
+    conn = connect(admin=True)
+    cur = conn.cursor()
+    for tenant in ('t1', 't2'):
+        cur.execute("INSERT INTO tenants (id, name) VALUES (%s, %s)", (tenant, f"Acme {tenant}"))
+        cur.execute("INSERT INTO teams (id, tenant_id, name) VALUES (%s, %s, 'Sales')", (f"team_{tenant}", tenant))
+    conn.commit()
+    conn.close()
+
+def test_connection_without_scope_sees_nothing(db):
+    seed(db)
+    conn = db()
+    assert fetch(conn, "SELECT id FROM tenants") == []
+    assert fetch(conn, "SELECT id FROM teams") == []
+    conn.close()
+
+def test_tenant_connection_sees_its_own_rows(db):
+    seed(db)
+    conn = db('t1')
+    assert fetch(conn, "SELECT id FROM tenants") == [('t1',)]
+    assert fetch(conn, "SELECT id FROM teams") == [('team_t1',)]
+    conn.close()
+
+def test_admin_connection_sees_every_tenant(db):
+    seed(db)
+    conn = db(admin=True)
+    assert fetch(conn, "SELECT id FROM tenants ORDER BY id") == [('t1',), ('t2',)]
+    conn.close()
+    # The role ends with the transaction and is not kept by the pool
+    conn = db()
+    assert fetch(conn, "SELECT id FROM tenants") == []
+    conn.close()
+
+def plan(conn, query, vars):
+    # Small tables are cheaper to scan: only an unusable index leaves a Seq Scan
+    cur = conn.cursor()
+    cur.execute("SET LOCAL enable_seqscan = off")
+    cur.execute("EXPLAIN " + query, vars)
+    rows = "\n".join(row[0] for row in cur.fetchall())
+    cur.close()
+    conn.rollback()
+    return rows
+
+def test_admin_connection_uses_search_indexes(db):
+    seed(db)
+    condition, _ = ranked('name')
+    query = f"SELECT id FROM tenants WHERE {condition}"
+    vars = search_params('acme', 10, 0)
+
+    conn = db(admin=True)
+    assert 'idx_tenants_name_trgm' in plan(conn, query, vars)
+    assert 'idx_tenants_name_prefix' in plan(conn, "SELECT id FROM tenants WHERE lower(name) LIKE %s", ('acme%',))
+    conn.close()
+
+    # Under the policy ILIKE and <% are not leakproof, so the index is skipped
+    conn = db('t1')
+    assert 'idx_tenants_name_trgm' not in plan(conn, query, vars)
+    conn.close()
@@ -0,0 +1,49 @@
+from datetime import datetime
+import pytest
+
+@pytest.fixture
+def client(db):
+    from server import app
+    return app.test_client()
+
+def seed(run_sql):
+    for i, (name, status) in enumerate((('Acme', 'active'), ('acorn', 'disabled'), ('Beta', 'active'), ('Gone', 'active'))):
+        run_sql("INSERT INTO tenants (id, name, status, created_at) VALUES (%s, %s, %s, %s)",
+                (f"t{i}", name, status, datetime(2025, 1, i + 1)))
+    run_sql("UPDATE tenants SET deleted_at = now() WHERE name = 'Gone'")
+    run_sql("INSERT INTO teams (id, tenant_id, name, member_count) VALUES ('tm1', 't2', 'Sales', 3), ('tm2', 't2', 'Ops', 1)")
+
+def names(response):
+    return [tenant['name'] for tenant in response.get_json()]
+
+def test_filters_and_sorting(client, run_sql):
+    seed(run_sql)
+    response = client.get('/tenants')
+    assert names(response) == ['Acme', 'acorn', 'Beta']
+    assert response.headers['X-Total-Count'] == '3'
+    assert names(client.get('/tenants?q=ac')) == ['Acme', 'acorn']
+    assert names(client.get('/tenants?q=a_')) == []
+    assert names(client.get('/tenants?status=active&sort=-createdAt')) == ['Beta', 'Acme']
+    assert client.get('/tenants?sort=teamCount').status_code == 400
+
+def test_pagination_reports_the_total(client, run_sql):
+    seed(run_sql)
+    response = client.get('/tenants?limit=2&offset=1')
+    assert names(response) == ['acorn', 'Beta']
+    assert response.headers['X-Total-Count'] == '3'
+    # Past the end: no rows, same total
+    response = client.get('/tenants?limit=2&offset=10')
+    assert response.get_json() == []
+    assert response.headers['X-Total-Count'] == '3'
+    response = client.get('/tenants?q=zzz')
+    assert response.get_json() == []
+    assert response.headers['X-Total-Count'] == '0'
+
+def test_stats_on_the_page(client, run_sql):
+    seed(run_sql)
+    tenants = client.get('/tenants?include=stats&sort=-memberCount&limit=1').get_json()
+    assert [(t['name'], t['teamCount'], t['memberCount'], t['cost30d']) for t in tenants] == [('Beta', 2, 4, 0)]
+
+def test_total_header_is_exposed_to_browsers(client, run_sql):
+    response = client.get('/tenants', headers={'Origin': 'http://localhost:5173'})
+    assert 'X-Total-Count' in response.headers['Access-Control-Expose-Headers']
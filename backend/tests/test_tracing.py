@@ -0,0 +1,14 @@
+from tracing import normalize, redact
+
+def test_normalize_replaces_literals():
+    query = "SELECT *  FROM teams\n  WHERE name = 'O''Brien' AND member_count > 10 AND cost < 2.5"
+    assert normalize(query) == "SELECT * FROM teams WHERE name = ? AND member_count > ? AND cost < ?"
+
+def test_normalize_keeps_identifiers_and_placeholders():
+    query = "SELECT t2.id FROM token_usage_daily t2 WHERE t2.team_id = %s LIMIT %s"
+    assert normalize(query) == query
+
+def test_redact_keeps_only_types():
+    assert redact(('a@b.co', 3, None, 1.5)) == ['<str>', '<int>', '<NoneType>', '<float>']
+    assert redact({'team_ids': ['t1']}) == {'team_ids': '<list>'}
+    assert redact(None) is None
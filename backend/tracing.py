@@ -0,0 +1,208 @@
+import os
+import re
+import json
+import time
+import queue
+import threading
+import urllib.request
+from collections import deque
+from flask import g, request, has_request_context, jsonify
+from auth import require_admin
+
+# Statement-level tracing for psycopg2.
+#
+# metrics.InstrumentedCursor reports every statement here with its duration
+# and row count. Each request becomes a trace: one server span for the route
+# and one client span per SQL statement, carrying the normalized statement
+# text (literals replaced by ?). Statements slower than SLOW_QUERY_MS are kept
+# in an in-memory ring buffer with their parameters redacted to type names,
+# readable at GET /admin/slow-queries.
+#
+# TRACE_EXPORT selects where finished traces go, in OTLP/JSON format:
+#   none  (default) keep only the slow query buffer
+#   file  append one ExportTraceServiceRequest per line to TRACE_EXPORT_FILE
+#   otlp  POST to an OpenTelemetry collector at TRACE_OTLP_ENDPOINT
+# TRACE_SAMPLE_RATE is the fraction of requests exported (slow statements are
+# always buffered).
+
+SERVICE_NAME = 'tenant-portal-backend'
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "none")
+TRACE_EXPORT_FILE = os.getenv("TRACE_EXPORT_FILE", "traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 1.0))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 100))
+SLOW_QUERY_BUFFER = int(os.getenv("SLOW_QUERY_BUFFER", 200))
+
+EXPORT_BATCH_SIZE = 512
+EXPORT_INTERVAL = 2.0
+
+slow_queries = deque(maxlen=SLOW_QUERY_BUFFER)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize(query):
+    query = _STRING_LITERAL.sub('?', query)
+    query = _NUMBER_LITERAL.sub('?', query)
+    return _WHITESPACE.sub(' ', query).strip()
+
+def redact(params):
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {k: f"<{type(v).__name__}>" for k, v in params.items()}
+    return [f"<{type(v).__name__}>" for v in params]
+
+def _new_id(nbytes):
+    return os.urandom(nbytes).hex()
+
+# --- Request hooks ---
+
+def _current_trace():
+    if not has_request_context():
+        return None
+    return g.get('_trace')
+
+def _route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+def _before_request():
+    g._trace = {
+        'trace_id': _new_id(16),
+        'span_id': _new_id(8),
+        'start_ns': time.time_ns(),
+        'sampled': TRACE_EXPORT != 'none' and os.urandom(1)[0] < TRACE_SAMPLE_RATE * 256,
+        'spans': [],
+    }
+
+def _after_request(response):
+    trace = g.pop('_trace', None)
+    if trace is None or not trace['sampled']:
+        return response
+    route = _route()
+    trace['spans'].append(_span(
+        trace['trace_id'], trace['span_id'], None, f"{request.method} {route}", 2,
+        trace['start_ns'], time.time_ns(),
+        {'http.method': request.method, 'http.route': route, 'http.status_code': response.status_code}
+    ))
+    _exporter().submit(trace['spans'])
+    return response
+
+def record_query(query, params, start_ns, duration, rows):
+    statement = normalize(query)
+    trace = _current_trace()
+    route = _route() if has_request_context() else None
+
+    if duration * 1000 >= SLOW_QUERY_MS:
+        slow_queries.append({
+            'statement': statement,
+            'params': redact(params),
+            'durationMs': round(duration * 1000, 3),
+            'rows': rows,
+            'route': route,
+            'traceId': trace['trace_id'] if trace else None,
+            'at': start_ns // 1_000_000,
+        })
+
+    if trace is not None and trace['sampled']:
+        trace['spans'].append(_span(
+            trace['trace_id'], _new_id(8), trace['span_id'], statement.split(' ', 1)[0].upper(), 3,
+            start_ns, start_ns + int(duration * 1e9),
+            {'db.system': 'postgresql', 'db.statement': statement, 'db.rows': rows, 'http.route': route}
+        ))
+
+# --- OTLP/JSON export ---
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+def _span(trace_id, span_id, parent_id, name, kind, start_ns, end_ns, attributes):
+    span = {
+        'traceId': trace_id,
+        'spanId': span_id,
+        'name': name,
+        'kind': kind,
+        'startTimeUnixNano': str(start_ns),
+        'endTimeUnixNano': str(end_ns),
+        'attributes': [_attribute(k, v) for k, v in attributes.items() if v is not None],
+    }
+    if parent_id:
+        span['parentSpanId'] = parent_id
+    return span
+
+def _envelope(spans):
+    return {'resourceSpans': [{
+        'resource': {'attributes': [_attribute('service.name', SERVICE_NAME)]},
+        'scopeSpans': [{'scope': {'name': 'tenant-portal.sql'}, 'spans': spans}],
+    }]}
+
+class SpanExporter:
+    def __init__(self, target):
+        self.target = target
+        self.queue = queue.Queue(maxsize=10000)
+        self.pid = os.getpid()
+        self.thread = threading.Thread(target=self._run, name='span-exporter', daemon=True)
+        self.thread.start()
+
+    def submit(self, spans):
+        try:
+            self.queue.put_nowait(spans)
+        except queue.Full:
+            pass # Drop rather than slow down requests
+
+    def _run(self):
+        while True:
+            batch = list(self.queue.get())
+            deadline = time.monotonic() + EXPORT_INTERVAL
+            while len(batch) < EXPORT_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.extend(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._export(batch)
+            except Exception as e:
+                print(f"Error exporting spans: {e}")
+
+    def _export(self, spans):
+        payload = json.dumps(_envelope(spans))
+        if self.target == 'file':
+            with open(TRACE_EXPORT_FILE, 'a') as f:
+                f.write(payload + '\n')
+        elif self.target == 'otlp':
+            req = urllib.request.Request(TRACE_OTLP_ENDPOINT, data=payload.encode(),
+                                         headers={'Content-Type': 'application/json'})
+            urllib.request.urlopen(req, timeout=5).close()
+
+_exporter_instance = None
+_exporter_lock = threading.Lock()
+
+def _exporter():
+    # Started lazily in each worker: threads do not survive gunicorn's fork
+    global _exporter_instance
+    if _exporter_instance is None or _exporter_instance.pid != os.getpid():
+        with _exporter_lock:
+            if _exporter_instance is None or _exporter_instance.pid != os.getpid():
+                _exporter_instance = SpanExporter(TRACE_EXPORT)
+    return _exporter_instance
+
+def init_tracing(app):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+    @app.route('/admin/slow-queries', methods=['GET'])
+    @require_admin
+    def get_slow_queries():
+        return jsonify({
+            'thresholdMs': SLOW_QUERY_MS,
+            'queries': sorted(list(slow_queries), key=lambda q: q['durationMs'], reverse=True)
+        })
@@ -15,10 +15,16 @@ const getAuthHeaders = () => {
 
 export const ApiService = {
     // --- Admin ---
-    getTenants: async (): Promise<Tenant[]> => {
-        const res = await fetch(`${API_URL}/tenants`);
+    // include: 'stats' adds teamCount, memberCount and cost30d to each tenant
+    // total is the number of matching tenants before limit/offset (X-Total-Count)
+    getTenants: async (params?: { status?: string, q?: string, sort?: string, limit?: number, offset?: number, include?: 'stats' }): Promise<{ tenants: Tenant[], total: number }> => {
+        const query = new URLSearchParams(
+            Object.entries(params || {}).filter(([, v]) => v !== undefined).map(([k, v]) => [k, String(v)])
+        ).toString();
+        const res = await fetch(`${API_URL}/tenants${query ? `?${query}` : ''}`);
         if (!res.ok) throw new Error('Failed to fetch tenants');
-        return res.json();
+        const tenants: Tenant[] = await res.json();
+        return { tenants, total: Number(res.headers.get('X-Total-Count') ?? tenants.length) };
     },
 
     createTenant: async (name: string): Promise<Tenant> => {
@@ -31,6 +37,16 @@ export const ApiService = {
         return res.json();
     },
 
+    createTenantsBulk: async (tenants: { name: string, provider?: string, model?: string, apiKey?: string }[]): Promise<Tenant[]> => {
+        const res = await fetch(`${API_URL}/tenants/bulk`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ tenants }),
+        });
+        if (!res.ok) throw new Error('Failed to create tenants');
+        return res.json();
+    },
+
     updateTenantStatus: async (id: string, status: 'active' | 'disabled'): Promise<Tenant> => {
         const res = await fetch(`${API_URL}/tenants/${id}/status`, {
             method: 'PATCH',
@@ -48,6 +64,20 @@ export const ApiService = {
         return res.json();
     },
 
+    // The tenant disappears at once; its data is purged by the returned background job
+    deleteTenant: async (id: string): Promise<any> => {
+        const res = await fetch(`${API_URL}/tenants/${id}`, { method: 'DELETE' });
+        if (!res.ok) throw new Error('Failed to delete tenant');
+        return res.json();
+    },
+
+    // Tenant, teams (with memberCount), file summary and usage in one request
+    getTenantOverview: async (id: string): Promise<{ tenant: Tenant, teams: Team[], files: { count: number, totalSize: number, lastUploadedAt: string | null, recent: TenantFile[] }, usage: { teamUsage: any[], userUsage: any[] } }> => {
+        const res = await fetch(`${API_URL}/tenants/${id}/overview`);
+        if (!res.ok) throw new Error('Failed to fetch tenant overview');
+        return res.json();
+    },
+
     regenerateApiKey: async (id: string): Promise<string> => {
         throw new Error("Not implemented in basic backend");
     },
@@ -128,6 +158,16 @@ export const ApiService = {
         return res.json();
     },
 
+    createTeamsBulk: async (tenantId: string, teams: Omit<Team, 'id' | 'createdAt'>[]): Promise<Team[]> => {
+        const res = await fetch(`${API_URL}/tenants/${tenantId}/teams/bulk`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ teams }),
+        });
+        if (!res.ok) throw new Error('Failed to create teams');
+        return res.json();
+    },
+
     updateTeam: async (tenantId: string, teamId: string, data: Partial<Team>): Promise<Team> => {
         const res = await fetch(`${API_URL}/tenants/${tenantId}/teams/${teamId}`, {
             method: 'PATCH',
@@ -152,12 +192,68 @@ export const ApiService = {
         return res.json();
     },
 
+    // Accepts a list of emails or a CSV file with an "email" column (or one email per line)
+    bulkAddTeamMembers: async (tenantId: string, teamId: string, emails: string[] | File): Promise<{ added: number, duplicate: number, invalid: number, results: any[] }> => {
+        let init: RequestInit;
+        if (emails instanceof File) {
+            const formData = new FormData();
+            formData.append('file', emails);
+            init = { method: 'POST', body: formData };
+        } else {
+            init = {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ emails }),
+            };
+        }
+        const res = await fetch(`${API_URL}/tenants/${tenantId}/teams/${teamId}/members/bulk`, init);
+        if (!res.ok) {
+            const err = await res.json();
+            throw new Error(err.error || 'Failed to import members');
+        }
+        return res.json();
+    },
+
+    // usage: 'purge' clears the email on the member's past usage, 'anonymize' replaces it (background job)
+    removeTeamMember: async (tenantId: string, teamId: string, memberId: string, usage: 'keep' | 'purge' | 'anonymize' = 'keep'): Promise<any> => {
+        const res = await fetch(`${API_URL}/tenants/${tenantId}/teams/${teamId}/members/${memberId}?usage=${usage}`, {
+            method: 'DELETE',
+        });
+        if (!res.ok) {
+            const err = await res.json();
+            throw new Error(err.error || 'Failed to remove member');
+        }
+        return res.json();
+    },
+
+    bulkRemoveTeamMembers: async (tenantId: string, teamId: string, members: { ids?: string[], emails?: string[] }, usage: 'keep' | 'purge' | 'anonymize' = 'keep'): Promise<{ removed: number, members: any[], notFound: string[], job: any }> => {
+        const res = await fetch(`${API_URL}/tenants/${tenantId}/teams/${teamId}/members/bulk-delete`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ ...members, usage }),
+        });
+        if (!res.ok) {
+            const err = await res.json();
+            throw new Error(err.error || 'Failed to remove members');
+        }
+        return res.json();
+    },
+
     getTeamMembers: async (tenantId: string, teamId: string): Promise<any[]> => {
         const res = await fetch(`${API_URL}/tenants/${tenantId}/teams/${teamId}/members`);
         if (!res.ok) throw new Error('Failed to fetch members');
         return res.json();
     },
 
+    // --- Search ---
+    search: async (scope: { tenantId?: string, kind: 'tenants' | 'teams' | 'members', teamId?: string }, q: string, limit = 10, offset = 0): Promise<{ query: string, results: any[] }> => {
+        const base = scope.kind === 'tenants' ? `${API_URL}/tenants/search` : `${API_URL}/tenants/${scope.tenantId}/${scope.kind}/search`;
+        const query = new URLSearchParams({ q, limit: String(limit), offset: String(offset), ...(scope.teamId ? { teamId: scope.teamId } : {}) });
+        const res = await fetch(`${base}?${query}`);
+        if (!res.ok) throw new Error('Search failed');
+        return res.json();
+    },
+
     // --- Usage Stats ---
     getTenantUsage: async (tenantId: string): Promise<{ teamUsage: any[], userUsage: any[] }> => {
         const res = await fetch(`${API_URL}/tenants/${tenantId}/usage`);
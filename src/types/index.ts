@@ -21,6 +21,10 @@ export interface Team {
   teamKey?: string;
   createdAt: string;
   styles?: string;
+  memberCount?: number;
+  lifetimeTokens?: number;
+  lifetimeCost?: number;
+  lastActivityAt?: string | null;
 }
 
 export interface TenantFile {